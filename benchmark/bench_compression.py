@@ -0,0 +1,86 @@
+"""
+Compares the size and throughput of the provenance dump written by
+UploadManager with each compression.
+
+Run from the repository root with
+
+    PYTHONPATH=./src:./benchmark python benchmark/bench_compression.py
+
+The store only measures the objects passed to it, so the times are for
+encoding and compressing the dump.
+Throughput is the size of the uncompressed dump divided by the time to
+write it.
+Each write is timed on a newly built trace, so that records cached by an
+earlier write are not reused.
+"""
+import argparse
+import time
+
+from aquarium.trace.upload import COMPRESSION, UploadManager
+from synthetic import build_experiment
+
+
+class MeasuringStore:
+    """
+    An object store that records the size of each object put to it.
+    """
+
+    def __init__(self):
+        self.sizes = dict()
+
+    def put_object(self, *, Body, Key, **args):
+        size = 0
+        while True:
+            block = Body.read(1024 * 1024)
+            if not block:
+                break
+            size += len(block)
+        self.sizes[Key] = size
+
+
+def run(*, wells, plates, repeat):
+    results = list()
+    raw_size = None
+    for compression in [None] + list(COMPRESSION):
+        best = None
+        for _ in range(repeat):
+            trace = build_experiment(wells=wells, plates=plates)
+            store = MeasuringStore()
+            manager = UploadManager(trace=trace)
+            manager.configure(s3=store, bucket='bucket', basepath='bench',
+                              compression=compression)
+            start = time.perf_counter()
+            manager.upload_provenance()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        size = sum(store.sizes.values())
+        if raw_size is None:
+            raw_size = size
+        results.append({
+            'compression': compression or 'none',
+            'wells': wells,
+            'bytes': size,
+            'ratio': raw_size / size,
+            'seconds': best,
+            'mb_per_second': raw_size / best / 1e6
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--plates', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>6} {:>6} {:>12} {:>7} {:>9} {:>8}".format(
+        'codec', 'wells', 'bytes', 'ratio', 'time (s)', 'MB/s'))
+    for wells in [96, 384]:
+        for result in run(wells=wells, plates=args.plates,
+                          repeat=args.repeat):
+            print("{compression:>6} {wells:>6} {bytes:>12} {ratio:>7.1f} "
+                  "{seconds:>9.3f} {mb_per_second:>8.1f}".format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Measures SHA-256 throughput on synthetic large files with thread and
+process pools of 1, 2, 4 and 8 workers, and the effect of hashing on
+UploadManager transfers.
+
+Run from the repository root with
+
+    PYTHONPATH=./src:./benchmark python benchmark/bench_hashing.py
+
+The pools hash whole files read in chunks, which is the best case for
+processes since only paths are sent to them.
+hashlib releases the GIL for large buffers, so threads should scale with
+the number of cores like processes do; UploadManager hashes on threads
+because it hashes chunks as they are read, and the hash state cannot be
+sent to another process.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from aquarium.provenance import FileEntity, OperationActivity, \
+    ProvenanceTrace
+from aquarium.records import ModelHandle, OperationTypeRecord, UploadRecord
+from aquarium.trace.store import LocalObjectStore
+from aquarium.trace.upload import UploadManager
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+WORKERS = [1, 2, 4, 8]
+
+
+def write_files(directory, *, count, size):
+    paths = list()
+    block = os.urandom(CHUNK_SIZE)
+    for index in range(count):
+        path = os.path.join(directory, "file_{}.fcs".format(index))
+        with open(path, 'wb') as output:
+            remaining = size
+            while remaining > 0:
+                output.write(block[:remaining])
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+
+def hash_file(path):
+    hash_sha = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+            hash_sha.update(chunk)
+    return hash_sha.hexdigest()
+
+
+def time_pool(executor_class, workers, paths):
+    start = time.perf_counter()
+    with executor_class(max_workers=workers) as executor:
+        list(executor.map(hash_file, paths))
+    return time.perf_counter() - start
+
+
+class FileUpload:
+    def __init__(self, path):
+        with open(path, 'rb') as input_file:
+            self.data = input_file.read()
+
+
+class FileInterface:
+    def __init__(self, paths):
+        self.paths = paths
+
+    def find(self, id):
+        return FileUpload(self.paths[id])
+
+
+def build_trace(paths, size):
+    trace = ProvenanceTrace(experiment_id='hashing')
+    operation = OperationActivity(
+        id=1, operation_type=OperationTypeRecord(id=1, name='Measure',
+                                                 category='Cytometry'))
+    trace.add_operation(operation)
+    interface = FileInterface(paths)
+    for index in range(len(paths)):
+        upload = UploadRecord(
+            id=index, name="file_{}.fcs".format(index), size=size,
+            upload_content_type='application/octet-stream',
+            handle=ModelHandle(interface=interface, id=index))
+        file_entity = FileEntity(upload=upload, job=None)
+        file_entity.add_generator(operation)
+        trace.add_file(file_entity)
+    return trace, operation
+
+
+def time_upload(paths, size, hash_workers, root_dir):
+    trace, operation = build_trace(paths, size)
+    manager = UploadManager(trace=trace)
+    manager.configure(s3=LocalObjectStore(root_dir), bucket='bucket',
+                      basepath="workers_{}".format(hash_workers),
+                      hash_workers=hash_workers, hash_threshold=0)
+    start = time.perf_counter()
+    with manager:
+        manager.upload(activity=operation)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--size', type=int, default=256,
+                        help='size of each file in MiB')
+    args = parser.parse_args()
+    size = args.size * 1024 * 1024
+    total = args.files * args.size
+
+    print("{} CPUs, {} files of {} MiB".format(os.cpu_count(), args.files,
+                                               args.size))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_files(directory, count=args.files, size=size)
+        hash_file(paths[0])  # warm the page cache
+
+        print("{:>10} {:>8} {:>9} {:>10}".format(
+            'pool', 'workers', 'time (s)', 'MiB/s'))
+        for name, executor_class in [('thread', ThreadPoolExecutor),
+                                     ('process', ProcessPoolExecutor)]:
+            for workers in WORKERS:
+                seconds = time_pool(executor_class, workers, paths)
+                print("{:>10} {:>8} {:>9.2f} {:>10.0f}".format(
+                    name, workers, seconds, total / seconds))
+
+        print()
+        print("{:>19} {:>9} {:>10}".format(
+            'upload hash workers', 'time (s)', 'MiB/s'))
+        with tempfile.TemporaryDirectory() as root_dir:
+            for hash_workers in [0] + WORKERS:
+                seconds = time_upload(paths, size, hash_workers, root_dir)
+                print("{:>19} {:>9.2f} {:>10.0f}".format(
+                    hash_workers, seconds, total / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Measures repeated JSON dumps of a trace when only some entities change
+between dumps.
+
+Run from the repository root with
+
+    PYTHONPATH=./src:./benchmark python benchmark/bench_redump.py
+
+The first dump builds and encodes every record.
+Later dumps reuse the cached records of entities that have not changed since
+the previous dump, so their cost depends on the fraction changed.
+"""
+import argparse
+import io
+import time
+
+from aquarium.trace import dump
+from synthetic import build_experiment
+
+
+def time_dump(trace):
+    start = time.perf_counter()
+    dump.dump(trace, io.StringIO())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--wells', type=int, default=384)
+    parser.add_argument('--plates', type=int, default=10)
+    args = parser.parse_args()
+
+    trace = build_experiment(wells=args.wells, plates=args.plates)
+    files = list(trace.files.values())
+    print("{:>24} {:>9}".format('dump', 'time (s)'))
+    print("{:>24} {:>9.3f}".format('first', time_dump(trace)))
+    print("{:>24} {:>9.3f}".format('unchanged', time_dump(trace)))
+    for percent in [1, 10, 50, 100]:
+        count = len(files) * percent // 100
+        for file_entity in files[:count]:
+            file_entity.name = "renamed_{}".format(file_entity.name)
+        print("{:>24} {:>9.3f}".format(
+            "{}% of files renamed".format(percent), time_dump(trace)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Measures conversion of a trace to an SBOL document with SBOLVisitor.
+
+Run from the repository root with
+
+    PYTHONPATH=./src:./benchmark python benchmark/bench_sbol.py
+
+This requires pySBOL.
+The default experiment has 26 plates of 384 wells, which gives about 10,000
+items and as many files.
+"""
+import argparse
+import time
+
+from aquarium.trace.sbol import SBOLVisitor
+from synthetic import build_experiment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--wells', type=int, default=384)
+    parser.add_argument('--plates', type=int, default=26)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    trace = build_experiment(wells=args.wells, plates=args.plates)
+    print("{} items, {} operations, {} files".format(
+        len(trace.items), len(trace.operations), len(trace.files)))
+
+    times = list()
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        visitor = SBOLVisitor(namespace='http://example.org/aquarium')
+        trace.apply_all(visitor)
+        times.append(time.perf_counter() - start)
+    print("{:>24} {:>9}".format('conversion', 'time (s)'))
+    print("{:>24} {:>9.3f}".format('best', min(times)))
+    print("{:>24} {:>9.3f}".format('mean', sum(times) / len(times)))
+
+
+if __name__ == '__main__':
+    main()
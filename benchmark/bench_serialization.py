@@ -0,0 +1,95 @@
+"""
+Compares the encodings of the dump of synthetic traces.
+
+Run from the repository root with
+
+    PYTHONPATH=./src:./benchmark python benchmark/bench_serialization.py
+
+Reports the size of each encoding, and the best time over several repeats to
+write it from a trace, to parse it into a dump, and to load a trace from it.
+Each write is timed on a newly built trace, so that records cached by an
+earlier write are not reused.
+"""
+import argparse
+import io
+import json
+import time
+
+from aquarium.trace import binary, dump, normalize
+from aquarium.trace.loader import load_trace
+from synthetic import build_experiment
+
+
+def json_dumps(trace):
+    output = io.StringIO()
+    dump.dump(trace, output)
+    return output.getvalue().encode('utf-8')
+
+
+def normalized_dumps(trace):
+    fields = normalize.normalize_fields(trace.dump_fields())
+    return ''.join(dump.iterencode_fields(fields, compact=True)).encode(
+        'utf-8')
+
+
+# name -> (write, parse, load)
+FORMATS = {
+    'json': (json_dumps, json.loads,
+             lambda data: load_trace(json.loads(data))),
+    'normalized': (normalized_dumps, json.loads,
+                   lambda data: load_trace(json.loads(data))),
+    'binary': (binary.dumps, binary.read_dump, binary.loads)
+}
+
+
+def best_time(function, *, repeat, setup=lambda: None):
+    best = None
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(*, wells, plates, repeat):
+    def build():
+        return build_experiment(wells=wells, plates=plates)
+
+    results = list()
+    for name, (write, parse, load) in FORMATS.items():
+        data = write(build())
+        results.append({
+            'format': name,
+            'wells': wells,
+            'plates': plates,
+            'bytes': len(data),
+            'write_seconds': best_time(write, repeat=repeat, setup=build),
+            'parse_seconds': best_time(parse, repeat=repeat,
+                                       setup=lambda: data),
+            'load_seconds': best_time(load, repeat=repeat,
+                                      setup=lambda: data)
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--plates', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:>10} {:>6} {:>6} {:>10} {:>9} {:>9} {:>9}".format(
+        'format', 'wells', 'plates', 'bytes', 'write (s)', 'parse (s)',
+        'load (s)'))
+    for wells in [96, 384]:
+        for result in run(wells=wells, plates=args.plates,
+                          repeat=args.repeat):
+            print("{format:>10} {wells:>6} {plates:>6} {bytes:>10} "
+                  "{write_seconds:>9.3f} {parse_seconds:>9.3f} "
+                  "{load_seconds:>9.3f}".format(**result))
+
+
+if __name__ == '__main__':
+    main()
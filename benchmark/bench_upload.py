@@ -0,0 +1,312 @@
+"""
+Measures the throughput and memory of UploadManager in each upload mode,
+against a fake object store with latency, a bandwidth cap and failures.
+
+Run from the repository root with
+
+    PYTHONPATH=./src:./benchmark python benchmark/bench_upload.py \
+        --output upload.json
+
+The files of a synthetic experiment are given synthetic contents of the
+chosen size by a fake Aquarium, whose uploads have temporary URLs on a local
+HTTP server, so that they are streamed as from Aquarium (which needs
+requests, installed with pydent).
+The server can also delay each download.
+The fake store discards the objects put to it, after waiting for the
+latency of the request and for its bytes to pass through a link shared by
+all requests.
+A failed request is retried by the store, as boto3 retries S3 requests, so
+failures cost time but an upload fails only when the retries run out.
+
+Peak memory is the largest amount allocated by Python during the upload,
+as measured by tracemalloc, which slows the upload; --no-memory turns it
+off.
+The results are written as JSON with --output, for comparison between
+versions.
+"""
+import argparse
+import dataclasses
+import http.server
+import json
+import os
+import platform
+import random
+import threading
+import time
+import tracemalloc
+
+from aquarium.records import ModelHandle
+from aquarium.trace.store import ObjectNotFound
+from aquarium.trace.upload import MIN_PART_SIZE, UploadManager
+from synthetic import build_experiment
+
+# arguments to UploadManager.configure for each mode, where the chunk size
+# None means chunks as large as the files (at least MIN_PART_SIZE), so each
+# file is put whole, and the serial mode transfers files one at a time on
+# the calling thread
+MODES = {
+    'serial': {'download_workers': 0, 'hash_workers': 0,
+               'chunk_size': None},
+    'concurrent': {'chunk_size': None},
+    'streaming': dict(),
+    'content_addressed': {'content_addressed': True},
+}
+
+
+class SyntheticUpload:
+    def __init__(self, temp_url):
+        self.temp_url = temp_url
+
+
+class SyntheticHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the contents of the upload with the ID in the path, from the
+    SyntheticSource of the server.
+    """
+
+    def do_GET(self):
+        source = self.server.source
+        prefix = int(self.path.strip('/')).to_bytes(8, 'big')
+        time.sleep(source.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(source.size))
+        self.end_headers()
+        self.wfile.write(prefix)
+        self.wfile.write(memoryview(source.block)[len(prefix):])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SyntheticSource:
+    """
+    Stands in for session.Upload, returning uploads with a temporary URL on
+    a local HTTP server, which serves contents of the given size that
+    differ for each upload ID, after waiting for the latency.
+
+    The server runs on a thread while the source is used as a context
+    manager.
+    """
+
+    def __init__(self, *, size, latency=0.0):
+        if size < 8:
+            raise ValueError("size must be at least 8, not {}".format(size))
+        self.size = size
+        self.latency = latency
+        self.block = os.urandom(size)
+        self.__server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), SyntheticHandler)
+        self.__server.source = self
+        self.__thread = None
+
+    def __enter__(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         daemon=True)
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+    def find(self, id):
+        host, port = self.__server.server_address
+        return SyntheticUpload("http://{}:{}/{}".format(host, port, id))
+
+
+class FakeObjectStore:
+    """
+    An object store that discards objects but keeps their keys, with a
+    latency for each request, a bandwidth in bytes per second shared by all
+    requests, and a rate of failed requests.
+
+    A failed request takes its latency, and is retried up to retries times
+    before ConnectionError is raised.
+    """
+
+    def __init__(self, *, latency=0.0, bandwidth=None, failure_rate=0.0,
+                 retries=3, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.retries = retries
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.keys = set()
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__link_free = 0.0  # time the link finishes the current bytes
+
+    def put_object(self, *, Body, Key, **args):
+        self.__request(_get_size(Body))
+        self.keys.add(Key)
+        return dict()
+
+    def head_object(self, *, Bucket, Key):
+        self.__request(0)
+        if Key not in self.keys:
+            raise ObjectNotFound(Key)
+        return {'ContentLength': 0}
+
+    def create_multipart_upload(self, *, Key, **args):
+        self.__request(0)
+        return {'UploadId': Key}
+
+    def upload_part(self, *, Body, PartNumber, **args):
+        self.__request(_get_size(Body))
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, *, Key, **args):
+        self.__request(0)
+        self.keys.add(Key)
+        return {'Key': Key}
+
+    def abort_multipart_upload(self, **args):
+        self.__request(0)
+
+    def __request(self, size):
+        for _ in range(self.retries + 1):
+            with self.__lock:
+                self.requests += 1
+                failed = self.__random.random() < self.failure_rate
+                if failed:
+                    self.failures += 1
+            time.sleep(self.latency)
+            if not failed:
+                break
+        else:
+            raise ConnectionError("Request failed {} times".format(
+                self.retries + 1))
+        if self.bandwidth:
+            with self.__lock:
+                start = max(time.perf_counter(), self.__link_free)
+                self.__link_free = start + size / self.bandwidth
+                done = self.__link_free
+            time.sleep(max(0.0, done - time.perf_counter()))
+        with self.__lock:
+            self.bytes += size
+
+
+def _get_size(body):
+    if hasattr(body, 'read'):
+        size = 0
+        for block in iter(lambda: body.read(1024 * 1024), b''):
+            size += len(block)
+        return size
+    return len(body)
+
+
+def build_trace(*, plates, wells, source):
+    trace = build_experiment(wells=wells, plates=plates)
+    for file_entity in trace.files.values():
+        file_entity.upload = dataclasses.replace(
+            file_entity.upload, size=source.size,
+            handle=ModelHandle(interface=source, id=file_entity.upload.id))
+    return trace
+
+
+def run(mode, args):
+    source = SyntheticSource(size=args.size * 1024,
+                             latency=args.source_latency / 1000)
+    trace = build_trace(plates=args.plates, wells=args.wells, source=source)
+    store = FakeObjectStore(latency=args.latency / 1000,
+                            bandwidth=args.bandwidth * 1e6 or None,
+                            failure_rate=args.failure_rate,
+                            retries=args.retries, seed=args.seed)
+    configure_args = dict(MODES[mode])
+    if 'chunk_size' not in configure_args:
+        configure_args['chunk_size'] = args.chunk_size * 1024
+    elif configure_args['chunk_size'] is None:
+        configure_args['chunk_size'] = max(source.size, MIN_PART_SIZE)
+    manager = UploadManager(trace=trace)
+    manager.configure(s3=store, bucket='bucket', basepath='bench',
+                      **configure_args)
+
+    if args.memory:
+        tracemalloc.start()
+    error = None
+    start = time.perf_counter()
+    try:
+        with source, manager:
+            report = manager.upload_all()
+    except ConnectionError as exception:
+        error = str(exception)
+    seconds = time.perf_counter() - start
+    peak = None
+    if args.memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    files = len(trace.files) if error is None else None
+    file_bytes = report.bytes if error is None else None
+    return {
+        'mode': mode,
+        'files': files,
+        'bytes': file_bytes,
+        'seconds': seconds,
+        'files_per_second': files / seconds if files else None,
+        'mb_per_second': file_bytes / seconds / 1e6 if files else None,
+        'peak_memory': peak,
+        'requests': store.requests,
+        'failed_requests': store.failures,
+        'error': error
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--plates', type=int, default=1)
+    parser.add_argument('--wells', type=int, default=96, choices=[96, 384])
+    parser.add_argument('--size', type=int, default=12 * 1024,
+                        help='size of each file in KiB')
+    parser.add_argument('--chunk-size', type=int,
+                        default=MIN_PART_SIZE // 1024,
+                        help='chunk size of the streaming modes in KiB')
+    parser.add_argument('--source-latency', type=float, default=5.0,
+                        help='latency of each download in ms')
+    parser.add_argument('--latency', type=float, default=20.0,
+                        help='latency of each store request in ms')
+    parser.add_argument('--bandwidth', type=float, default=0.0,
+                        help='bandwidth of the store in MB/s, 0 for none')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES),
+                        default=list(MODES))
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='do not measure peak memory')
+    parser.add_argument('--output', help='file to write the results to')
+    args = parser.parse_args()
+
+    print("{:>18} {:>9} {:>8} {:>8} {:>10} {:>9}".format(
+        'mode', 'time (s)', 'files/s', 'MB/s', 'peak (MB)', 'requests'))
+    results = list()
+    for mode in args.modes:
+        result = run(mode, args)
+        results.append(result)
+        if result['error'] is not None:
+            print("{:>18} {:>9.3f} failed: {}".format(
+                mode, result['seconds'], result['error']))
+            continue
+        peak = result['peak_memory']
+        print("{:>18} {:>9.3f} {:>8.1f} {:>8.1f} {:>10} {:>9}".format(
+            mode, result['seconds'], result['files_per_second'],
+            result['mb_per_second'],
+            '-' if peak is None else "{:.1f}".format(peak / 1e6),
+            result['requests']))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'parameters': vars(args),
+                'results': results
+            }, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Synthetic provenance traces for benchmarks.
+
+An experiment is a plan with one operation per plate that inoculates the
+plate from a stock, and one operation per plate that measures it and
+generates a file for each well.
+"""
+from aquarium.provenance import (
+    CollectionEntity, FileEntity, ItemEntity, JobActivity,
+    OperationActivity, OperationItemPin, PartEntity, PlanActivity,
+    ProvenanceTrace
+)
+from aquarium.records import (
+    JobRecord, ObjectTypeRecord, OperationTypeRecord, SampleRecord,
+    UploadRecord
+)
+
+PLATE_ROWS = {96: 8, 384: 16}
+
+
+def build_experiment(*, wells=96, plates=4, strains=24):
+    """
+    Returns a trace for an experiment with the given number of plates, each
+    with the given number of wells (96 or 384).
+    """
+    rows = PLATE_ROWS[wells]
+    columns = wells // rows
+    trace = ProvenanceTrace(experiment_id="synthetic_{}x{}".format(plates,
+                                                                   wells))
+    trace.add_attribute({'challenge_problem': 'YEAST_STATES'})
+
+    stock_type = ObjectTypeRecord(id=1, name='Yeast Glycerol Stock')
+    plate_type = ObjectTypeRecord(
+        id=2, name="{} Well Flat Bottom (black)".format(wells))
+    inoculate = OperationTypeRecord(id=21, name='Inoculate Plate',
+                                    category='Yeast Display')
+    measure = OperationTypeRecord(id=22, name='Flow Cytometry',
+                                  category='Cytometry')
+    samples = [SampleRecord(id=1000 + index, name="strain {}".format(index))
+               for index in range(strains)]
+
+    next_id = _counter(10000)
+    operations = list()
+    for plate_index in range(plates):
+        inoculate_op = OperationActivity(id=next(next_id),
+                                         operation_type=inoculate)
+        measure_op = OperationActivity(id=next(next_id),
+                                       operation_type=measure)
+        trace.add_operation(inoculate_op)
+        trace.add_operation(measure_op)
+        operations.extend([inoculate_op, measure_op])
+
+        stock = ItemEntity(item_id=str(next(next_id)),
+                           sample=samples[plate_index % strains],
+                           object_type=stock_type)
+        trace.add_item(stock)
+        plate = CollectionEntity(item_id=str(next(next_id)),
+                                 object_type=plate_type)
+        plate.add_generator(inoculate_op)
+        plate.add_source(stock)
+        trace.add_item(plate)
+
+        inoculate_op.add_input(OperationItemPin(
+            name='Stock', field_value_id=next(next_id), item_entity=stock))
+        inoculate_op.add_output(OperationItemPin(
+            name='Plate', field_value_id=next(next_id), item_entity=plate))
+        trace.add_input(stock.item_id, inoculate_op)
+        measure_op.add_input(OperationItemPin(
+            name='Plate', field_value_id=next(next_id), item_entity=plate))
+        trace.add_input(plate.item_id, measure_op)
+
+        for index in range(wells):
+            well = "{}{}".format(chr(ord('A') + index // columns),
+                                 index % columns + 1)
+            part = PartEntity(part_id=str(next(next_id)),
+                              part_ref="{}/{}".format(plate.item_id, well),
+                              sample=samples[index % strains],
+                              object_type=plate_type,
+                              collection=plate)
+            part.add_generator(inoculate_op)
+            part.add_source(stock)
+            part.add_attribute({'media': 'SC',
+                                'volume': '200:microliter',
+                                'od600': "{}:OD".format(index / wells)})
+            trace.add_item(part)
+
+            upload = UploadRecord(
+                id=next(next_id),
+                name="{}_{}.fcs".format(plate.item_id, well),
+                size=500000 + index,
+                upload_content_type='application/octet-stream')
+            file_entity = FileEntity(upload=upload, job=None)
+            file_entity.add_generator(measure_op)
+            file_entity.add_source(part)
+            trace.add_file(file_entity)
+
+    trace.add_plan(PlanActivity(id=next(next_id), name='synthetic plan',
+                                operations=operations, status='done'))
+    trace.add_job(JobActivity(job=JobRecord(id=next(next_id)),
+                              operations=operations,
+                              start_time='2019-01-01T10:00:00',
+                              end_time='2019-01-01T11:00:00',
+                              status='done'))
+    return trace
+
+
+def _counter(start):
+    value = start
+    while True:
+        yield value
+        value += 1
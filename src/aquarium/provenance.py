@@ -10,15 +10,349 @@ entities in Aquarium.
 An Item has a sample and object_type;
 a collection has no sample but has an object_type; and
 a part of a collection has a sample but no object_type.
+
+Entities refer to samples, object types, operation types and uploads using
+the immutable records defined in aquarium.records so that a trace does not
+hold on to pydent model objects.
 """
 import abc
+import hashlib
+import json
 import logging
 import os
+import sys
 from collections import defaultdict
 from enum import Enum, auto
+from types import GeneratorType
+
+
+def fingerprint_record(record):
+    """
+    Returns the SHA-256 digest of the canonical JSON for a dump record.
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(',', ':'),
+                           default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class DumpRecord(dict):
+    """
+    A dump record cached by a provenance object (see
+    FingerprintMixin.get_record).
+
+    The record is shared by every dump of the object until the object
+    changes, and so must not be modified.
+    Encodings of the record, such as the JSON written by aquarium.trace.dump
+    or the record in another layout, are cached in encodings and discarded
+    along with the record.
+    """
+
+    __slots__ = ('encodings',)
+
+    def __init__(self, record):
+        super().__init__(record)
+        self.encodings = dict()
+
+
+class FingerprintMixin:
+    """
+    Defines a mixin for provenance objects that have a cached fingerprint and
+    dump record of their content.
+
+    The content fingerprint is computed from the dump record of the object,
+    which refers to other objects by ID, and is used to compare the object
+    with its record in a dump (see aquarium.trace.diff).
+    The fingerprint also covers the objects the object contains, Merkle
+    style, by hashing their fingerprints with the content fingerprint: the
+    operations of a plan or a job, and the parts of a collection.
+    Links of lineage, such as generators, sources and inputs, are not
+    followed, since an operation may output the item it takes as input, and
+    are covered by the record of the object.
+
+    The cached values are discarded whenever an attribute of the object is
+    set (e.g., a file is renamed) or it is changed by one of its add methods,
+    and the fingerprints of the objects containing it, such as its trace,
+    are discarded along with them.
+    So repeated dumps of a trace only rebuild the records of objects that
+    changed.
+    """
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if self.__dict__.get('_cached'):
+            self._changed()
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(self) is not type(other):
+            return False
+        return self.fingerprint() == other.fingerprint()
+
+    def _changed(self):
+        """
+        Discards the cached fingerprints and dump records of this object,
+        and the fingerprints of the objects containing it.
+        Should be called by methods that modify the content of the object in
+        place.
+        """
+        values = self.__dict__
+        if not values.get('_cached'):
+            return
+        values['_cached'] = False
+        values['_records'] = None
+        values['_content_fingerprint'] = None
+        self._contents_changed()
+
+    def _contents_changed(self):
+        """
+        Discards the fingerprint of this object and of the objects containing
+        it, after an object it contains changed.
+
+        An object with no cached fingerprint is skipped along with the
+        objects containing it, since those are computed from its fingerprint
+        and so were discarded when it was.
+        """
+        pending = [self]
+        while pending:
+            values = pending.pop().__dict__
+            if values.get('_fingerprint') is None:
+                continue
+            values['_fingerprint'] = None
+            pending.extend(values.get('_parents', ()))
+
+    def _add_parent(self, parent):
+        """
+        Records that the parent contains this object, so that a change to
+        this object discards the fingerprint of the parent.
+        """
+        parents = self.__dict__.get('_parents', ())
+        if not any(other is parent for other in parents):
+            self.__dict__['_parents'] = parents + (parent,)
+        parent._contents_changed()
+
+    def get_record(self, **kwargs) -> DumpRecord:
+        """
+        Returns the dump record given by as_dict with the keyword arguments,
+        which is cached until this object changes.
+        The record is shared and must not be modified.
+        """
+        records = self.__dict__.get('_records')
+        if records is None:
+            records = dict()
+            self.__dict__['_records'] = records
+            self.__dict__['_cached'] = True
+        key = tuple(sorted(kwargs.items()))
+        record = records.get(key)
+        if record is None:
+            record = DumpRecord(self.as_dict(**kwargs))
+            records[key] = record
+        return record
+
+    def content_fingerprint(self):
+        """
+        Returns the fingerprint of the record of this object.
+        """
+        fingerprint = self.__dict__.get('_content_fingerprint')
+        if fingerprint is None:
+            fingerprint = fingerprint_record(self._fingerprint_record())
+            self.__dict__['_content_fingerprint'] = fingerprint
+            self.__dict__['_cached'] = True
+        return fingerprint
+
+    def fingerprint(self):
+        """
+        Returns the fingerprint for the content of this object and the
+        objects it contains.
+        """
+        fingerprint = self.__dict__.get('_fingerprint')
+        if fingerprint is None:
+            fingerprint = self.content_fingerprint()
+            children = sorted(child.fingerprint()
+                              for child in self._fingerprint_children())
+            if children:
+                merkle_hash = hashlib.sha256(fingerprint.encode('utf-8'))
+                for child in children:
+                    merkle_hash.update(child.encode('utf-8'))
+                fingerprint = merkle_hash.hexdigest()
+            self.__dict__['_fingerprint'] = fingerprint
+            self.__dict__['_cached'] = True
+        return fingerprint
+
+    def _fingerprint_record(self):
+        """
+        Returns the record from which the content fingerprint is computed.
+        """
+        return self.get_record()
+
+    def _fingerprint_children(self):
+        """
+        Returns the objects contained by this object, whose fingerprints are
+        included in its fingerprint.
+        """
+        return ()
 
 
-class AttributesMixin(abc.ABC):
+def _copy_value(value):
+    """
+    Returns a copy of a JSON-like value, with plain dictionaries and lists in
+    place of those in the value, such as cached records.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_value(elem) for key, elem in value.items()}
+    if isinstance(value, list):
+        return [_copy_value(elem) for elem in value]
+    return value
+
+
+class SharedAttributes(dict):
+    """
+    An attribute dictionary shared through an AttributeStore, which must not
+    be modified.
+    The store counts the objects that hold the dictionary in owners.
+    """
+
+    __slots__ = ('owners',)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.owners = 0
+
+
+class AttributeStore:
+    """
+    Interns attribute values and attribute dictionaries so that objects with
+    equal attributes share a single copy.
+
+    Dictionaries returned by the store are shared, and are replaced rather
+    than modified when an attribute is added (copy-on-write).
+    Each dictionary is kept while an object holds it, so that dictionaries
+    replaced on every object that held them are discarded, and the values
+    used only by discarded dictionaries are discarded from time to time.
+    """
+
+    def __init__(self):
+        self.__values = dict()  # frozen value -> value
+        self.__dicts = dict()   # frozen items -> dictionary
+        self.__empty = SharedAttributes()
+        self.__released = 0     # dictionaries discarded since values were
+
+    def __len__(self):
+        """
+        Returns the number of attribute dictionaries held by objects.
+        """
+        return len(self.__dicts)
+
+    def value_count(self) -> int:
+        return len(self.__values)
+
+    def empty(self):
+        """
+        Returns the shared empty attribute dictionary.
+        """
+        return self.__empty
+
+    def extend(self, attributes, update):
+        """
+        Returns the shared dictionary containing the key-value pairs of
+        attributes with those of update added, and counts the caller as an
+        owner of it (see release).
+        Neither argument is modified, and attributes need not come from the
+        store.
+        If a value cannot be interned (see _freeze), the dictionary returned
+        is not shared.
+        """
+        merged = dict(attributes)
+        merged.update(update)
+        frozen_items = _freeze_items(merged)
+        if frozen_items is None:
+            return SharedAttributes(merged)
+
+        shared = self.__dicts.get(frozen_items)
+        if shared is None:
+            shared = SharedAttributes()
+            for (key, value), frozen in zip(merged.items(),
+                                            frozen_items[1::2]):
+                if isinstance(key, str):
+                    key = sys.intern(key)
+                shared[key] = self.__values.setdefault(frozen, value)
+            self.__dicts[frozen_items] = shared
+        shared.owners += 1
+        return shared
+
+    def release(self, attributes):
+        """
+        Discards an owner of the dictionary returned by extend, and discards
+        the dictionary when it has no owners.
+        """
+        if not isinstance(attributes, SharedAttributes) or \
+                attributes is self.__empty:
+            return
+        attributes.owners -= 1
+        if attributes.owners > 0:
+            return
+        frozen_items = _freeze_items(attributes)
+        if self.__dicts.get(frozen_items) is attributes:
+            del self.__dicts[frozen_items]
+            self.__released += 1
+            # amortized over the dictionaries discarded
+            if self.__released > len(self.__dicts):
+                self.__discard_values()
+
+    def __discard_values(self):
+        """
+        Discards the values not in any dictionary held by an object.
+        """
+        used = set()
+        for frozen_items in self.__dicts:
+            used.update(frozen_items[1::2])
+        self.__values = {frozen: value
+                         for frozen, value in self.__values.items()
+                         if frozen in used}
+        self.__released = 0
+
+
+def _freeze_items(attributes):
+    """
+    Returns a hashable key for the items of the attribute dictionary in
+    order, alternating keys and frozen values, or None if a value cannot be
+    frozen.
+    """
+    frozen_items = list()
+    for key, value in attributes.items():
+        frozen = _freeze(value)
+        if frozen is None:
+            return None
+        frozen_items.append(key)
+        frozen_items.append(frozen)
+    return tuple(frozen_items)
+
+
+def _freeze(value):
+    """
+    Returns a hashable key for a JSON-like value, or None if the value has a
+    type that is not handled.
+    The type is included so that values like 1 and True are kept distinct,
+    except for strings, which are their own key.
+    """
+    if isinstance(value, str):
+        return value
+    if value is None or isinstance(value, (int, float, bool)):
+        return (type(value), value)
+    if isinstance(value, list):
+        elements = tuple(_freeze(elem) for elem in value)
+        if None in elements:
+            return None
+        return (list, elements)
+    if isinstance(value, dict):
+        entries = tuple((key, _freeze(elem)) for key, elem in value.items())
+        if any(frozen is None for _, frozen in entries):
+            return None
+        return (dict, entries)
+    return None
+
+
+class AttributesMixin(FingerprintMixin, abc.ABC):
     """
     Defines an abstract class to serve as a mixin for classes with objects that
     carry attributes.
@@ -33,22 +367,71 @@ class AttributesMixin(abc.ABC):
         """
         Initialize empty attribute dictionary for this object.
         """
-        self.attributes = dict()
+        store = self._attribute_store()
+        if store is None:
+            self.attributes = dict()
+        else:
+            self.attributes = store.empty()
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, AttributesMixin):
-            return False
-        return self.attributes == other.attributes
+    def __getattr__(self, name):
+        """
+        Adds the deferred attributes of this object when its attribute
+        dictionary is first read (see defer_attributes).
+        Only called for names that are not set on the object.
+        """
+        values = self.__dict__
+        if name != 'attributes' or '_deferred_attributes' not in values:
+            raise AttributeError(name)
+        deferred = values.pop('_deferred_attributes')
+        store = self._attribute_store()
+        values['attributes'] = dict() if store is None else store.empty()
+        self.add_attribute(deferred)
+        return values['attributes']
+
+    def defer_attributes(self, attribute):
+        """
+        Defers adding the key-value pairs in the given dictionary until the
+        attributes of this object are first read, so that objects whose
+        attributes are never read skip the work of add_attribute, such as
+        interning the values of parts.
+        The dictionary must not be modified before then.
+        """
+        values = self.__dict__
+        if '_deferred_attributes' in values or values.get('attributes'):
+            self.add_attribute(attribute)
+            return
+        values.pop('attributes', None)
+        values['_deferred_attributes'] = attribute
+        self._changed()
 
     def add_attribute(self, attribute):
         """
         Adds all key-value pairs in the given dictionary to the attributes
         dictionary of this class.
+
+        If the object has an attribute store, the attribute dictionary is
+        shared and is replaced by the store rather than modified.
+        """
+        update = {key: value for key, value in attribute.items() if value}
+        if not update:
+            return
+
+        store = self._attribute_store()
+        if store is None:
+            self.attributes.update(update)
+            self._changed()
+        else:
+            attributes = self.attributes
+            self.attributes = store.extend(attributes, update)
+            store.release(attributes)
+
+    def _attribute_store(self):
+        """
+        Returns the AttributeStore used for the attributes of this object, or
+        None if the object keeps its own attribute dictionary.
         """
-        for key, value in attribute.items():
-            if value:
-                self.attributes[key] = value
+        return None
 
     def get_attribute(self, key):
         if key in self.attributes:
@@ -64,7 +447,7 @@ class AttributesMixin(abc.ABC):
         return attr_dict
 
 
-class AbstractEntity(abc.ABC):
+class AbstractEntity(FingerprintMixin, abc.ABC):
     """
     Defines an abstract class with the properties of an entity from the
     perspective of provenance.
@@ -77,17 +460,12 @@ class AbstractEntity(abc.ABC):
         self.sources = set()
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, AbstractEntity):
-            return False
-        return (self.generator == other.generator
-                and self.sources == other.sources)
-
     def add_generator(self, activity):
         self.generator = activity
 
     def add_source(self, entity):
         self.sources.add(entity)
+        self._changed()
 
     def get_source_ids(self):
         return [item_entity.item_id for item_entity in self.sources]
@@ -117,7 +495,8 @@ class AbstractEntity(abc.ABC):
             else:  # is operation
                 generator_dict['operation_id'] = self.generator.operation_id
             entity_dict['generated_by'] = generator_dict
-        source_ids = self.get_source_ids()
+        # sources are a set, so sort to give records a stable order
+        source_ids = sorted(self.get_source_ids())
         if source_ids:
             entity_dict['sources'] = source_ids
         return entity_dict
@@ -138,13 +517,6 @@ class AbstractItemEntity(AbstractEntity, AttributesMixin):
         self.item_type = item_type
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, AbstractItemEntity):
-            return False
-        return (self.item_id == other.item_id
-                and AbstractEntity.__eq__(self, other)
-                and AttributesMixin.__eq__(self, other))
-
     def __hash__(self):
         return hash(self.item_id)
 
@@ -193,14 +565,16 @@ class ItemEntity(AbstractItemEntity):
 
     def as_dict(self):
         item_dict = super().as_dict()
-        sample_dict = dict()
-        sample_dict['sample_id'] = str(self.sample.id)
-        sample_dict['sample_name'] = self.sample.name
-        item_dict['sample'] = sample_dict
-        type_dict = dict()
-        type_dict['object_type_id'] = str(self.object_type.id)
-        type_dict['object_type_name'] = self.object_type.name
-        item_dict['object_type'] = type_dict
+        if self.sample:
+            sample_dict = dict()
+            sample_dict['sample_id'] = str(self.sample.id)
+            sample_dict['sample_name'] = self.sample.name
+            item_dict['sample'] = sample_dict
+        if self.object_type:
+            type_dict = dict()
+            type_dict['object_type_id'] = str(self.object_type.id)
+            type_dict['object_type_name'] = self.object_type.name
+            item_dict['object_type'] = type_dict
         return item_dict
 
     def get_sample(self):
@@ -218,10 +592,12 @@ class CollectionEntity(AbstractItemEntity):
     def __init__(self, *, item_id, object_type):
         self.object_type = object_type
         self.part_map = dict()
+        self.part_attributes = AttributeStore()  # shared by parts
         super().__init__(item_id=item_id, item_type='collection')
 
     def add_part(self, part):
         self.part_map[part.well] = part
+        part._add_parent(self)
 
     def parts(self):
         return list(self.part_map.values())
@@ -238,15 +614,19 @@ class CollectionEntity(AbstractItemEntity):
 
     def as_dict(self):
         item_dict = super().as_dict()
-        type_dict = dict()
-        type_dict['object_type_id'] = str(self.object_type.id)
-        type_dict['object_type_name'] = self.object_type.name
-        item_dict['object_type'] = type_dict
+        if self.object_type:
+            type_dict = dict()
+            type_dict['object_type_id'] = str(self.object_type.id)
+            type_dict['object_type_name'] = self.object_type.name
+            item_dict['object_type'] = type_dict
         return item_dict
 
     def is_collection(self):
         return True
 
+    def _fingerprint_children(self):
+        return self.part_map.values()
+
 
 class PartEntity(AbstractItemEntity):
     """
@@ -268,6 +648,13 @@ class PartEntity(AbstractItemEntity):
     def well(self):
         return self.ref.split('/')[1]
 
+    def _attribute_store(self):
+        """
+        Parts share attribute values through the store of their collection,
+        since the same values tend to be repeated across a plate.
+        """
+        return self.collection.part_attributes
+
     def get_sample(self):
         return self.sample
 
@@ -319,15 +706,6 @@ class AbstractFileEntity(AbstractEntity):
         self.check_sum = None
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, AbstractFileEntity):
-            return False
-        if not super().__eq__(other):
-            return False
-        return (self.name == other.name
-                and self.id == other.id
-                and self.check_sum == other.check_sum)
-
     def __hash__(self):
         return hash(self.id)
 
@@ -364,6 +742,18 @@ class AbstractFileEntity(AbstractEntity):
                       self.id)
         super().add_source(entity)
 
+    def _fingerprint_record(self):
+        """
+        Returns the dump record of this file without the file ID, which is
+        assigned by a counter and so differs each time a trace is built.
+        """
+        path = None
+        if self.generator:
+            path = self.generator.get_activity_id()
+        file_dict = dict(self.get_record(path=path))
+        del file_dict['id']
+        return file_dict
+
     def apply(self, visitor):
         visitor.visit_file(self)
 
@@ -386,16 +776,6 @@ class FileEntity(AbstractFileEntity):
         self.upload = upload
         super().__init__(name=upload.name)
 
-    def __eq__(self, other):
-        if not isinstance(other, FileEntity):
-            return False
-        if not super().__eq__(other):
-            return False
-        return (self.upload_id == other.upload_id
-                and self.size == other.size
-                and self.job == other.job
-                and self.upload == other.upload)
-
     def as_dict(self, *, path=None):
         file_dict = super().as_dict(path=path)
         file_dict['upload_id'] = self.upload_id
@@ -412,11 +792,6 @@ class ExternalFileEntity(AbstractFileEntity):
     def __init__(self, *, name):
         super().__init__(name=name)
 
-    def __eq__(self, other):
-        if not isinstance(other, ExternalFileEntity):
-            return False
-        return super().__eq__(other)
-
     def is_external(self):
         return True
 
@@ -429,11 +804,6 @@ class MissingEntity(AbstractEntity):
     def __init__(self):
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, MissingEntity):
-            return False
-        return super().__eq__(other)
-
     def is_missing(self):
         return True
 
@@ -520,7 +890,7 @@ class OperationItemPin(OperationPin):
         return arg_dict
 
 
-class JobActivity:
+class JobActivity(FingerprintMixin):
     def __init__(self, *, job, operations, start_time, end_time, status):
         self.job_id = str(job.id)
         self.operations = operations
@@ -529,15 +899,7 @@ class JobActivity:
         self.status = status
         for operation in self.operations:
             operation.job = self
-
-    def __eq__(self, other):
-        if not isinstance(other, JobActivity):
-            return False
-        return (self.job_id == other.job_id
-                and self.operations == other.operations
-                and self.start_time == other.start_time
-                and self.end_time == other.end_time
-                and self.status == other.status)
+            operation._add_parent(self)
 
     def is_job(self):
         return True
@@ -562,6 +924,9 @@ class JobActivity:
         job_dict['status'] = self.status
         return job_dict
 
+    def _fingerprint_children(self):
+        return self.operations
+
 
 class OperationActivity(AttributesMixin):
 
@@ -578,27 +943,16 @@ class OperationActivity(AttributesMixin):
         self.outputs = defaultdict(list)
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, OperationActivity):
-            return False
-        if not super().__eq__(other):
-            return False
-        return (self.type == other.type
-                and self.operation_id == other.operation_id
-                and self.operation_type == other.operation_type
-                and self.start_time == other.start_time
-                and self.end_time == other.end_time
-                and self.inputs == other.inputs
-                and self.outputs == other.outputs)
-
     def apply(self, visitor):
         visitor.visit_operation(self)
 
     def add_input(self, input: OperationPin):
         self.inputs[input.name].append(input)
+        self._changed()
 
     def add_output(self, output: OperationPin):
         self.outputs[output.name].append(output)
+        self._changed()
 
     def has_input(self, item_entity: ItemEntity):
         for _, args in self.inputs.items():
@@ -636,14 +990,16 @@ class OperationActivity(AttributesMixin):
     def as_dict(self):
         op_dict = dict()
         op_dict['operation_id'] = self.operation_id
-        op_type = dict()
-        op_type['operation_type_id'] = str(self.operation_type.id)
-        op_type['category'] = self.operation_type.category
-        op_type['name'] = self.operation_type.name
-        op_dict['operation_type'] = op_type
+        if self.operation_type:
+            op_type = dict()
+            op_type['operation_type_id'] = str(self.operation_type.id)
+            op_type['category'] = self.operation_type.category
+            op_type['name'] = self.operation_type.name
+            op_dict['operation_type'] = op_type
         op_dict['inputs'] = [arg.as_dict() for arg in self.get_inputs()]
         op_dict['outputs'] = [arg.as_dict() for arg in self.get_outputs()]
-        op_dict['plan_id'] = self.plan.id
+        if self.plan:
+            op_dict['plan_id'] = self.plan.id
         op_dict['start_time'] = self.start_time
         op_dict['end_time'] = self.end_time
         attr_dict = AttributesMixin.as_dict(self)
@@ -667,19 +1023,13 @@ class PlanActivity(AttributesMixin):
         self.__status = status
         for operation in self.__operations:
             operation.plan = self
+            operation._add_parent(self)
         super().__init__()
 
     @property
     def id(self):
         return self.__id
 
-    def __eq__(self, other):
-        if not isinstance(other, PlanActivity):
-            return False
-        return (self.__id == other.__id
-                and self.__name == other.__name
-                and self.__operations == other.__operations)
-
     def apply(self, visitor):
         visitor.visit_plan(self)
 
@@ -691,6 +1041,9 @@ class PlanActivity(AttributesMixin):
         plan_dict['status'] = self.__status
         return plan_dict
 
+    def _fingerprint_children(self):
+        return self.__operations
+
 
 class ProvenanceTrace(AttributesMixin):
 
@@ -704,19 +1057,6 @@ class ProvenanceTrace(AttributesMixin):
         self.__plans = dict()
         super().__init__()
 
-    def __eq__(self, other):
-        if not isinstance(other, ProvenanceTrace):
-            return False
-        if not super().__eq__(other):
-            return False
-        return (self.__files == other.files
-                and self.__input_list == other.__input_list
-                and self.__items == other.items
-                and self.__jobs == other.jobs
-                and self.__operations == other.operations
-                and self.__plans == other.plans
-                )
-
     @property
     def files(self):
         return self.__files
@@ -740,26 +1080,32 @@ class ProvenanceTrace(AttributesMixin):
     def add_file(self, file_entity):
         logging.debug("Adding file %s to trace", file_entity.id)
         self.__files[file_entity.id] = file_entity
+        file_entity._add_parent(self)
 
     def add_input(self, item_id, op_activity):
         self.__input_list[item_id].append(op_activity)
+        self._changed()
 
     def add_item(self, item_entity):
         logging.debug("Adding %s %s to trace",
                       item_entity.item_type, item_entity.item_id)
         self.__items[item_entity.item_id] = item_entity
+        item_entity._add_parent(self)
 
     def add_job(self, job):
         logging.debug("Adding job %s to trace", job.job_id)
         self.__jobs[job.job_id] = job
+        job._add_parent(self)
 
     def add_operation(self, operation: OperationActivity):
         logging.debug("Adding operation %s to trace", operation.operation_id)
         self.__operations[operation.operation_id] = operation
+        operation._add_parent(self)
 
     def add_plan(self, plan: PlanActivity):
         logging.debug("Adding plan %s to trace", plan.id)
         self.__plans[plan.id] = plan
+        plan._add_parent(self)
 
     def has_file(self, id):
         return bool(id) and str(id) in self.__files
@@ -882,6 +1228,57 @@ class ProvenanceTrace(AttributesMixin):
     def apply(self, visitor):
         visitor.visit_trace(self)
 
+    def fingerprint(self):
+        """
+        Returns the fingerprint of this trace.
+
+        The fingerprint combines the fingerprints of the operations, plans,
+        jobs, items and files of the trace, along with the experiment ID,
+        inputs and attributes, and is computed over the same content as the
+        dump given by as_dict.
+        The value is cached until the trace or one of its objects changes.
+        """
+        cached = self.__dict__.get('_fingerprint')
+        if cached is not None:
+            return cached
+
+        header = dict()
+        header['experiment_id'] = self.__experiment_id
+        header['inputs'] = sorted(item.item_id for item in self.get_inputs())
+        header['attributes'] = self.attributes
+        trace_hash = hashlib.sha256()
+        trace_hash.update(fingerprint_record(header).encode('utf-8'))
+        for kind, fingerprints in self.fingerprints().items():
+            trace_hash.update(kind.encode('utf-8'))
+            for fingerprint in sorted(fingerprints.values()):
+                trace_hash.update(fingerprint.encode('utf-8'))
+        fingerprint = trace_hash.hexdigest()
+
+        self.__dict__['_fingerprint'] = fingerprint
+        self.__dict__['_cached'] = True
+        return fingerprint
+
+    def fingerprints(self):
+        """
+        Returns a dictionary mapping each kind of provenance object in the
+        dump to a dictionary from ID to fingerprint for the objects of the
+        kind.
+        As with as_dict, files without a generator are omitted.
+        """
+        return {
+            'operations': {key: op.fingerprint()
+                           for key, op in self.__operations.items()},
+            'plans': {key: plan.fingerprint()
+                      for key, plan in self.__plans.items()},
+            'jobs': {key: job.fingerprint()
+                     for key, job in self.__jobs.items()},
+            'items': {key: item.fingerprint()
+                      for key, item in self.__items.items()},
+            'files': {key: file.fingerprint()
+                      for key, file in self.__files.items()
+                      if file.generator}
+        }
+
     def apply_all(self, visitor):
         visitor.visit_trace(self)
         for _, plan in self.__plans.items():
@@ -894,21 +1291,46 @@ class ProvenanceTrace(AttributesMixin):
             file.apply(visitor)
 
     def as_dict(self):
+        """
+        Returns the dump of this trace as a dictionary.
+
+        The records in the dictionary are copies of the cached records (see
+        get_record), so the dictionary can be modified without changing the
+        trace or later dumps.
+        """
         trace_dict = dict()
-        trace_dict['experiment_id'] = self.__experiment_id
-        trace_dict['inputs'] = [
-            item.item_id for item in self.get_inputs()]
-        trace_dict['operations'] = [op.as_dict()
-                                    for _, op in self.__operations.items()]
-        trace_dict['plans'] = [plan.as_dict()
-                               for _, plan in self.__plans.items()]
-        trace_dict['jobs'] = [job.as_dict() for _, job in self.__jobs.items()]
-        trace_dict['items'] = [item.as_dict()
-                               for _, item in self.__items.items()]
-        trace_dict['files'] = [
-            file.as_dict(path=file.generator.get_activity_id())
+        for key, value in self.dump_fields():
+            if isinstance(value, GeneratorType):
+                value = list(value)
+            trace_dict[key] = _copy_value(value)
+        return trace_dict
+
+    def dump_fields(self):
+        """
+        Returns the list of key-value pairs of the dump of this trace in the
+        order they occur in the dump.
+
+        The values for the lists of records are generators so that the dump
+        can be written incrementally (see aquarium.trace.dump).
+        The records are the cached records of the objects (see get_record),
+        and must not be modified.
+        """
+        fields = list()
+        fields.append(('experiment_id', self.__experiment_id))
+        fields.append(('inputs', [
+            item.item_id for item in self.get_inputs()]))
+        fields.append(('operations', (
+            op.get_record() for _, op in self.__operations.items())))
+        fields.append(('plans', (
+            plan.get_record() for _, plan in self.__plans.items())))
+        fields.append(('jobs', (
+            job.get_record() for _, job in self.__jobs.items())))
+        fields.append(('items', (
+            item.get_record() for _, item in self.__items.items())))
+        fields.append(('files', (
+            file.get_record(path=file.generator.get_activity_id())
             for _, file in self.__files.items()
             if file.generator
-        ]
-        super_dict = super().as_dict()
-        return {**trace_dict, **super_dict}
+        )))
+        fields.extend(super().as_dict().items())
+        return fields
@@ -0,0 +1,203 @@
+"""
+Immutable records for the Aquarium objects referenced by provenance entities.
+
+Entities hold these records rather than pydent model objects so that a trace
+does not keep the session and its whole loaded object graph alive.
+Each record has the fields of the model object used by the provenance classes,
+and an optional ModelHandle that re-fetches the model object from Aquarium
+when more is needed (e.g., the contents of an upload).
+"""
+import logging
+from dataclasses import dataclass, field
+
+# seconds to wait to connect to Aquarium, and between bytes of a download,
+# before the download fails
+DOWNLOAD_TIMEOUT = (10, 60)
+
+
+class ModelHandle:
+    """
+    A lazy reference to a pydent model object by ID.
+
+    Holds the query interface of the session (e.g., session.Upload) and the
+    ID, but not the model object itself.
+    The interface refers to the session, so a handle keeps the session alive
+    until it is released.
+    """
+
+    def __init__(self, *, interface, id):
+        self.__interface = interface
+        self.__id = id
+
+    def fetch(self):
+        """
+        Returns the model object for this handle, or None if it is not found
+        or the handle is released.
+        """
+        if self.__interface is None:
+            return None
+        return self.__interface.find(self.__id)
+
+    def release(self):
+        """
+        Drops the interface of this handle, so that it no longer keeps the
+        session alive.
+        """
+        self.__interface = None
+
+    def is_released(self):
+        return self.__interface is None
+
+
+class RecordMixin:
+    """
+    Defines fetch for records with a handle field.
+    """
+
+    def fetch(self):
+        """
+        Re-fetches the model object for this record.
+        Returns None if the record has no handle.
+        """
+        if self.handle is None:
+            return None
+        return self.handle.fetch()
+
+
+@dataclass(frozen=True)
+class SampleRecord(RecordMixin):
+    id: int
+    name: str
+    handle: ModelHandle = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class ObjectTypeRecord(RecordMixin):
+    id: int
+    name: str
+    handle: ModelHandle = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class OperationTypeRecord(RecordMixin):
+    id: int
+    name: str
+    category: str
+    handle: ModelHandle = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class JobRecord(RecordMixin):
+    id: int
+    handle: ModelHandle = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class UploadRecord(RecordMixin):
+    id: int
+    name: str
+    size: int
+    upload_content_type: str
+    handle: ModelHandle = field(default=None, compare=False, repr=False)
+
+    @property
+    def data(self):
+        """
+        Returns the contents of the upload, fetching it from Aquarium.
+
+        Raises LookupError if the upload cannot be fetched.
+        """
+        upload = self.fetch()
+        if upload is None:
+            raise LookupError("Unable to fetch upload {}".format(self.id))
+        return upload.data
+
+    def iter_data(self, *, chunk_size, timeout=DOWNLOAD_TIMEOUT):
+        """
+        Returns an iterator over the contents of the upload in chunks of at
+        most chunk_size bytes, fetching it from Aquarium.
+
+        If the upload has a temporary URL, the contents are streamed from it,
+        so that the whole upload is not held in memory, and a stalled
+        download raises an exception after the timeout (see requests).
+        Otherwise, the chunks are slices of the data of the upload, which is
+        read whole, so memory is not bounded by chunk_size.
+        Errors of the download are raised as OSError, of which the
+        exceptions of requests are subclasses.
+
+        Raises LookupError if the upload cannot be fetched.
+        """
+        upload = self.fetch()
+        if upload is None:
+            raise LookupError("Unable to fetch upload {}".format(self.id))
+        url = getattr(upload, 'temp_url', None)
+        if url is None:
+            logging.warning("Upload %s has no URL to stream from, reading "
+                            "it whole", self.id)
+            data = upload.data
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+            return
+
+        import requests  # installed with pydent
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
+
+
+def _get_handle(interface, id):
+    if interface is None:
+        return None
+    return ModelHandle(interface=interface, id=id)
+
+
+def sample_record(sample, *, interface=None) -> SampleRecord:
+    """
+    Returns a SampleRecord for the pydent Sample.
+    Returns the argument if it is None or already a record.
+    """
+    if sample is None or isinstance(sample, SampleRecord):
+        return sample
+    return SampleRecord(id=sample.id, name=sample.name,
+                        handle=_get_handle(interface, sample.id))
+
+
+def object_type_record(object_type, *, interface=None) -> ObjectTypeRecord:
+    """
+    Returns an ObjectTypeRecord for the pydent ObjectType.
+    Returns the argument if it is None or already a record.
+    """
+    if object_type is None or isinstance(object_type, ObjectTypeRecord):
+        return object_type
+    return ObjectTypeRecord(id=object_type.id, name=object_type.name,
+                            handle=_get_handle(interface, object_type.id))
+
+
+def operation_type_record(operation_type, *,
+                          interface=None) -> OperationTypeRecord:
+    """
+    Returns an OperationTypeRecord for the pydent OperationType.
+    Returns the argument if it is None or already a record.
+    """
+    if (operation_type is None
+            or isinstance(operation_type, OperationTypeRecord)):
+        return operation_type
+    return OperationTypeRecord(
+        id=operation_type.id,
+        name=operation_type.name,
+        category=operation_type.category,
+        handle=_get_handle(interface, operation_type.id))
+
+
+def upload_record(upload, *, interface=None) -> UploadRecord:
+    """
+    Returns an UploadRecord for the pydent Upload.
+    Returns the argument if it is None or already a record.
+    """
+    if upload is None or isinstance(upload, UploadRecord):
+        return upload
+    return UploadRecord(id=upload.id,
+                        name=upload.name,
+                        size=upload.size,
+                        upload_content_type=upload.upload_content_type,
+                        handle=_get_handle(interface, upload.id))
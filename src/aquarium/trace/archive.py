@@ -0,0 +1,293 @@
+"""
+An indexed archive of a trace dump that can be read through mmap.
+
+The archive holds each record of the dump (see ProvenanceTrace.as_dict) as
+compact JSON, along with an index sorted by kind and ID, so that a single
+record can be read with a binary search of the index without parsing the
+rest of the archive.
+
+The archive consists of
+
+- a header with the magic bytes b'AQPA', a version byte, the number of index
+  entries, and the offsets of the index and the key table,
+- the records,
+- the index, which has one fixed-size entry per record with the kind, the
+  offset and length of the ID in the key table, and the offset and length of
+  the record, and
+- the key table, which holds the IDs as UTF-8 strings.
+
+Operations, plans, jobs and items are indexed by their IDs, and files by
+file ID.
+Files from Aquarium are also indexed by upload ID under the 'uploads' kind.
+"""
+import json
+import mmap
+import struct
+from collections import deque
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+from aquarium.provenance import ProvenanceTrace
+
+MAGIC = b'AQPA'
+VERSION = 1
+
+# magic, version, padding, index entries, index offset, key table offset
+_header = struct.Struct('<4sB3xQQQ')
+# kind, key length, key offset, record offset, record length
+_entry = struct.Struct('<B3xIQQQ')
+
+KINDS = ['header', 'operations', 'plans', 'jobs', 'items', 'files', 'uploads']
+
+ID_KEYS = {
+    'operations': 'operation_id',
+    'plans': 'plan_id',
+    'jobs': 'job_id',
+    'items': 'item_id',
+    'files': 'id'
+}
+
+
+def write_archive(trace: Union[ProvenanceTrace, dict], fp: BinaryIO):
+    """
+    Writes the archive for the trace or trace dump to the binary file object.
+
+    Records are written one at a time, so only the index is held in memory.
+    """
+    if isinstance(trace, ProvenanceTrace):
+        fields = trace.dump_fields()
+    else:
+        fields = trace.items()
+
+    entries = list()  # (kind index, key, record offset, record length)
+    offset = _header.size
+    fp.write(bytes(_header.size))  # written once the offsets are known
+
+    header = dict()
+    for key, value in fields:
+        if key not in ID_KEYS:
+            header[key] = value
+            continue
+        for record in value:
+            data = _encode(record)
+            fp.write(data)
+            record_keys = [(key, record[ID_KEYS[key]])]
+            if key == 'files' and 'upload_id' in record:
+                record_keys.append(('uploads', record['upload_id']))
+            for kind, record_id in record_keys:
+                entries.append((KINDS.index(kind), str(record_id).encode(),
+                                offset, len(data)))
+            offset += len(data)
+
+    data = _encode(header)
+    fp.write(data)
+    entries.append((KINDS.index('header'), b'', offset, len(data)))
+    offset += len(data)
+
+    entries.sort()
+    index_offset = offset
+    key_offset = 0
+    for kind, key, record_offset, record_length in entries:
+        fp.write(_entry.pack(kind, len(key), key_offset,
+                             record_offset, record_length))
+        key_offset += len(key)
+    keys_offset = index_offset + len(entries) * _entry.size
+    for entry in entries:
+        fp.write(entry[1])
+
+    fp.seek(0)
+    fp.write(_header.pack(MAGIC, VERSION, len(entries),
+                          index_offset, keys_offset))
+    fp.seek(0, 2)
+
+
+class TraceArchive:
+    """
+    Reads records from a trace archive file through mmap.
+
+    Opening the archive only reads the header, and each lookup is a binary
+    search of the index, so looking up a record takes time logarithmic in the
+    number of records.
+    Records are returned as dictionaries in the form given by as_dict.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as archive_file:
+            self.__map = mmap.mmap(archive_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        magic, version, count, index_offset, keys_offset = \
+            _header.unpack_from(self.__map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a trace archive".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError(
+                "Unsupported trace archive version {}".format(version))
+        self.__count = count
+        self.__index_offset = index_offset
+        self.__keys_offset = keys_offset
+
+    def close(self):
+        self.__map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """
+        Returns the number of index entries in the archive.
+        """
+        return self.__count
+
+    def get(self, kind, id) -> Optional[dict]:
+        """
+        Returns the record of the kind with the ID, or None if there is none.
+
+        Args:
+            kind: one of the names in KINDS
+            id: the ID of the record, which is compared as a string
+        """
+        position = self.__find(KINDS.index(kind), str(id).encode())
+        if position is None:
+            return None
+        return self.__read_record(position)
+
+    def get_header(self) -> dict:
+        """
+        Returns the experiment ID, inputs and attributes of the trace.
+        """
+        return self.get('header', '')
+
+    def get_operation(self, operation_id) -> Optional[dict]:
+        return self.get('operations', operation_id)
+
+    def get_plan(self, plan_id) -> Optional[dict]:
+        return self.get('plans', plan_id)
+
+    def get_job(self, job_id) -> Optional[dict]:
+        return self.get('jobs', job_id)
+
+    def get_item(self, item_id) -> Optional[dict]:
+        return self.get('items', item_id)
+
+    def get_file(self, file_id) -> Optional[dict]:
+        return self.get('files', file_id)
+
+    def get_upload(self, upload_id) -> Optional[dict]:
+        return self.get('uploads', upload_id)
+
+    def get_generator(self, record) -> Optional[Tuple[str, dict]]:
+        """
+        Returns the kind and record of the activity that generated the item
+        or file record, or None if there is none.
+        """
+        generator = record.get('generated_by')
+        if not generator:
+            return None
+        if 'job_id' in generator:
+            kind, activity_id = 'jobs', generator['job_id']
+        else:
+            kind, activity_id = 'operations', generator['operation_id']
+        activity = self.get(kind, activity_id)
+        if activity is None:
+            return None
+        return kind, activity
+
+    def get_sources(self, record) -> Iterator[dict]:
+        """
+        Returns an iterator over the item records for the sources of the item
+        or file record.
+        """
+        for source_id in record.get('sources', []):
+            source = self.get_item(source_id)
+            if source is not None:
+                yield source
+
+    def walk_lineage(self, kind, id) -> Iterator[Tuple[str, dict]]:
+        """
+        Returns an iterator over the kind and record of the object with the
+        ID, and of each object it derives from, in breadth-first order.
+
+        The lineage of an item or file includes its generator, sources and
+        collection, the lineage of an operation includes its input items, and
+        the lineage of a job includes its operations.
+        Each record is read from the archive as it is reached.
+        """
+        record = self.get(kind, id)
+        if record is None:
+            return
+        visited = {(kind, str(id))}
+        queue = deque([(kind, record)])
+        while queue:
+            kind, record = queue.popleft()
+            yield kind, record
+            for next_kind, next_id in TraceArchive.__get_parents(kind,
+                                                                 record):
+                if (next_kind, next_id) in visited:
+                    continue
+                visited.add((next_kind, next_id))
+                next_record = self.get(next_kind, next_id)
+                if next_record is not None:
+                    queue.append((next_kind, next_record))
+
+    @staticmethod
+    def __get_parents(kind, record):
+        parents = list()
+        if kind in ['items', 'files', 'uploads']:
+            generator = record.get('generated_by')
+            if generator and 'job_id' in generator:
+                parents.append(('jobs', generator['job_id']))
+            elif generator:
+                parents.append(('operations', generator['operation_id']))
+            for source_id in record.get('sources', []):
+                parents.append(('items', source_id))
+            if 'part_of' in record:
+                parents.append(('items', record['part_of']))
+        elif kind == 'operations':
+            for arg in record.get('inputs', []):
+                if 'item_id' in arg:
+                    parents.append(('items', arg['item_id']))
+        elif kind == 'jobs':
+            for operation_id in record.get('operations', []):
+                parents.append(('operations', operation_id))
+        return [(parent_kind, str(parent_id))
+                for parent_kind, parent_id in parents]
+
+    def __find(self, kind, key):
+        """
+        Returns the position of the index entry for the kind and key, or None
+        if there is none.
+        """
+        low = 0
+        high = self.__count
+        target = (kind, key)
+        while low < high:
+            middle = (low + high) // 2
+            position = self.__index_offset + middle * _entry.size
+            entry_key = self.__read_key(position)
+            if entry_key < target:
+                low = middle + 1
+            elif entry_key > target:
+                high = middle
+            else:
+                return position
+        return None
+
+    def __read_key(self, position):
+        kind, key_length, key_offset, _, _ = \
+            _entry.unpack_from(self.__map, position)
+        start = self.__keys_offset + key_offset
+        return kind, self.__map[start:start + key_length]
+
+    def __read_record(self, position):
+        _, _, _, record_offset, record_length = \
+            _entry.unpack_from(self.__map, position)
+        return json.loads(
+            self.__map[record_offset:record_offset + record_length])
+
+
+def _encode(record):
+    return json.dumps(record, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,494 @@
+"""
+A compact binary encoding of a ProvenanceTrace.
+
+The encoding consists of
+
+- the magic bytes b'AQPT' and a version byte,
+- a string table: the number of strings followed by each string as a
+  length-prefixed UTF-8 sequence,
+- a shape table: the number of shapes followed by each shape as the number
+  of keys and the string index of each key,
+- a constant table: the number of constants followed by each constant as a
+  tagged value, and
+- a sequence of records, each a kind byte followed by a length-prefixed
+  payload.
+
+Record payloads hold the dump records of the trace (see
+ProvenanceTrace.as_dict) as tagged values.
+Strings are stored once in the string table and referenced by index, and
+decimal ID strings (e.g., item IDs) are stored as integers.
+A dictionary is stored as the index of the shape with its keys followed by
+its values.
+Dictionaries nested in records that only hold scalar values, such as the
+sample of a part, are stored once in the constant table and referenced by
+index.
+The generators and sources of items and files are stored as separate typed
+edge records rather than in the entity records.
+
+All integers, lengths and indexes are unsigned LEB128 varints, with signed
+integer values zigzag encoded.
+"""
+import struct
+from typing import BinaryIO
+
+from aquarium.provenance import ProvenanceTrace
+from aquarium.trace.loader import load_trace
+
+MAGIC = b'AQPT'
+VERSION = 1
+
+# record kinds
+HEADER = 0
+OPERATION = 1
+PLAN = 2
+JOB = 3
+ITEM = 4
+FILE = 5
+EDGE = 6
+
+RECORD_KINDS = {
+    'operations': OPERATION,
+    'plans': PLAN,
+    'jobs': JOB,
+    'items': ITEM,
+    'files': FILE
+}
+
+# identifying keys for the entities that are the source of edges
+ENTITY_ID_KEYS = {
+    ITEM: 'item_id',
+    FILE: 'id'
+}
+
+# edge types
+GENERATED_BY_OPERATION = 0
+GENERATED_BY_JOB = 1
+DERIVED_FROM = 2
+
+# value tags, where tags from INT are followed by a varint
+NONE = 0
+FALSE = 1
+TRUE = 2
+FLOAT = 3
+INT = 4
+STRING = 5
+ID = 6
+LIST = 7
+DICT = 8
+CONSTANT = 9
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+_double = struct.Struct('<d')
+
+
+class BinaryFormatError(Exception):
+    """
+    Raised when reading data that is not a valid binary trace.
+    """
+
+
+class TraceWriter:
+    """
+    Encodes the records of a trace.
+
+    Records are encoded to a buffer while the tables are collected, and the
+    tables and buffer are written by write.
+    """
+
+    def __init__(self):
+        self.__strings = dict()  # string -> index
+        self.__shapes = dict()  # tuple of keys -> index
+        self.__constants = dict()  # (shape, typed values) -> index
+        self.__constant_buffer = bytearray()
+        self.__buffer = bytearray()
+
+    def add_trace(self, trace: ProvenanceTrace):
+        header = dict()
+        for key, value in trace.dump_fields():
+            if key in RECORD_KINDS:
+                for record in value:
+                    self.add_record(RECORD_KINDS[key], record)
+            elif key != 'inputs':  # inputs are computed from the trace
+                header[key] = value
+        self.__add(HEADER, header)
+
+    def add_record(self, kind, record: dict):
+        """
+        Adds the dump record of the given kind.
+        Generators and sources of items and files are added as edge records.
+        """
+        if kind not in ENTITY_ID_KEYS:
+            self.__add(kind, record)
+            return
+
+        entity_id = record[ENTITY_ID_KEYS[kind]]
+        entity_record = {key: value for key, value in record.items()
+                         if key not in ['generated_by', 'sources']}
+        self.__add(kind, entity_record)
+
+        generator = record.get('generated_by')
+        if generator:
+            if 'job_id' in generator:
+                self.__add_edge(GENERATED_BY_JOB, kind, entity_id,
+                                generator['job_id'])
+            else:
+                self.__add_edge(GENERATED_BY_OPERATION, kind, entity_id,
+                                generator['operation_id'])
+        for source_id in record.get('sources', []):
+            self.__add_edge(DERIVED_FROM, kind, entity_id, source_id)
+
+    def write(self, fp: BinaryIO):
+        """
+        Writes the encoding to the binary file object.
+        """
+        output = bytearray(MAGIC)
+        output.append(VERSION)
+        _write_varint(output, len(self.__strings))
+        for string in self.__strings:
+            encoded = string.encode('utf-8')
+            _write_varint(output, len(encoded))
+            output += encoded
+        _write_varint(output, len(self.__shapes))
+        for shape in self.__shapes:
+            _write_varint(output, len(shape))
+            for key in shape:
+                _write_varint(output, self.__strings[key])
+        _write_varint(output, len(self.__constants))
+        output += self.__constant_buffer
+        fp.write(output)
+        fp.write(self.__buffer)
+
+    def __add_edge(self, edge_type, kind, entity_id, target_id):
+        payload = bytearray()
+        payload.append(edge_type)
+        payload.append(kind)
+        self.__write_value(payload, entity_id)
+        self.__write_value(payload, target_id)
+        self.__add_payload(EDGE, payload)
+
+    def __add(self, kind, record):
+        payload = bytearray()
+        self.__write_dict(payload, record)
+        self.__add_payload(kind, payload)
+
+    def __add_payload(self, kind, payload):
+        self.__buffer.append(kind)
+        _write_varint(self.__buffer, len(payload))
+        self.__buffer += payload
+
+    def __write_value(self, output, value):
+        if isinstance(value, str):
+            if _is_id(value):
+                output.append(ID)
+                _write_varint(output, int(value))
+            else:
+                output.append(STRING)
+                _write_varint(output, self.__get_index(value))
+        elif value is None:
+            output.append(NONE)
+        elif value is True:
+            output.append(TRUE)
+        elif value is False:
+            output.append(FALSE)
+        elif isinstance(value, int):
+            output.append(INT)
+            _write_varint(output, _zigzag(value))
+        elif isinstance(value, float):
+            output.append(FLOAT)
+            output += _double.pack(value)
+        elif isinstance(value, dict):
+            if all(isinstance(element, SCALAR_TYPES)
+                   for element in value.values()):
+                output.append(CONSTANT)
+                _write_varint(output, self.__get_constant(value))
+            else:
+                self.__write_dict(output, value)
+        elif isinstance(value, (list, tuple)):
+            output.append(LIST)
+            _write_varint(output, len(value))
+            for element in value:
+                self.__write_value(output, element)
+        else:
+            raise TypeError("Cannot encode value of type {}".format(
+                type(value).__name__))
+
+    def __write_dict(self, output, value):
+        output.append(DICT)
+        _write_varint(output, self.__get_shape(value))
+        for element in value.values():
+            self.__write_value(output, element)
+
+    def __get_constant(self, value):
+        key = (self.__get_shape(value),
+               tuple((type(element), element) for element in value.values()))
+        index = self.__constants.get(key)
+        if index is None:
+            index = len(self.__constants)
+            self.__constants[key] = index
+            self.__write_dict(self.__constant_buffer, value)
+        return index
+
+    def __get_shape(self, value):
+        shape = tuple(str(key) for key in value)
+        index = self.__shapes.get(shape)
+        if index is None:
+            for key in shape:
+                self.__get_index(key)
+            index = len(self.__shapes)
+            self.__shapes[shape] = index
+        return index
+
+    def __get_index(self, string):
+        index = self.__strings.get(string)
+        if index is None:
+            index = len(self.__strings)
+            self.__strings[string] = index
+        return index
+
+
+class TraceReader:
+    """
+    Decodes the binary encoding of a trace into a trace dump.
+    """
+
+    def __init__(self, data: bytes):
+        self.__data = bytes(data)
+        self.__strings = list()
+        self.__shapes = list()
+        self.__constants = list()
+
+    def read_dump(self) -> dict:
+        """
+        Returns the trace dump, in the form given by ProvenanceTrace.as_dict,
+        for the encoding.
+        The inputs of the trace are not stored, so are not included.
+        """
+        position = self.__read_tables()
+        dump = {key: list() for key in RECORD_KINDS}
+        kind_keys = {kind: key for key, kind in RECORD_KINDS.items()}
+        entities = {ITEM: dict(), FILE: dict()}
+        header = dict()
+        data = self.__data
+        tables = (self.__strings, self.__shapes, self.__constants)
+        end = len(data)
+        while position < end:
+            kind = data[position]
+            length, position = _read_varint(data, position + 1)
+            record_end = position + length
+            if kind == EDGE:
+                edge_type = data[position]
+                entity_kind = data[position + 1]
+                entity_id, position = _read_value(data, position + 2, tables)
+                target_id, position = _read_value(data, position, tables)
+                TraceReader.__add_edge(
+                    entities, edge_type, entity_kind, entity_id, target_id)
+            else:
+                value, position = _read_value(data, position, tables)
+                if kind == HEADER:
+                    header = value
+                elif kind in kind_keys:
+                    dump[kind_keys[kind]].append(value)
+                    if kind in entities:
+                        entities[kind][value[ENTITY_ID_KEYS[kind]]] = value
+                else:
+                    raise BinaryFormatError(
+                        "Unknown record kind {}".format(kind))
+            if position != record_end:
+                raise BinaryFormatError("Record length mismatch")
+
+        return {**header, **dump}
+
+    @staticmethod
+    def __add_edge(entities, edge_type, kind, entity_id, target_id):
+        record = entities.get(kind, dict()).get(entity_id)
+        if record is None:
+            raise BinaryFormatError(
+                "Edge for unknown entity {}".format(entity_id))
+        if edge_type == GENERATED_BY_JOB:
+            record['generated_by'] = {'job_id': target_id}
+        elif edge_type == GENERATED_BY_OPERATION:
+            record['generated_by'] = {'operation_id': target_id}
+        elif edge_type == DERIVED_FROM:
+            record.setdefault('sources', list()).append(target_id)
+        else:
+            raise BinaryFormatError(
+                "Unknown edge type {}".format(edge_type))
+
+    def __read_tables(self):
+        """
+        Reads the string, shape and constant tables, and returns the position
+        of the first record.
+        """
+        data = self.__data
+        if data[:len(MAGIC)] != MAGIC:
+            raise BinaryFormatError("Not a binary trace")
+        position = len(MAGIC)
+        if data[position] != VERSION:
+            raise BinaryFormatError(
+                "Unsupported binary trace version {}".format(data[position]))
+
+        count, position = _read_varint(data, position + 1)
+        for _ in range(count):
+            length, position = _read_varint(data, position)
+            self.__strings.append(
+                data[position:position + length].decode('utf-8'))
+            position += length
+
+        count, position = _read_varint(data, position)
+        for _ in range(count):
+            length, position = _read_varint(data, position)
+            shape = list()
+            for _ in range(length):
+                index, position = _read_varint(data, position)
+                shape.append(self.__strings[index])
+            self.__shapes.append(tuple(shape))
+
+        tables = (self.__strings, self.__shapes, self.__constants)
+        count, position = _read_varint(data, position)
+        for _ in range(count):
+            value, position = _read_value(data, position, tables)
+            self.__constants.append(value)
+        return position
+
+
+def dump(trace: ProvenanceTrace, fp: BinaryIO):
+    """
+    Writes the binary encoding of the trace to the binary file object.
+    """
+    writer = TraceWriter()
+    writer.add_trace(trace)
+    writer.write(fp)
+
+
+def dumps(trace: ProvenanceTrace) -> bytes:
+    """
+    Returns the binary encoding of the trace.
+    """
+    writer = TraceWriter()
+    writer.add_trace(trace)
+    output = _BytesOutput()
+    writer.write(output)
+    return bytes(output.data)
+
+
+def read_dump(data: bytes) -> dict:
+    """
+    Returns the trace dump for the binary encoding.
+    """
+    return TraceReader(data).read_dump()
+
+
+def load(fp: BinaryIO) -> ProvenanceTrace:
+    """
+    Returns the ProvenanceTrace for the binary encoding in the file object.
+    """
+    return loads(fp.read())
+
+
+def loads(data: bytes) -> ProvenanceTrace:
+    """
+    Returns the ProvenanceTrace for the binary encoding.
+    """
+    return load_trace(read_dump(data))
+
+
+class _BytesOutput:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+
+def _is_id(value: str):
+    """
+    Indicates whether the string is a decimal integer that is preserved by
+    conversion to and from int.
+    """
+    return (value.isdigit() and value.isascii()
+            and (value == '0' or value[0] != '0'))
+
+
+def _zigzag(value):
+    if value >= 0:
+        return value << 1
+    return ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    if value & 1:
+        return -((value + 1) >> 1)
+    return value >> 1
+
+
+def _write_varint(output, value):
+    while value >= 0x80:
+        output.append((value & 0x7f) | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def _read_varint(data, position):
+    """
+    Returns the varint at the position and the position following it.
+    """
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    value = byte & 0x7f
+    shift = 7
+    while True:
+        position += 1
+        byte = data[position]
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position + 1
+        shift += 7
+
+
+def _read_value(data, position, tables):
+    """
+    Returns the tagged value at the position and the position following it.
+    """
+    tag = data[position]
+    if tag < INT:
+        if tag == NONE:
+            return None, position + 1
+        if tag == TRUE:
+            return True, position + 1
+        if tag == FALSE:
+            return False, position + 1
+        (value,) = _double.unpack_from(data, position + 1)
+        return value, position + 1 + _double.size
+
+    # most varints following a tag are a single byte
+    index = data[position + 1]
+    if index < 0x80:
+        position += 2
+    else:
+        index, position = _read_varint(data, position + 1)
+
+    strings, shapes, constants = tables
+    if tag == STRING:
+        return strings[index], position
+    if tag == ID:
+        return str(index), position
+    if tag == CONSTANT:
+        return constants[index].copy(), position
+    if tag == DICT:
+        shape = shapes[index]
+        values = list()
+        for _ in shape:
+            value, position = _read_value(data, position, tables)
+            values.append(value)
+        return dict(zip(shape, values)), position
+    if tag == LIST:
+        values = list()
+        for _ in range(index):
+            value, position = _read_value(data, position, tables)
+            values.append(value)
+        return values, position
+    if tag == INT:
+        return _unzigzag(index), position
+    raise BinaryFormatError("Unknown value tag {}".format(tag))
@@ -0,0 +1,78 @@
+"""
+Content-addressed storage for files uploaded by UploadManager.
+
+In the content-addressed mode, each file is stored once as a blob with a key
+given by its SHA-256 checksum, and the upload manifest of each activity
+refers to the blobs of its files instead of holding copies of them.
+
+A BlobIndex records the checksums of blobs known to be in the object store,
+so that they are neither checked nor put again.
+"""
+import logging
+import os
+import threading
+
+# prefix of the blob keys in the bucket
+BLOB_PATH = 'blobs'
+
+
+def get_blob_path(check_sum, *, blob_path=BLOB_PATH) -> str:
+    """
+    Returns the directory of the blob with the checksum, which is named by
+    the first two digits of the checksum to keep directories small.
+    """
+    return os.path.join(blob_path, check_sum[:2])
+
+
+def get_blob_key(check_sum, *, blob_path=BLOB_PATH) -> str:
+    return os.path.join(get_blob_path(check_sum, blob_path=blob_path),
+                        check_sum)
+
+
+def is_not_found(error) -> bool:
+    """
+    Indicates whether the error raised by head_object is for a missing
+    object, which botocore reports as a ClientError with a 404 code.
+    """
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    code = response.get('Error', {}).get('Code')
+    return code in ['404', 'NoSuchKey', 'NotFound']
+
+
+class BlobIndex:
+    """
+    The set of checksums of blobs known to be in the object store.
+
+    If a path is given, the checksums are read from the file at the path if
+    it exists, and each checksum added is appended to it, so that the index
+    persists across runs.
+    The index is safe to use from several threads.
+    """
+
+    def __init__(self, path=None):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__check_sums = set()
+        if path and os.path.exists(path):
+            with open(path, 'r') as index_file:
+                self.__check_sums.update(
+                    line.strip() for line in index_file if line.strip())
+            logging.debug("Read %s blob checksums from %s",
+                          len(self.__check_sums), path)
+
+    def __contains__(self, check_sum):
+        return check_sum in self.__check_sums
+
+    def __len__(self):
+        return len(self.__check_sums)
+
+    def add(self, check_sum):
+        with self.__lock:
+            if check_sum in self.__check_sums:
+                return
+            self.__check_sums.add(check_sum)
+            if self.__path:
+                with open(self.__path, 'a') as index_file:
+                    index_file.write(check_sum + '\n')
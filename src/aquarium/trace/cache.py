@@ -0,0 +1,313 @@
+"""
+An on-disk cache of the contents of Aquarium uploads, so that exporting an
+experiment again does not download its files from Aquarium again.
+
+Each upload is stored in the cache directory as a file named by the upload
+ID, with a metadata file that records its size and SHA-256 checksum.
+The cache holds at most max_bytes of contents, and evicts the least recently
+used uploads to stay within it.
+The order of use is kept in the modification times of the files, so that it
+persists across runs.
+
+A cached upload is used only if the size of its file is the size recorded,
+and its checksum is the expected checksum where the caller knows it.
+The contents are checked against the recorded checksum as they are read.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from aquarium.records import UploadRecord
+
+# default size in bytes of the contents held by the cache
+MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+# size of the chunks read from cached files
+READ_SIZE = 8 * 1024 * 1024
+
+DATA_SUFFIX = '.data'
+META_SUFFIX = '.meta'
+
+
+class CacheError(Exception):
+    """
+    Raised when the contents of a cached upload do not match its recorded
+    checksum.
+    The upload is removed from the cache before the error is raised.
+    """
+
+
+@dataclass
+class CacheStats:
+    """
+    The numbers of reads from the cache and from Aquarium, and of the bytes
+    read from each, since the cache was opened.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_read: int = 0
+    bytes_fetched: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        reads = self.hits + self.misses
+        if reads == 0:
+            return 0.0
+        return self.hits / reads
+
+
+class UploadCache:
+    """
+    The cache of upload contents in the directory, holding at most max_bytes.
+
+    Uploads larger than max_bytes are read from Aquarium without being
+    cached.
+    The cache is safe to use from several threads, and from several
+    processes in that the data and metadata of entries are written to
+    temporary files and renamed into place.
+    The size of the cache is tracked by each process, though, so processes
+    sharing a directory may together hold more than max_bytes until the
+    cache is next opened.
+    """
+
+    def __init__(self, directory, *, max_bytes=MAX_BYTES):
+        if max_bytes < 0:
+            raise ValueError(
+                "max_bytes must not be negative, not {}".format(max_bytes))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()  # upload ID -> size, oldest first
+        self.__size = 0
+        self.__stats = CacheStats()
+        os.makedirs(directory, exist_ok=True)
+        self.__load()
+
+    @property
+    def size(self) -> int:
+        """
+        The number of bytes of contents in the cache.
+        """
+        return self.__size
+
+    @property
+    def stats(self) -> CacheStats:
+        """
+        A copy of the statistics of the cache.
+        """
+        with self.__lock:
+            return CacheStats(**vars(self.__stats))
+
+    def __contains__(self, upload_id):
+        return str(upload_id) in self.__entries
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_data(self, upload: UploadRecord, *, sha256=None) -> bytes:
+        """
+        Returns the contents of the upload, reading it from the cache if
+        present, and otherwise fetching it from Aquarium and adding it.
+        """
+        return b''.join(self.iter_data(upload, sha256=sha256))
+
+    def iter_data(self, upload: UploadRecord, *, chunk_size=READ_SIZE,
+                  sha256=None):
+        """
+        Returns an iterator over the contents of the upload in chunks of at
+        most chunk_size bytes, as UploadRecord.iter_data.
+
+        The contents are read from the cache if the upload is present, and
+        have the size recorded and the checksum sha256 if given.
+        Otherwise, they are fetched from Aquarium and written to the cache as
+        they are read, and the upload is added once all have been read.
+
+        Raises CacheError if the cached contents do not match the recorded
+        checksum, which is only known once all chunks have been read.
+        """
+        upload_id = str(upload.id)
+        meta = self.__get_meta(upload_id, sha256=sha256)
+        if meta is None:
+            return self.__fetch(upload, upload_id, chunk_size=chunk_size)
+        return self.__read(upload_id, meta, chunk_size=chunk_size)
+
+    def remove(self, upload_id):
+        """
+        Removes the upload from the cache if present.
+        """
+        upload_id = str(upload_id)
+        with self.__lock:
+            size = self.__entries.pop(upload_id, None)
+            if size is not None:
+                self.__size -= size
+        self.__remove_files(upload_id)
+
+    def clear(self):
+        for upload_id in list(self.__entries):
+            self.remove(upload_id)
+
+    def __get_meta(self, upload_id, *, sha256):
+        """
+        Returns the metadata of the upload if it is cached and valid, and
+        removes it from the cache if it is cached but invalid.
+        """
+        if upload_id not in self.__entries:
+            return None
+        try:
+            with open(self.__meta_path(upload_id), 'r') as meta_file:
+                meta = json.load(meta_file)
+            file_size = os.stat(self.__data_path(upload_id)).st_size
+        except (OSError, ValueError):
+            # removed by another process, or partly written
+            logging.debug("Cache entry for upload %s is missing", upload_id)
+            self.remove(upload_id)
+            return None
+        if file_size != meta['size'] or \
+                (sha256 is not None and sha256 != meta['sha256']):
+            logging.warning("Cache entry for upload %s is invalid", upload_id)
+            self.remove(upload_id)
+            return None
+        return meta
+
+    def __read(self, upload_id, meta, *, chunk_size):
+        with self.__lock:
+            self.__stats.hits += 1
+            if upload_id in self.__entries:
+                self.__entries.move_to_end(upload_id)
+        data_path = self.__data_path(upload_id)
+        logging.debug("Reading upload %s from cache", upload_id)
+        os.utime(data_path)
+        hash_sha = hashlib.sha256()
+        with open(data_path, 'rb') as data_file:
+            for chunk in iter(lambda: data_file.read(chunk_size), b''):
+                hash_sha.update(chunk)
+                with self.__lock:
+                    self.__stats.bytes_read += len(chunk)
+                yield chunk
+        if hash_sha.hexdigest() != meta['sha256']:
+            self.remove(upload_id)
+            raise CacheError(
+                "Cached upload {} does not match its checksum".format(
+                    upload_id))
+
+    def __fetch(self, upload: UploadRecord, upload_id, *, chunk_size):
+        with self.__lock:
+            self.__stats.misses += 1
+        logging.debug("Fetching upload %s for cache", upload_id)
+        chunks = upload.iter_data(chunk_size=chunk_size)
+        if upload.size is not None and upload.size > self.max_bytes:
+            for chunk in chunks:
+                with self.__lock:
+                    self.__stats.bytes_fetched += len(chunk)
+                yield chunk
+            return
+
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.directory, prefix=".{}.".format(upload_id))
+        try:
+            hash_sha = hashlib.sha256()
+            size = 0
+            with open(fd, 'wb') as data_file:
+                for chunk in chunks:
+                    data_file.write(chunk)
+                    hash_sha.update(chunk)
+                    size += len(chunk)
+                    with self.__lock:
+                        self.__stats.bytes_fetched += len(chunk)
+                    yield chunk
+            if size > self.max_bytes:
+                os.unlink(temp_path)
+                return
+            self.__add(upload_id, temp_path,
+                       {'size': size, 'sha256': hash_sha.hexdigest()})
+        except BaseException:
+            # includes GeneratorExit if the caller stops reading
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def __add(self, upload_id, temp_path, meta):
+        """
+        Moves the file at the temporary path into the cache as the contents
+        of the upload, and evicts uploads to keep the cache within max_bytes.
+
+        The metadata is also written to a temporary file, and is moved into
+        place after the contents, so that a reader or a crash never sees
+        partly written metadata.
+        A reader that sees the old metadata with the new contents rejects
+        the entry by its size or checksum.
+        """
+        os.replace(temp_path, self.__data_path(upload_id))
+        fd, meta_temp_path = tempfile.mkstemp(
+            dir=self.directory, prefix=".{}.".format(upload_id))
+        try:
+            with open(fd, 'w') as meta_file:
+                json.dump(meta, meta_file)
+            os.replace(meta_temp_path, self.__meta_path(upload_id))
+        except BaseException:
+            os.unlink(meta_temp_path)
+            raise
+        with self.__lock:
+            self.__size -= self.__entries.pop(upload_id, 0)
+            self.__entries[upload_id] = meta['size']
+            self.__size += meta['size']
+        self.__evict()
+
+    def __evict(self):
+        """
+        Removes the least recently used uploads until the cache is within
+        max_bytes.
+        """
+        evicted = list()
+        with self.__lock:
+            while self.__size > self.max_bytes:
+                evicted_id, evicted_size = self.__entries.popitem(last=False)
+                self.__size -= evicted_size
+                self.__stats.evictions += 1
+                evicted.append(evicted_id)
+        for evicted_id in evicted:
+            logging.debug("Evicting upload %s from cache", evicted_id)
+            self.__remove_files(evicted_id)
+
+    def __load(self):
+        """
+        Reads the entries in the cache directory, ordered by the time they
+        were last used.
+        """
+        entries = list()
+        for name in os.listdir(self.directory):
+            if name.startswith('.') or not name.endswith(DATA_SUFFIX):
+                continue
+            upload_id = name[:-len(DATA_SUFFIX)]
+            if not os.path.exists(self.__meta_path(upload_id)):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, upload_id, stat.st_size))
+        for _, upload_id, size in sorted(entries):
+            self.__entries[upload_id] = size
+            self.__size += size
+        logging.debug("Read %s cached uploads from %s",
+                      len(self.__entries), self.directory)
+        self.__evict()
+
+    def __remove_files(self, upload_id):
+        for path in [self.__data_path(upload_id),
+                     self.__meta_path(upload_id)]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def __data_path(self, upload_id):
+        return os.path.join(self.directory, upload_id + DATA_SUFFIX)
+
+    def __meta_path(self, upload_id):
+        return os.path.join(self.directory, upload_id + META_SUFFIX)
@@ -0,0 +1,311 @@
+"""
+An object store client for UploadManager that retries failed requests.
+
+RetryingClient has the methods of the S3 client used by UploadManager, and
+makes each request with a client for the calling thread, retrying requests
+that fail with a transient error after an exponential backoff with jitter.
+It records the number of requests and retries, and the latency of each kind
+of request.
+
+Clients are made per thread by a factory, such as the one returned by
+make_s3_factory, which gives each thread a boto3 session of its own, since
+sessions cannot be shared between threads.
+A client that is safe to share, such as a LocalObjectStore, can be given
+instead.
+"""
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict
+
+# number of times a request is retried before its error is raised
+RETRIES = 5
+
+# delay in seconds before the first retry, which doubles for each retry up
+# to MAX_DELAY
+BASE_DELAY = 0.1
+MAX_DELAY = 10.0
+
+# size of the connection pool of each S3 client made by make_s3_factory,
+# where a client is used by one thread, which makes one request at a time
+POOL_CONNECTIONS = 1
+
+# error codes of S3 responses for requests that may succeed if retried
+RETRYABLE_CODES = {
+    'InternalError', 'RequestTimeout', 'RequestTimeoutException',
+    'ServiceUnavailable', 'SlowDown', 'Throttling', 'ThrottlingException'
+}
+
+
+def is_retryable(error) -> bool:
+    """
+    Indicates whether the error raised by a request is transient, so that
+    the request may succeed if retried.
+
+    Connection errors and timeouts are transient, as are S3 responses with
+    a server error or throttling status, or one of RETRYABLE_CODES.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        if get_error_code(error) in RETRYABLE_CODES:
+            return True
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return status is not None and (status >= 500 or status == 429)
+    try:
+        from botocore.exceptions import (ConnectionError as
+                                         BotoConnectionError, HTTPClientError)
+    except ImportError:
+        return False
+    return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+
+def get_error_code(error):
+    """
+    Returns the error code of the S3 response of the error, or None if the
+    error has no response.
+    """
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return None
+    return response.get('Error', {}).get('Code')
+
+
+def make_s3_factory(*, pool_connections=POOL_CONNECTIONS, **client_args):
+    """
+    Returns a function that makes an S3 client with a connection pool of
+    the given size, from a new boto3 session.
+
+    The clients are meant for RetryingClient, which makes one for each
+    thread, so a pool of one connection is enough.
+    A client shared by several threads needs a pool as large as the number
+    of threads, such as the numbers of workers of UploadManager.
+
+    The retries of botocore are turned off, so that requests are retried by
+    RetryingClient alone.
+    The remaining arguments are passed to the client, such as region_name or
+    endpoint_url.
+    """
+    import boto3
+    from botocore.config import Config
+
+    config = Config(max_pool_connections=pool_connections,
+                    retries={'total_max_attempts': 1})
+
+    def make_client():
+        return boto3.session.Session().client('s3', config=config,
+                                              **client_args)
+
+    return make_client
+
+
+@dataclass
+class LatencyStats:
+    """
+    The number of requests of a kind, and their total and largest latency in
+    seconds.
+    """
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+@dataclass
+class ClientStats:
+    """
+    The number of requests made including retries, the number retried, the
+    number that failed after any retries, and the latency of each attempt by
+    method name.
+    """
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    latencies: Dict[str, LatencyStats] = field(default_factory=dict)
+
+
+class RetryingClient:
+    """
+    An object store client that makes requests with a client for each thread
+    from the factory, or with the given client, and retries requests that
+    fail with a transient error (see is_retryable).
+
+    Retry n waits for a random time up to base_delay * 2 ** n seconds,
+    bounded by max_delay.
+    A request with a body that is a file object is retried only if the body
+    is seekable, and the body is read again from where it started.
+
+    Completing a multipart upload is not idempotent, since the upload no
+    longer exists once completed.
+    So if a retry to complete an upload finds no upload, an earlier attempt
+    is taken to have completed it after its response was lost.
+    """
+
+    def __init__(self, factory=None, *, client=None, retries=RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 sleep=time.sleep):
+        if (factory is None) == (client is None):
+            raise ValueError("Exactly one of factory and client is required")
+        if retries < 0:
+            raise ValueError(
+                "retries must not be negative, not {}".format(retries))
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.__factory = factory
+        self.__client = client
+        self.__sleep = sleep
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__clients = 0
+        self.__stats = ClientStats()
+
+    @property
+    def clients(self) -> int:
+        """
+        The number of clients made by the factory.
+        """
+        return self.__clients
+
+    @property
+    def stats(self) -> ClientStats:
+        """
+        A copy of the statistics of the requests made.
+        """
+        with self.__lock:
+            return ClientStats(
+                requests=self.__stats.requests,
+                retries=self.__stats.retries,
+                failures=self.__stats.failures,
+                latencies={name: LatencyStats(**vars(latency))
+                           for name, latency
+                           in self.__stats.latencies.items()})
+
+    def put_object(self, **args):
+        return self._request('put_object', args)
+
+    def head_object(self, **args):
+        return self._request('head_object', args)
+
+    def get_object(self, **args):
+        return self._request('get_object', args)
+
+    def delete_object(self, **args):
+        return self._request('delete_object', args)
+
+    def create_multipart_upload(self, **args):
+        return self._request('create_multipart_upload', args)
+
+    def upload_part(self, **args):
+        return self._request('upload_part', args)
+
+    def complete_multipart_upload(self, **args):
+        return self._request('complete_multipart_upload', args)
+
+    def abort_multipart_upload(self, **args):
+        return self._request('abort_multipart_upload', args)
+
+    def get_client(self):
+        """
+        Returns the client for the calling thread, making it with the factory
+        the first time the thread calls.
+        """
+        if self.__client is not None:
+            return self.__client
+        client = getattr(self.__local, 'client', None)
+        if client is None:
+            client = self.__factory()
+            self.__local.client = client
+            with self.__lock:
+                self.__clients += 1
+            logging.debug("Made client for thread %s",
+                          threading.current_thread().name)
+        return client
+
+    def _request(self, name, args):
+        """
+        Calls the method of the client with the name and arguments, retrying
+        it if it fails with a transient error.
+        """
+        body = args.get('Body')
+        position = _get_position(body)
+        method = getattr(self.get_client(), name)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = method(**args)
+            except Exception as error:
+                self.__record(name, time.perf_counter() - start)
+                if attempt > 0 and _is_completed(name, error):
+                    logging.warning("Upload to %s was completed by an "
+                                    "earlier attempt", args.get('Key'))
+                    return {'Bucket': args.get('Bucket'),
+                            'Key': args.get('Key')}
+                if attempt >= self.retries or not is_retryable(error) or \
+                        position is False:
+                    with self.__lock:
+                        self.__stats.failures += 1
+                    raise
+                delay = self.get_delay(attempt)
+                logging.warning("Retrying %s in %.2fs after error: %s",
+                                name, delay, error)
+                with self.__lock:
+                    self.__stats.retries += 1
+                self.__sleep(delay)
+                if position is not None:
+                    body.seek(position)
+                attempt += 1
+                continue
+            self.__record(name, time.perf_counter() - start)
+            return response
+
+    def get_delay(self, attempt) -> float:
+        """
+        Returns the delay before the retry after the given number of
+        previous retries, chosen at random up to the backoff for the retry.
+        """
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, backoff)
+
+    def __record(self, name, seconds):
+        with self.__lock:
+            self.__stats.requests += 1
+            if name not in self.__stats.latencies:
+                self.__stats.latencies[name] = LatencyStats()
+            self.__stats.latencies[name].add(seconds)
+
+
+def _is_completed(name, error):
+    """
+    Indicates whether the error of the request with the method name is
+    raised because a multipart upload it completes was already completed.
+    """
+    return name == 'complete_multipart_upload' and \
+        get_error_code(error) == 'NoSuchUpload'
+
+
+def _get_position(body):
+    """
+    Returns the position of the body if it is a seekable file object, None
+    if it is not a file object, and False if it cannot be read again.
+    """
+    if body is None or not hasattr(body, 'read'):
+        return None
+    seekable = getattr(body, 'seekable', None)
+    if seekable is None or not seekable():
+        return False
+    return body.tell()
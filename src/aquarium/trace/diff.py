@@ -0,0 +1,214 @@
+"""
+Computes the differences between two provenance traces.
+
+Either side of a diff may be a ProvenanceTrace or a dump of a trace, which is
+the dictionary given by ProvenanceTrace.as_dict and stored in
+provenance_dump.json, or a normalized dump (see aquarium.trace.normalize).
+Objects are joined by ID and compared by content fingerprint, so the diff
+takes time linear in the size of the traces.
+
+Files are identified by upload ID, or for external files by path, because the
+file ID is assigned by a counter and is not stable between traces.
+"""
+from collections import namedtuple
+from typing import Union
+
+from aquarium.provenance import ProvenanceTrace, fingerprint_record
+from aquarium.trace import normalize
+
+KINDS = ['operations', 'plans', 'jobs', 'items', 'files']
+
+ID_KEYS = {
+    'operations': 'operation_id',
+    'plans': 'plan_id',
+    'jobs': 'job_id',
+    'items': 'item_id'
+}
+
+# An edge of a trace.
+# The relation is one of 'generated_by', 'derived_from', 'used' or 'part_of',
+# kind and id identify the object the edge is from, and target is the item ID
+# or activity ID (see get_activity_id) that the edge is to.
+Edge = namedtuple('Edge', ['relation', 'kind', 'id', 'target'])
+
+
+class TraceDiff:
+    """
+    The changes from an old trace to a new trace.
+
+    The added, removed and changed properties map each kind of object in
+    KINDS to a sorted list of IDs.
+    The added_edges and removed_edges properties are sorted lists of Edge
+    objects.
+    """
+
+    def __init__(self, *, added, removed, changed,
+                 added_edges, removed_edges):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.added_edges = added_edges
+        self.removed_edges = removed_edges
+
+    def is_empty(self):
+        """
+        Indicates whether the traces have the same objects and edges.
+        """
+        return not (any(self.added.values())
+                    or any(self.removed.values())
+                    or any(self.changed.values())
+                    or self.added_edges
+                    or self.removed_edges)
+
+    def as_dict(self):
+        diff_dict = dict()
+        diff_dict['added'] = self.added
+        diff_dict['removed'] = self.removed
+        diff_dict['changed'] = self.changed
+        edge_dict = dict()
+        edge_dict['added'] = [edge._asdict() for edge in self.added_edges]
+        edge_dict['removed'] = [edge._asdict() for edge in self.removed_edges]
+        diff_dict['edges'] = edge_dict
+        return diff_dict
+
+
+def diff(old: Union[ProvenanceTrace, dict],
+         new: Union[ProvenanceTrace, dict]) -> TraceDiff:
+    """
+    Returns the TraceDiff with the changes from the old trace to the new
+    trace.
+
+    The record of an object includes its generator, sources, collection and
+    inputs, so the edges from an object can only differ if its fingerprint
+    does.
+    Edges are therefore only compared for objects that were added, removed
+    or changed.
+
+    Args:
+        old: the previous ProvenanceTrace or trace dump
+        new: the current ProvenanceTrace or trace dump
+    """
+    old_index = _get_index(old)
+    new_index = _get_index(new)
+
+    added = dict()
+    removed = dict()
+    changed = dict()
+    old_edges = set()
+    new_edges = set()
+    for kind in KINDS:
+        old_kind = old_index.fingerprints[kind]
+        new_kind = new_index.fingerprints[kind]
+        added[kind] = sorted(key for key in new_kind if key not in old_kind)
+        removed[kind] = sorted(key for key in old_kind if key not in new_kind)
+        changed[kind] = sorted(
+            key for key, fingerprint in new_kind.items()
+            if key in old_kind and old_kind[key] != fingerprint)
+
+        for key in removed[kind] + changed[kind]:
+            old_edges.update(old_index.get_edges(kind, key))
+        for key in added[kind] + changed[kind]:
+            new_edges.update(new_index.get_edges(kind, key))
+
+    return TraceDiff(added=added,
+                     removed=removed,
+                     changed=changed,
+                     added_edges=sorted(new_edges - old_edges),
+                     removed_edges=sorted(old_edges - new_edges))
+
+
+def _get_index(trace):
+    if isinstance(trace, ProvenanceTrace):
+        return TraceIndex(trace)
+    return DumpIndex(normalize.expand(trace))
+
+
+class TraceIndex:
+    """
+    Fingerprints and edges by kind and ID for a ProvenanceTrace.
+    """
+
+    def __init__(self, trace: ProvenanceTrace):
+        self.objects = {
+            'operations': trace.operations,
+            'plans': trace.plans,
+            'jobs': trace.jobs,
+            'items': trace.items,
+            'files': {
+                TraceIndex._get_file_key(file_entity): file_entity
+                for file_entity in trace.get_files() if file_entity.generator
+            }
+        }
+        self.fingerprints = {
+            kind: {key: obj.content_fingerprint()
+                   for key, obj in objects.items()}
+            for kind, objects in self.objects.items()
+        }
+
+    def get_edges(self, kind, key):
+        obj = self.objects[kind][key]
+        edges = list()
+        if kind == 'operations':
+            for arg in obj.get_input_items():
+                edges.append(Edge('used', kind, key, arg.item_id))
+        elif kind in ['items', 'files']:
+            if obj.generator:
+                edges.append(Edge('generated_by', kind, key,
+                                  obj.generator.get_activity_id()))
+            for source_id in obj.get_source_ids():
+                edges.append(Edge('derived_from', kind, key, source_id))
+            if kind == 'items' and obj.is_part():
+                edges.append(Edge('part_of', kind, key,
+                                  obj.collection.item_id))
+        return edges
+
+    @staticmethod
+    def _get_file_key(file_entity):
+        if file_entity.is_external():
+            return file_entity.get_path(
+                directory=file_entity.generator.get_activity_id())
+        return file_entity.upload_id
+
+
+class DumpIndex:
+    """
+    Fingerprints and edges by kind and ID for a trace dump.
+    """
+
+    def __init__(self, dump: dict):
+        self.objects = {kind: dict() for kind in KINDS}
+        self.fingerprints = {kind: dict() for kind in KINDS}
+        for kind, id_key in ID_KEYS.items():
+            for record in dump.get(kind, []):
+                key = record[id_key]
+                self.objects[kind][key] = record
+                self.fingerprints[kind][key] = fingerprint_record(record)
+
+        for record in dump.get('files', []):
+            # file fingerprints omit the file ID (see AbstractFileEntity)
+            file_record = {key: value for key, value in record.items()
+                           if key != 'id'}
+            key = record.get('upload_id', record['filename'])
+            self.objects['files'][key] = record
+            self.fingerprints['files'][key] = fingerprint_record(file_record)
+
+    def get_edges(self, kind, key):
+        record = self.objects[kind][key]
+        edges = list()
+        if kind == 'operations':
+            for arg in record.get('inputs', []):
+                if 'item_id' in arg:
+                    edges.append(Edge('used', kind, key, arg['item_id']))
+        elif kind in ['items', 'files']:
+            generator = record.get('generated_by')
+            if generator:
+                if 'job_id' in generator:
+                    activity_id = "job_{}".format(generator['job_id'])
+                else:
+                    activity_id = "op_{}".format(generator['operation_id'])
+                edges.append(Edge('generated_by', kind, key, activity_id))
+            for source_id in record.get('sources', []):
+                edges.append(Edge('derived_from', kind, key, source_id))
+            if 'part_of' in record:
+                edges.append(Edge('part_of', kind, key, record['part_of']))
+        return edges
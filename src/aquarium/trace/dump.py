@@ -0,0 +1,121 @@
+"""
+Writes the JSON dump of a ProvenanceTrace incrementally.
+
+The output is the same as json.dumps(trace.as_dict(), indent=2), but records
+are encoded one at a time so the whole document is never held in memory.
+Other layouts (e.g., aquarium.trace.normalize) may be written compactly,
+which is the same as json.dumps(..., separators=(',', ':')).
+"""
+import json
+from types import GeneratorType
+from typing import Iterator
+
+from aquarium.provenance import ProvenanceTrace
+
+INDENT = 2
+
+# same settings as json.dumps(..., indent=2)
+_encoder = json.JSONEncoder(indent=INDENT)
+
+# same settings as json.dumps(..., separators=(',', ':'))
+_compact_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def iterencode(trace: ProvenanceTrace) -> Iterator[str]:
+    """
+    Returns an iterator over chunks of the JSON dump of the trace.
+
+    Each record of the trace is encoded as a separate chunk.
+    """
+    return iterencode_fields(trace.dump_fields())
+
+
+def iterencode_fields(fields, *, compact=False) -> Iterator[str]:
+    """
+    Returns an iterator over chunks of the JSON object with the key-value
+    pairs (see ProvenanceTrace.dump_fields).
+
+    Values that are lists or generators are encoded one element at a time.
+    The object is indented unless compact is set.
+    """
+    if compact:
+        yield from _iterencode_compact(fields)
+        return
+
+    yield '{'
+    separator = ''
+    for key, value in fields:
+        yield "{}\n{}{}: ".format(separator, _indent(1), json.dumps(key))
+        if isinstance(value, (list, GeneratorType)):
+            yield from _iterencode_list(value, level=1)
+        else:
+            yield _encode(value, level=1)
+        separator = ','
+    yield '\n}'
+
+
+def dump(trace: ProvenanceTrace, fp):
+    """
+    Writes the JSON dump of the trace to the text file object.
+    """
+    for chunk in iterencode(trace):
+        fp.write(chunk)
+
+
+def _iterencode_list(values, *, level):
+    """
+    Encodes a list at the given level of indentation one element at a time.
+    """
+    separator = '['
+    for value in values:
+        yield "{}\n{}{}".format(
+            separator, _indent(level + 1), _encode(value, level=level + 1))
+        separator = ','
+    if separator == '[':
+        yield '[]'
+    else:
+        yield "\n{}]".format(_indent(level))
+
+
+def _iterencode_compact(fields):
+    yield '{'
+    separator = ''
+    for key, value in fields:
+        yield "{}{}:".format(separator, json.dumps(key))
+        if isinstance(value, (list, GeneratorType)):
+            element_separator = '['
+            for element in value:
+                yield element_separator + _encode(element, level=None)
+                element_separator = ','
+            yield '[]' if element_separator == '[' else ']'
+        else:
+            yield _encode(value, level=None)
+        separator = ','
+    yield '}'
+
+
+def _encode(value, *, level):
+    """
+    Encodes the value as it would be at the given level of indentation, or
+    compactly if the level is None.
+
+    Newlines in strings are escaped by the encoder, so every newline in the
+    encoding is followed by indentation.
+    The encodings of cached records (see DumpRecord) are kept with the record.
+    """
+    encodings = getattr(value, 'encodings', None)
+    if encodings is not None and level in encodings:
+        return encodings[level]
+
+    if level is None:
+        encoding = _compact_encoder.encode(value)
+    else:
+        encoding = _encoder.encode(value)
+        encoding = encoding.replace('\n', "\n{}".format(_indent(level)))
+    if encodings is not None:
+        encodings[level] = encoding
+    return encoding
+
+
+def _indent(level):
+    return ' ' * (INDENT * level)
@@ -15,6 +15,12 @@ from aquarium.provenance import (
     PlanActivity,
     ProvenanceTrace
 )
+from aquarium.records import (
+    object_type_record,
+    operation_type_record,
+    sample_record,
+    upload_record
+)
 from aquarium.trace.visitor import ProvenanceVisitor
 from aquarium.trace.part_visitor import AddPartsVisitor
 from aquarium.trace.patch import create_patch_visitor
@@ -39,9 +45,11 @@ class TraceFactory:
         self.__uploads = dict()         # upload_id -> file_entity
         self.__external_files = dict()  # name -> external_file_entity
         self.__part_map = dict()        # part ref string -> part_entity
+        self.__records = dict()         # (record function, id) -> record
 
     @staticmethod
-    def create_from(*, session, plans, experiment_id, visitor=None):
+    def create_from(*, session, plans, experiment_id, visitor=None,
+                    detach=True):
         """
         Creates a ProvenanceTrace for the plans from the Aquarium session.
 
@@ -53,10 +61,15 @@ class TraceFactory:
 
         Associated uploads are visited last.
 
+        Unless detach is False, the factory is detached once the trace is
+        complete so that the pydent objects used to build the trace can be
+        freed (see TraceFactory.detach).
+
         Args:
             session: the pydent Session object
             plans: the list of pydent.model.Plan objects
             visitor: a provenance visitor
+            detach: whether to release the pydent objects after creation
         """
         factory = TraceFactory(
             session=session,
@@ -77,8 +90,44 @@ class TraceFactory:
         patch_visitor = create_patch_visitor()
         factory.__apply(patch_visitor)
 
+        if detach:
+            factory.detach()
+            if visitor:
+                visitor.add_factory(None)
+
         return factory.trace
 
+    def detach(self, *, keep_uploads=True):
+        """
+        Releases the session and the pydent objects gathered while building
+        the trace.
+
+        The entities of the trace only hold records, whose handles are
+        released so that they no longer refer to the session.
+        Unless keep_uploads is False, the handles of upload records are kept,
+        so that UploadManager can fetch the file contents, and they keep the
+        session alive until the trace is freed.
+        The factory cannot be used to add to the trace after detaching.
+        """
+        logging.debug("Detaching factory for trace")
+        for (create, _), record in self.__records.items():
+            if keep_uploads and create is upload_record:
+                continue
+            if record is not None and record.handle is not None:
+                record.handle.release()
+        self.__item_map.clear()
+        self.__op_map.clear()
+        self.__job_map.clear()
+        self.__plan_map.clear()
+        self.__uploads.clear()
+        self.__part_map.clear()
+        self.__records.clear()
+        self.__attribute_visitor = None
+        self.__session = None
+
+    def is_detached(self):
+        return self.__session is None
+
     @property
     def item_map(self):
         return self.__item_map
@@ -124,7 +173,7 @@ class TraceFactory:
             return self.__uploads[upload_id]
 
         file_entity = None
-        upload = self.__session.Upload.find(upload_id)
+        upload = self.__get_session().Upload.find(upload_id)
         if not upload:
             logging.error("No upload object for ID %s", upload_id)
             return None
@@ -138,7 +187,10 @@ class TraceFactory:
                           upload.job.id, upload_id)
             return None
 
-        file_entity = FileEntity(upload=upload, job=file_job)
+        file_entity = FileEntity(
+            upload=self.__get_record(upload_record, upload,
+                                     self.__get_session().Upload),
+            job=file_job)
         self.trace.add_file(file_entity)
         self.__uploads[upload_id] = file_entity
 
@@ -153,17 +205,19 @@ class TraceFactory:
         if self.trace.has_item(item_id):
             return self.trace.get_item(item_id)
 
-        item_obj = self.__session.Item.find(item_id)
+        item_obj = self.__get_session().Item.find(item_id)
         if is_collection(item_obj):
-            item_obj = self.__session.Collection.find(item_id)
+            item_obj = self.__get_session().Collection.find(item_id)
             item_entity = CollectionEntity(
-                item_id=item_obj.id, object_type=item_obj.object_type)
+                item_id=item_obj.id,
+                object_type=self.__get_object_type(item_obj.object_type))
 
         else:
             item_entity = ItemEntity(
                 item_id=item_obj.id,
-                sample=item_obj.sample,
-                object_type=item_obj.object_type)
+                sample=self.__get_record(sample_record, item_obj.sample,
+                                         self.__get_session().Sample),
+                object_type=self.__get_object_type(item_obj.object_type))
 
         self.__item_map[str(item_id)] = item_obj
         self.trace.add_item(item_entity)
@@ -220,7 +274,7 @@ class TraceFactory:
             self.__item_map[part_id] = part
 
         if part_id not in self.__item_map:
-            part = self.__session.Item.find(part_id)
+            part = self.__get_session().Item.find(part_id)
             if not part:
                 logging.warning("Did not find part for id %s", part_id)
                 return None
@@ -230,9 +284,10 @@ class TraceFactory:
                                  collection=collection)
 
         if sample is not None:
-            part_entity.sample = sample
+            part_entity.sample = self.__get_record(
+                sample_record, sample, self.__get_session().Sample)
         if object_type is not None:
-            part_entity.object_type = object_type
+            part_entity.object_type = self.__get_object_type(object_type)
 
         self.__part_map[part_entity.ref] = part_entity
         self.trace.add_item(part_entity)
@@ -251,9 +306,13 @@ class TraceFactory:
         if self.trace.has_operation(operation.id):
             return self.trace.get_operation(operation.id)
 
+        operation_type = self.__get_record(
+            operation_type_record,
+            operation.operation_type,
+            self.__get_session().OperationType)
         op_activity = OperationActivity(
             id=str(operation.id),
-            operation_type=operation.operation_type)
+            operation_type=operation_type)
 
         self.trace.add_operation(op_activity)
         op_activity.apply(self.__attribute_visitor)
@@ -285,10 +344,42 @@ class TraceFactory:
 
     def get_sample(self, sample_id: int):
         """
-        Returns the Sample object for the sample ID.
+        Returns the SampleRecord for the sample ID.
+        Each sample is only fetched from Aquarium once.
+        """
+        if not sample_id or sample_id < 0:
+            return None
+
+        key = (sample_record, sample_id)
+        if key in self.__records:
+            return self.__records[key]
+
+        interface = self.__get_session().Sample
+        sample = interface.find(sample_id)
+        return self.__get_record(sample_record, sample, interface)
+
+    def __get_session(self):
+        if self.__session is None:
+            raise RuntimeError("TraceFactory is detached from its session")
+        return self.__session
+
+    def __get_object_type(self, object_type):
+        return self.__get_record(object_type_record, object_type,
+                                 self.__get_session().ObjectType)
+
+    def __get_record(self, create, model, interface):
+        """
+        Returns the record for the pydent model object created by the create
+        function.
+        Records are shared by all entities referring to the same object.
         """
-        if sample_id and not sample_id < 0:
-            return self.__session.Sample.find(sample_id)
+        if model is None:
+            return None
+
+        key = (create, model.id)
+        if key not in self.__records:
+            self.__records[key] = create(model, interface=interface)
+        return self.__records[key]
 
     def __apply(self, visitor):
         """
@@ -366,7 +457,7 @@ class TraceFactory:
         if self.trace.has_job(job_id):
             return self.trace.get_job(job_id)
 
-        job = self.__session.Job.find(job_id)
+        job = self.__get_session().Job.find(job_id)
         if not job:
             logging.debug("No job %s in database", job_id)
 
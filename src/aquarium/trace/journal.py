@@ -0,0 +1,128 @@
+"""
+A journal of completed uploads, so that an interrupted upload run can be
+resumed.
+
+The journal is a SQLite database that records each file put to the object
+store by UploadManager, with the activity path, upload ID, name, size,
+checksum and object key, and each upload manifest written.
+A later run with the same journal skips the files and activities already
+recorded, and builds the manifests from the journal, so that a manifest is
+the same whichever run put its files.
+"""
+import logging
+import sqlite3
+import threading
+from typing import List, Optional
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        activity TEXT NOT NULL,
+        upload_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        size INTEGER,
+        sha256 TEXT NOT NULL,
+        key TEXT NOT NULL,
+        PRIMARY KEY (activity, upload_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS manifests (
+        activity TEXT PRIMARY KEY,
+        key TEXT NOT NULL
+    )
+    """
+]
+
+
+class UploadJournal:
+    """
+    The journal of the uploads in a SQLite database at the path.
+
+    Each record is committed as it is made, so the journal holds all of the
+    work completed before a run is interrupted.
+    The journal is safe to use from several threads.
+    """
+
+    def __init__(self, path):
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock, self.__connection:
+            for statement in _SCHEMA:
+                self.__connection.execute(statement)
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record_file(self, *, activity, upload_id, name, size, sha256, key):
+        """
+        Records that the file with the upload ID was put to the key for the
+        activity path.
+        """
+        logging.debug("Journal: %s %s put to %s", activity, upload_id, key)
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (activity, str(upload_id), name, size, sha256, key))
+
+    def get_file(self, *, activity, upload_id) -> Optional[dict]:
+        """
+        Returns the record of the file with the upload ID for the activity
+        path, or None if the file has not been put.
+        """
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT name, size, sha256, key FROM files"
+                " WHERE activity = ? AND upload_id = ?",
+                (activity, str(upload_id))).fetchone()
+        if row is None:
+            return None
+        return _file_record(upload_id, row)
+
+    def get_files(self, *, activity) -> List[dict]:
+        """
+        Returns the records of the files put for the activity path, ordered
+        by name and upload ID.
+        """
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT upload_id, name, size, sha256, key FROM files"
+                " WHERE activity = ? ORDER BY name, upload_id",
+                (activity,)).fetchall()
+        return [_file_record(row[0], row[1:]) for row in rows]
+
+    def record_manifest(self, *, activity, key):
+        """
+        Records that the manifest for the activity path was written to the
+        key.
+        """
+        logging.debug("Journal: manifest for %s put to %s", activity, key)
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO manifests VALUES (?, ?)",
+                (activity, key))
+
+    def has_manifest(self, *, activity) -> bool:
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT 1 FROM manifests WHERE activity = ?",
+                (activity,)).fetchone()
+        return row is not None
+
+
+def _file_record(upload_id, row):
+    name, size, sha256, key = row
+    return {
+        'upload_id': str(upload_id),
+        'name': name,
+        'size': size,
+        'sha256': sha256,
+        'key': key
+    }
@@ -0,0 +1,177 @@
+"""
+Exports a ProvenanceTrace as JSON Lines, one JSON object per line.
+
+Each line has a 'kind' key that is one of
+
+- 'trace' for the first line, with the experiment ID, inputs and attributes,
+- 'operation', 'plan' or 'job' for activities,
+- 'item', 'part' or 'collection' for items, and 'file' for files, and
+- 'edge' for the links between objects.
+
+Entity lines hold the dump record of the entity (see ProvenanceTrace.as_dict)
+without its generator and sources, which are given by edge lines instead.
+An edge line has the relation ('generated_by', 'derived_from', 'used' or
+'part_of'), and the kind and ID of the object the edge is from and to.
+The kinds are those of the lines for the objects, except that the kind of an
+item that an entity derives from or an operation uses is 'item' whatever its
+type.
+Every edge line follows the line of the object it is from.
+
+Lines are produced one record at a time, so exporting takes memory bounded by
+the size of a record rather than the trace.
+"""
+import json
+from types import GeneratorType
+from typing import Iterable, Iterator, TextIO
+
+from aquarium.provenance import ProvenanceTrace
+
+CONTENT_TYPE = 'application/x-ndjson'
+
+# dump kind -> line kind, where items use the record type
+LINE_KINDS = {
+    'operations': 'operation',
+    'plans': 'plan',
+    'jobs': 'job',
+    'files': 'file'
+}
+
+ID_KEYS = {
+    'operation': 'operation_id',
+    'plan': 'plan_id',
+    'job': 'job_id',
+    'item': 'item_id',
+    'part': 'item_id',
+    'collection': 'item_id',
+    'file': 'id'
+}
+
+# keys of entity records that are given by edges
+LINK_KEYS = ['generated_by', 'sources']
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def iterencode(trace: ProvenanceTrace) -> Iterator[str]:
+    """
+    Returns an iterator over the lines of the export of the trace, each
+    ending with a newline.
+    """
+    return iterencode_fields(trace.dump_fields())
+
+
+def iterencode_fields(fields) -> Iterator[str]:
+    """
+    Returns an iterator over the lines of the export for the key-value pairs
+    of a trace dump (see ProvenanceTrace.dump_fields).
+    """
+    header = {'kind': 'trace'}
+    records = list()
+    for key, value in fields:
+        if isinstance(value, (list, GeneratorType)) and key != 'inputs':
+            records.append((key, value))
+        else:
+            header[key] = value
+    yield _encoder.encode(header) + '\n'
+
+    for key, values in records:
+        for record in values:
+            yield from _encode_record(key, record)
+
+
+def dump(trace: ProvenanceTrace, fp: TextIO):
+    """
+    Writes the export of the trace to the text file object.
+    """
+    for line in iterencode(trace):
+        fp.write(line)
+
+
+def _encode_record(key, record):
+    """
+    Returns the lines for the record and its edges.
+
+    Unlike the JSON dump, the lines are not cached with the record, so that
+    exporting does not add memory proportional to the size of the trace.
+    """
+    kind = LINE_KINDS.get(key, record.get('type'))
+    line = {'kind': kind}
+    for record_key, value in record.items():
+        if record_key not in LINK_KEYS:
+            line[record_key] = value
+    lines = [_encoder.encode(line) + '\n']
+    for edge in _get_edges(kind, record):
+        lines.append(_encoder.encode(edge) + '\n')
+    return lines
+
+
+def _get_edges(kind, record):
+    record_id = record[ID_KEYS[kind]]
+    edges = list()
+    if kind == 'operation':
+        for arg in record.get('inputs', []):
+            if 'item_id' in arg:
+                edges.append(_edge('used', kind, record_id,
+                                   'item', arg['item_id']))
+        return edges
+
+    generator = record.get('generated_by')
+    if generator and 'job_id' in generator:
+        edges.append(_edge('generated_by', kind, record_id,
+                           'job', generator['job_id']))
+    elif generator:
+        edges.append(_edge('generated_by', kind, record_id,
+                           'operation', generator['operation_id']))
+    for source_id in record.get('sources', []):
+        edges.append(_edge('derived_from', kind, record_id, 'item', source_id))
+    if 'part_of' in record:
+        edges.append(_edge('part_of', kind, record_id,
+                           'collection', record['part_of']))
+    return edges
+
+
+def _edge(relation, from_kind, from_id, to_kind, to_id):
+    return {
+        'kind': 'edge',
+        'relation': relation,
+        'from_kind': from_kind,
+        'from_id': from_id,
+        'to_kind': to_kind,
+        'to_id': to_id
+    }
+
+
+def read_dump(lines: Iterable[str]) -> dict:
+    """
+    Returns the trace dump (see ProvenanceTrace.as_dict) for the lines of an
+    export, such as a text file object.
+    """
+    dump_dict = {'operations': [], 'plans': [], 'jobs': [],
+                 'items': [], 'files': []}
+    header = dict()
+    entities = dict()  # (line kind, id) -> record
+    dump_kinds = {kind: key for key, kind in LINE_KINDS.items()}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.pop('kind')
+        if kind == 'trace':
+            header = record
+        elif kind == 'edge':
+            _add_edge(entities, record)
+        else:
+            dump_dict[dump_kinds.get(kind, 'items')].append(record)
+            entities[(kind, record[ID_KEYS[kind]])] = record
+    return {**header, **dump_dict}
+
+
+def _add_edge(entities, edge):
+    record = entities.get((edge['from_kind'], edge['from_id']))
+    if record is None:
+        return
+    if edge['relation'] == 'generated_by':
+        id_key = ID_KEYS[edge['to_kind']]
+        record['generated_by'] = {id_key: edge['to_id']}
+    elif edge['relation'] == 'derived_from':
+        record.setdefault('sources', list()).append(edge['to_id'])
@@ -0,0 +1,339 @@
+"""
+Rebuilds a ProvenanceTrace from the records of a trace dump.
+
+The dump is the dictionary given by ProvenanceTrace.as_dict, and stored in
+provenance_dump.json.
+Entities refer to samples, object types, operation types, jobs and uploads
+through records without handles, since the dump does not carry a session.
+
+A loaded trace can be queried and dumped like one built by TraceFactory:
+
+    with open('provenance_dump.json') as dump_file:
+        trace = loader.load(dump_file, lazy_attributes=True)
+"""
+import json
+import logging
+import os
+from typing import TextIO
+
+from aquarium.provenance import (
+    AbstractFileEntity,
+    CollectionEntity,
+    ExternalFileEntity,
+    FileEntity,
+    ItemEntity,
+    JobActivity,
+    OperationActivity,
+    OperationItemPin,
+    OperationParameter,
+    PartEntity,
+    PlanActivity,
+    ProvenanceTrace
+)
+from aquarium.records import (
+    JobRecord,
+    ObjectTypeRecord,
+    OperationTypeRecord,
+    SampleRecord,
+    UploadRecord
+)
+from aquarium.trace import normalize
+
+
+class TraceLoader:
+    """
+    Builds a ProvenanceTrace from the records of a trace dump.
+
+    Records are resolved by ID using the trace, so loading takes time linear
+    in the size of the dump.
+    References to objects that are not in the dump are dropped.
+
+    By default, attributes are added to each object as they would be by the
+    factory, so that the attributes of parts are shared through the attribute
+    store of the collection.
+    With lazy_attributes, the attribute dictionary of each dump record is
+    instead kept unprocessed until the attributes of the object are first
+    read (see AttributesMixin.defer_attributes), which makes loading faster
+    when few attributes are read.
+    The dump must not be modified while the trace is in use.
+    """
+
+    def __init__(self, *, lazy_attributes=False):
+        self.__lazy_attributes = lazy_attributes
+        self.__records = dict()  # (record class, id) -> record
+
+    def load(self, dump: dict) -> ProvenanceTrace:
+        """
+        Returns the ProvenanceTrace for the dump, which may be in the
+        normalized layout (see aquarium.trace.normalize).
+        """
+        dump = normalize.expand(dump)
+        trace = ProvenanceTrace(experiment_id=dump.get('experiment_id'))
+        item_records = dump.get('items', [])
+
+        # parts are created after collections, but items are added to the
+        # trace in the order of the dump
+        item_entities = dict()
+        for record in item_records:
+            if record['type'] != 'part':
+                item_entities[record['item_id']] = self.__create_item(record)
+        for record in item_records:
+            if record['type'] == 'part':
+                part_entity = self.__create_part(item_entities, record)
+                if part_entity:
+                    item_entities[record['item_id']] = part_entity
+        for record in item_records:
+            if record['item_id'] in item_entities:
+                trace.add_item(item_entities[record['item_id']])
+
+        for record in dump.get('operations', []):
+            trace.add_operation(self.__create_operation(trace, record))
+        for record in dump.get('plans', []):
+            trace.add_plan(self.__create_plan(trace, record))
+        for record in dump.get('jobs', []):
+            job_activity = self.__create_job(trace, record)
+            if job_activity:
+                trace.add_job(job_activity)
+
+        for record in item_records:
+            item_entity = trace.get_item(record['item_id'])
+            if item_entity:
+                TraceLoader.__add_links(trace, item_entity, record)
+
+        for record in dump.get('files', []):
+            trace.add_file(self.__create_file(trace, record))
+
+        if dump.get('attributes'):
+            trace.add_attribute(dump['attributes'])
+
+        return trace
+
+    def __create_item(self, record):
+        if record['type'] == 'collection':
+            item_entity = CollectionEntity(
+                item_id=record['item_id'],
+                object_type=self.__get_object_type(record))
+        else:
+            item_entity = ItemEntity(
+                item_id=record['item_id'],
+                sample=self.__get_sample(record),
+                object_type=self.__get_object_type(record))
+        self.__add_attributes(item_entity, record)
+        return item_entity
+
+    def __create_part(self, item_entities, record):
+        collection = item_entities.get(record['part_of'])
+        if not collection:
+            logging.debug("Collection %s of part %s not in dump",
+                          record['part_of'], record['item_id'])
+            return None
+
+        part_entity = PartEntity(
+            part_id=record['item_id'],
+            part_ref="{}/{}".format(record['part_of'], record['well']),
+            sample=self.__get_sample(record),
+            object_type=self.__get_object_type(record),
+            collection=collection)
+        self.__add_attributes(part_entity, record)
+        return part_entity
+
+    def __create_operation(self, trace, record):
+        operation_type = None
+        if 'operation_type' in record:
+            type_record = record['operation_type']
+            operation_type = self.__get_record(
+                OperationTypeRecord,
+                id=type_record['operation_type_id'],
+                name=type_record['name'],
+                category=type_record['category'])
+
+        op_activity = OperationActivity(id=record['operation_id'],
+                                        operation_type=operation_type,
+                                        start_time=record.get('start_time'),
+                                        end_time=record.get('end_time'))
+        for arg_record in record.get('inputs', []):
+            arg = TraceLoader.__create_argument(trace, arg_record)
+            if arg:
+                op_activity.add_input(arg)
+                if arg.is_item():
+                    trace.add_input(arg.item_id, op_activity)
+        for arg_record in record.get('outputs', []):
+            arg = TraceLoader.__create_argument(trace, arg_record)
+            if arg:
+                op_activity.add_output(arg)
+        self.__add_attributes(op_activity, record)
+        return op_activity
+
+    @staticmethod
+    def __create_argument(trace, record):
+        if 'item_id' not in record:
+            return OperationParameter(name=record['name'],
+                                      field_value_id=record['field_value_id'],
+                                      value=record.get('value'))
+
+        item_entity = trace.get_item(record['item_id'])
+        if not item_entity:
+            logging.debug("Item %s of argument %s not in dump",
+                          record['item_id'], record['name'])
+            return None
+
+        return OperationItemPin(name=record['name'],
+                                field_value_id=record['field_value_id'],
+                                item_entity=item_entity,
+                                routing_id=record.get('routing_id'))
+
+    @staticmethod
+    def __create_plan(trace, record):
+        operations = TraceLoader.__get_operations(trace, record)
+        return PlanActivity(id=record['plan_id'],
+                            name=record.get('name'),
+                            operations=operations,
+                            status=record.get('status'))
+
+    def __create_job(self, trace, record):
+        operations = TraceLoader.__get_operations(trace, record)
+        if not operations:
+            logging.debug("Job %s has no operations in dump",
+                          record['job_id'])
+            return None
+
+        first_op = next(iter(operations))
+        return JobActivity(job=self.__get_record(JobRecord,
+                                                 id=record['job_id']),
+                           operations=operations,
+                           start_time=first_op.start_time,
+                           end_time=first_op.end_time,
+                           status=record.get('status'))
+
+    def __create_file(self, trace, record):
+        generator = TraceLoader.__get_generator(trace, record)
+        name = record['filename']
+        if generator:
+            prefix = generator.get_activity_id() + os.sep
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+
+        if 'upload_id' in record:
+            upload = self.__get_record(UploadRecord,
+                                       id=record['upload_id'],
+                                       name=name,
+                                       size=record.get('size'),
+                                       upload_content_type=None)
+            job = None
+            if generator:
+                job = generator if generator.is_job() else generator.job
+            file_entity = FileEntity(upload=upload, job=job)
+        else:
+            file_entity = ExternalFileEntity(name=name)
+
+        file_entity.id = TraceLoader.__get_file_id(record['id'])
+        if record.get('sha256'):
+            file_entity.check_sum = record['sha256']
+        TraceLoader.__add_links(trace, file_entity, record)
+        return file_entity
+
+    @staticmethod
+    def __get_file_id(id):
+        """
+        Returns the file ID from the dump, and moves the file ID counter past
+        it so that files created later do not reuse the ID.
+        """
+        if not str(id).isdigit():
+            return id
+        file_id = int(id)
+        if file_id >= AbstractFileEntity._id_counter:
+            AbstractFileEntity._id_counter = file_id + 1
+        return file_id
+
+    @staticmethod
+    def __add_links(trace, entity, record):
+        generator = TraceLoader.__get_generator(trace, record)
+        if generator:
+            entity.add_generator(generator)
+        for source_id in record.get('sources', []):
+            source = trace.get_item(source_id)
+            if source:
+                entity.add_source(source)
+            else:
+                logging.debug("Source %s not in dump", source_id)
+
+    @staticmethod
+    def __get_generator(trace, record):
+        generator_record = record.get('generated_by')
+        if not generator_record:
+            return None
+        if 'job_id' in generator_record:
+            generator = trace.get_job(generator_record['job_id'])
+        else:
+            generator = trace.get_operation(generator_record['operation_id'])
+        if not generator:
+            logging.debug("Generator %s not in dump", str(generator_record))
+        return generator
+
+    @staticmethod
+    def __get_operations(trace, record):
+        operations = list()
+        for operation_id in record.get('operations', []):
+            op_activity = trace.get_operation(operation_id)
+            if op_activity:
+                operations.append(op_activity)
+        return operations
+
+    def __add_attributes(self, prov_object, record):
+        if not record.get('attributes'):
+            return
+        if self.__lazy_attributes:
+            prov_object.defer_attributes(record['attributes'])
+        else:
+            prov_object.add_attribute(record['attributes'])
+
+    def __get_sample(self, record):
+        if 'sample' not in record:
+            return None
+        sample = record['sample']
+        return self.__get_record(SampleRecord,
+                                 id=sample['sample_id'],
+                                 name=sample['sample_name'])
+
+    def __get_object_type(self, record):
+        if 'object_type' not in record:
+            return None
+        object_type = record['object_type']
+        return self.__get_record(ObjectTypeRecord,
+                                 id=object_type['object_type_id'],
+                                 name=object_type['object_type_name'])
+
+    def __get_record(self, record_class, *, id, **fields):
+        """
+        Returns the record of the class for the ID, so that entities share a
+        record for each object.
+        """
+        key = (record_class, id)
+        if key not in self.__records:
+            self.__records[key] = record_class(id=id, **fields)
+        return self.__records[key]
+
+
+def load_trace(dump: dict, *, lazy_attributes=False) -> ProvenanceTrace:
+    """
+    Returns the ProvenanceTrace for the trace dump.
+    See TraceLoader for lazy_attributes.
+    """
+    return TraceLoader(lazy_attributes=lazy_attributes).load(dump)
+
+
+def load(fp: TextIO, *, lazy_attributes=False) -> ProvenanceTrace:
+    """
+    Returns the ProvenanceTrace for the JSON trace dump in the text file
+    object (e.g., provenance_dump.json).
+    See TraceLoader for lazy_attributes.
+    """
+    return load_trace(json.load(fp), lazy_attributes=lazy_attributes)
+
+
+def loads(text: str, *, lazy_attributes=False) -> ProvenanceTrace:
+    """
+    Returns the ProvenanceTrace for the JSON trace dump.
+    See TraceLoader for lazy_attributes.
+    """
+    return load_trace(json.loads(text), lazy_attributes=lazy_attributes)
@@ -0,0 +1,144 @@
+"""
+Converts between the legacy trace dump and the normalized layout.
+
+In the legacy layout (see ProvenanceTrace.as_dict) each item embeds the
+dictionaries for its sample and object type, and each operation the
+dictionary for its operation type.
+In the normalized layout, these dictionaries are stored once in the samples,
+object_types and operation_types tables, and records refer to them by the
+sample_id, object_type_id and operation_type_id keys.
+A normalized dump has 'layout' set to 'normalized'.
+
+The tables follow the records so that a normalized dump can be written in one
+pass (see normalize_fields).
+"""
+from collections import OrderedDict
+
+LAYOUT = 'normalized'
+
+# record key -> (table, ID key of the table entries)
+REFERENCES = OrderedDict([
+    ('sample', ('samples', 'sample_id')),
+    ('object_type', ('object_types', 'object_type_id')),
+    ('operation_type', ('operation_types', 'operation_type_id'))
+])
+
+# record key in the normalized layout -> record key in the legacy layout
+EXPANSIONS = {id_key: key for key, (_, id_key) in REFERENCES.items()}
+
+TABLES = [table for table, _ in REFERENCES.values()]
+
+RECORD_KINDS = ['operations', 'plans', 'jobs', 'items', 'files']
+
+
+class TableBuilder:
+    """
+    Collects the table entries referenced by the records it normalizes.
+    """
+
+    def __init__(self):
+        self.tables = {table: OrderedDict() for table in TABLES}
+
+    def normalize(self, record: dict) -> dict:
+        """
+        Returns the normalized record for the legacy record, and adds the
+        sample, object type and operation type of the record to the tables.
+
+        If the record is a cached DumpRecord, the normalized record is cached
+        with it.
+        """
+        encodings = getattr(record, 'encodings', None)
+        if encodings is not None and LAYOUT in encodings:
+            normalized = encodings[LAYOUT]
+        else:
+            normalized = dict()
+            for key, value in record.items():
+                if key in REFERENCES:
+                    _, id_key = REFERENCES[key]
+                    normalized[id_key] = value[id_key]
+                else:
+                    normalized[key] = value
+            if encodings is not None:
+                normalized = type(record)(normalized)
+                encodings[LAYOUT] = normalized
+
+        for key, (table, id_key) in REFERENCES.items():
+            if key in record:
+                self.tables[table].setdefault(record[key][id_key],
+                                              record[key])
+        return normalized
+
+
+def normalize_fields(fields):
+    """
+    Returns the key-value pairs of the normalized dump for the key-value
+    pairs of a legacy dump (see ProvenanceTrace.dump_fields).
+
+    Records are normalized as they are read from the returned pairs, and the
+    tables are filled as records are read, so the pairs must be read in
+    order.
+    """
+    builder = TableBuilder()
+    normalized = [('layout', LAYOUT)]
+    for key, value in fields:
+        if key in RECORD_KINDS:
+            value = (builder.normalize(record) for record in value)
+        normalized.append((key, value))
+    for table in TABLES:
+        normalized.append((table, _iterate_table(builder, table)))
+    return normalized
+
+
+def _iterate_table(builder, table):
+    yield from builder.tables[table].values()
+
+
+def normalize(dump: dict) -> dict:
+    """
+    Returns the normalized dump for the legacy dump.
+    """
+    normalized = dict()
+    for key, value in normalize_fields(dump.items()):
+        if key in RECORD_KINDS or key in TABLES:
+            value = list(value)
+        normalized[key] = value
+    return normalized
+
+
+def is_normalized(dump: dict) -> bool:
+    return dump.get('layout') == LAYOUT
+
+
+def expand(dump: dict) -> dict:
+    """
+    Returns the legacy dump for a normalized dump.
+    A dump that is not normalized is returned unchanged.
+
+    Raises KeyError if a record refers to an entry missing from a table.
+    """
+    if not is_normalized(dump):
+        return dump
+
+    tables = dict()
+    for table, id_key in REFERENCES.values():
+        tables[id_key] = {entry[id_key]: entry
+                          for entry in dump.get(table, [])}
+
+    expanded = dict()
+    for key, value in dump.items():
+        if key == 'layout' or key in TABLES:
+            continue
+        if key in RECORD_KINDS:
+            value = [_expand_record(record, tables) for record in value]
+        expanded[key] = value
+    return expanded
+
+
+def _expand_record(record, tables):
+    expanded = dict()
+    for key, value in record.items():
+        if key in EXPANSIONS:
+            expanded[EXPANSIONS[key]] = tables[key][value]
+        else:
+            expanded[key] = value
+    return expanded
@@ -1,20 +1,27 @@
 from aquarium.provenance import (
-    ProvenanceTrace, ItemEntity, JobActivity, OperationActivity)
+    AbstractFileEntity, AbstractItemEntity, CollectionEntity, ItemEntity,
+    JobActivity, OperationActivity, PartEntity, ProvenanceTrace)
 from aquarium.trace.visitor import ProvenanceVisitor
 from sbol import (
-    Activity, ComponentDefinition, Document, setHomespace)
+    Activity, Attachment, ComponentDefinition, Document, setHomespace)
 from typing import Union
 
 
 class SBOLVisitor(ProvenanceVisitor):
     """
     A visitor to convert aquarium.provenance.ProvenanceTrace to an SBOL
-    Document object containing item and operation linkages.
+    Document object containing item, file and activity linkages.
 
     Apply the visitor to a trace and then access the `doc` property.
 
-    Does not currently handle jobs as generators, or files generated as
-    measurements.
+    Items, including collections and parts, are converted to components,
+    operations and jobs to activities, and files to attachments.
+
+    The visitor keeps its own index of the objects it has created by name,
+    since membership tests on the document are slow for large documents.
+    Visiting the trace creates the objects for all of the items, operations,
+    jobs and files of the trace at once, so that the other visits only set
+    the links between them.
     """
     # TODO: decide whether prefixes need to be customized
 
@@ -22,23 +29,60 @@ class SBOLVisitor(ProvenanceVisitor):
         # TODO: is it sufficient for homespace to be set at document init?
         setHomespace(namespace)
         self.doc = Document()
+        self.__activities = dict()
+        self.__components = dict()
+        self.__attachments = dict()
+        self.__usages = set()  # (activity name, usage name)
         super().__init__(trace)
 
+    def visit_trace(self, trace: ProvenanceTrace):
+        """
+        Creates the SBOL objects for the items, operations, jobs and files of
+        the trace that do not already exist.
+        """
+        for item in trace.items.values():
+            self._get_component(item)
+        for operation in trace.operations.values():
+            self._get_activity(operation)
+        for job in trace.jobs.values():
+            self._get_activity(job)
+        for file_entity in trace.files.values():
+            self._get_attachment(file_entity)
+
     def visit_item(self, item: ItemEntity):
         """
-        Adds an SBOL component for the given ItemEntity and sets the generator
-        if the generating activity is an OperationActivity.
+        Adds an SBOL component for the given ItemEntity and sets the
+        generator.
         """
         component = self._get_component(item)
-
         if item.generator is None:
             return
-        if item.generator.is_job():
-            # TODO: handle jobs as generator
-            return
 
-        activity = self._get_activity(item.generator)
-        component.wasGeneratedBy = activity
+        component.wasGeneratedBy = self._get_activity(item.generator)
+
+    def visit_collection(self, collection: CollectionEntity):
+        self.visit_item(collection)
+
+    def visit_part(self, part: PartEntity):
+        self.visit_item(part)
+
+    def visit_file(self, file_entity: AbstractFileEntity):
+        """
+        Adds an SBOL attachment for the given file entity, and sets the
+        generator and the components the file derives from.
+        """
+        attachment = self._get_attachment(file_entity)
+        if file_entity.generator is not None:
+            attachment.wasGeneratedBy = self._get_activity(
+                file_entity.generator)
+        if file_entity.sources:
+            attachment.wasDerivedFrom = [
+                self._get_component(source).identity
+                for source in file_entity.sources
+            ]
+
+    def visit_job(self, job: JobActivity):
+        self._get_activity(job)
 
     def visit_operation(self, operation: OperationActivity):
         """
@@ -48,10 +92,15 @@ class SBOLVisitor(ProvenanceVisitor):
         Creates any object that does not exist in self.doc.
         """
         activity = self._get_activity(operation)
+        activity_name = "operation_{}".format(operation.operation_id)
         for item in operation.get_input_items():
+            usage_name = "usage_{}".format(item.item_id)
+            if (activity_name, usage_name) in self.__usages:
+                continue
             component = self._get_component(item)
-            usage = activity.usages.create("usage_{}".format(item.item_id))
+            usage = activity.usages.create(usage_name)
             usage.entity = component.identity
+            self.__usages.add((activity_name, usage_name))
 
     def _get_activity(self,
                       activity: Union[OperationActivity, JobActivity]
@@ -60,21 +109,40 @@ class SBOLVisitor(ProvenanceVisitor):
         Returns an SBOL activity for the Aquarium activity.
         Creates the object if it does not exist.
         """
-
         if activity.is_job():
             activity_name = "job_{}".format(activity.job_id)
         else:
             activity_name = "operation_{}".format(activity.operation_id)
-        if activity_name in self.doc.activities:
-            return self.doc.activities[activity_name]
-        return self.doc.activities.create(activity_name)
+        sbol_activity = self.__activities.get(activity_name)
+        if sbol_activity is None:
+            sbol_activity = self.doc.activities.create(activity_name)
+            self.__activities[activity_name] = sbol_activity
+        return sbol_activity
 
-    def _get_component(self, item: ItemEntity) -> ComponentDefinition:
+    def _get_component(self, item: AbstractItemEntity) -> ComponentDefinition:
         """
-        Returns an SBOL component for the given ItemEntity.
+        Returns an SBOL component for the given item, which may also be an
+        operation input.
         Creates the object if it does not exist.
         """
         component_name = "item_{}".format(item.item_id)
-        if component_name in self.doc.componentDefinitions:
-            return self.doc.componentDefinitions[component_name]
-        return self.doc.componentDefinitions.create(component_name)
+        component = self.__components.get(component_name)
+        if component is None:
+            component = self.doc.componentDefinitions.create(component_name)
+            self.__components[component_name] = component
+        return component
+
+    def _get_attachment(self, file_entity: AbstractFileEntity) -> Attachment:
+        """
+        Returns an SBOL attachment for the given file entity.
+        Creates the object if it does not exist.
+        """
+        attachment_name = "file_{}".format(file_entity.id)
+        attachment = self.__attachments.get(attachment_name)
+        if attachment is None:
+            attachment = self.doc.attachments.create(attachment_name)
+            attachment.source = file_entity.name
+            if file_entity.check_sum:
+                attachment.hash = file_entity.check_sum
+            self.__attachments[attachment_name] = attachment
+        return attachment
@@ -0,0 +1,150 @@
+"""
+Splits the dump of a ProvenanceTrace into shards by plan.
+
+Each operation is assigned to the shard of its plan, each job to the shard of
+the plan of its first operation, and each item or file to the shard of its
+generator.
+Objects that have no plan, such as items that are inputs of the experiment,
+are assigned to the shared shard.
+
+A shard has the same form as a trace dump (see ProvenanceTrace.as_dict), and
+the manifest holds the experiment ID, inputs, attributes and the list of
+shards.
+Any subset of the shards can be merged back into a trace, but links to
+objects in shards that are not included are dropped.
+Since most entities derive from inputs in the shared shard, it should usually
+be included.
+"""
+from collections import OrderedDict
+from typing import List
+
+from aquarium.provenance import ProvenanceTrace
+from aquarium.trace import normalize
+from aquarium.trace.loader import load_trace
+
+SHARED_SHARD = 'shared'
+
+KINDS = ['operations', 'plans', 'jobs', 'items', 'files']
+
+ID_KEYS = {
+    'operations': 'operation_id',
+    'plans': 'plan_id',
+    'jobs': 'job_id',
+    'items': 'item_id',
+    'files': 'id'
+}
+
+
+def get_shard_name(plan_id) -> str:
+    return "plan_{}".format(plan_id)
+
+
+def get_shard_filename(shard_name, *, extension='.json') -> str:
+    return "{}{}".format(shard_name, extension)
+
+
+def shard_trace(trace: ProvenanceTrace, *, extension='.json'):
+    """
+    Returns the manifest and the shards of the trace.
+
+    The manifest is a dictionary, and the shards map each shard name to the
+    list of key-value pairs of the shard dump, where the records of each
+    kind are given by a generator as in ProvenanceTrace.dump_fields.
+    The extension is that of the shard filenames listed in the manifest.
+    """
+    objects = OrderedDict()  # shard name -> kind -> objects
+    objects[SHARED_SHARD] = {kind: list() for kind in KINDS}
+
+    def add(shard_name, kind, obj):
+        if shard_name not in objects:
+            objects[shard_name] = {kind: list() for kind in KINDS}
+        objects[shard_name][kind].append(obj)
+
+    for plan in trace.plans.values():
+        add(get_shard_name(plan.id), 'plans', plan)
+    for operation in trace.operations.values():
+        add(_get_shard(operation), 'operations', operation)
+    for job in trace.jobs.values():
+        add(_get_shard(job), 'jobs', job)
+    for item in trace.items.values():
+        add(_get_shard(item.generator), 'items', item)
+    for file_entity in trace.files.values():
+        if file_entity.generator:
+            add(_get_shard(file_entity.generator), 'files', file_entity)
+
+    manifest = OrderedDict()
+    shards = OrderedDict()
+    for key, value in trace.dump_fields():
+        if key not in KINDS:
+            manifest[key] = value
+    manifest['shards'] = list()
+    for shard_name, shard_objects in objects.items():
+        manifest['shards'].append({
+            'name': shard_name,
+            'filename': get_shard_filename(shard_name, extension=extension),
+            'counts': {kind: len(shard_objects[kind]) for kind in KINDS}
+        })
+        shards[shard_name] = _get_shard_fields(shard_name, shard_objects)
+    return manifest, shards
+
+
+def _get_shard(activity):
+    """
+    Returns the name of the shard for the activity, which is the shard of the
+    plan of the operation, or of the first operation of a job.
+    """
+    if activity is None:
+        return SHARED_SHARD
+    if activity.is_job():
+        for operation in activity.operations:
+            if operation.plan:
+                return get_shard_name(operation.plan.id)
+        return SHARED_SHARD
+    if activity.plan:
+        return get_shard_name(activity.plan.id)
+    return SHARED_SHARD
+
+
+def _get_shard_fields(shard_name, shard_objects):
+    fields = [('shard', shard_name)]
+    for kind in KINDS:
+        if kind == 'files':
+            records = (
+                file_entity.get_record(
+                    path=file_entity.generator.get_activity_id())
+                for file_entity in shard_objects[kind])
+        else:
+            records = (obj.get_record() for obj in shard_objects[kind])
+        fields.append((kind, records))
+    return fields
+
+
+def merge_shards(manifest: dict, shards: List[dict]) -> dict:
+    """
+    Returns the trace dump with the records of the shard dumps, and the
+    experiment ID, inputs and attributes of the manifest.
+    Records that occur in more than one shard are included once.
+    Shards may be in the normalized layout (see aquarium.trace.normalize).
+    """
+    merged = dict()
+    for key, value in manifest.items():
+        if key != 'shards':
+            merged[key] = value
+    shards = [normalize.expand(shard) for shard in shards]
+    for kind in KINDS:
+        records = OrderedDict()
+        for shard in shards:
+            for record in shard.get(kind, []):
+                records.setdefault(record[ID_KEYS[kind]], record)
+        merged[kind] = list(records.values())
+    return merged
+
+
+def load_shards(manifest: dict, shards: List[dict], *,
+                lazy_attributes=False) -> ProvenanceTrace:
+    """
+    Returns the ProvenanceTrace for the shard dumps.
+    See TraceLoader for lazy_attributes.
+    """
+    return load_trace(merge_shards(manifest, shards),
+                      lazy_attributes=lazy_attributes)
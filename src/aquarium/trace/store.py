@@ -0,0 +1,259 @@
+"""
+An object store on the local filesystem, with the methods of the S3 client
+used by UploadManager.
+
+Objects are stored in files at root_dir/bucket/key.
+Each object is written to a temporary file in the directory of the object
+and renamed into place, so readers see either the old or the new object
+but never part of one, and concurrent writers of the same key leave one of
+the complete objects.
+Bodies that are regular files are copied with os.sendfile where available.
+
+The store can be used as a local mirror of a bucket, or in place of S3 in
+tests and benchmarks.
+"""
+import hashlib
+import io
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import uuid
+
+# size of the blocks copied from bodies that are not regular files
+COPY_SIZE = 1024 * 1024
+
+# subdirectory of root_dir holding the parts of multipart uploads
+MULTIPART_DIRECTORY = '.multipart'
+
+# umask of the process, read once at import since it can only be read by
+# setting it, which would race with files created by other threads
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+class ObjectNotFound(Exception):
+    """
+    Raised by head_object and get_object for a missing object, with the same
+    response as the botocore ClientError raised by S3.
+    """
+
+    def __init__(self, key):
+        self.response = {'Error': {'Code': '404', 'Message': 'Not Found'}}
+        super().__init__("No object {}".format(key))
+
+
+class LocalObjectStore:
+    """
+    Stores objects in files under root_dir.
+
+    If fsync is set, each file is flushed to disk before it is renamed into
+    place.
+    The store is safe to use from several threads.
+    Content types and encodings are accepted but not stored.
+    """
+
+    def __init__(self, root_dir, *, fsync=False):
+        self.root_dir = root_dir
+        self.fsync = fsync
+        self.__lock = threading.Lock()
+        self.__directories = set()  # directories known to exist
+        self.__multipart = dict()  # upload ID -> path
+        # files are created private, and opened up to the umask when renamed
+        self.__mode = 0o666 & ~UMASK
+
+    def get_path(self, bucket, key) -> str:
+        """
+        Returns the path of the file for the object with the key.
+
+        Raises ValueError if the key refers outside of the bucket.
+        """
+        parts = key.split('/')
+        if not key or key.startswith('/') or '..' in parts:
+            raise ValueError("Invalid key {}".format(key))
+        return os.path.join(self.root_dir, bucket, *parts)
+
+    def put_object(self, *, Body, Bucket, Key, ContentType=None,
+                   ContentEncoding=None):
+        path = self.get_path(Bucket, Key)
+        self._write_file(path, lambda output: _copy_body(Body, output))
+        return dict()
+
+    def head_object(self, *, Bucket, Key):
+        """
+        Returns the size of the object, or raises ObjectNotFound if there is
+        no object with the key.
+        A directory at the path of the key, such as one holding the objects
+        with the key as a prefix, is not an object.
+        """
+        path = self.get_path(Bucket, Key)
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            raise ObjectNotFound(Key) from None
+        if not stat.S_ISREG(status.st_mode):
+            raise ObjectNotFound(Key)
+        return {'ContentLength': status.st_size}
+
+    def get_object(self, *, Bucket, Key):
+        """
+        Returns the size of the object and a binary file object for its
+        contents, which the caller should close.
+        """
+        path = self.get_path(Bucket, Key)
+        try:
+            body = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError):
+            raise ObjectNotFound(Key) from None
+        return {'Body': body, 'ContentLength': os.fstat(body.fileno()).st_size}
+
+    def delete_object(self, *, Bucket, Key):
+        try:
+            os.unlink(self.get_path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+
+    def create_multipart_upload(self, *, Bucket, Key, ContentType=None,
+                                ContentEncoding=None):
+        path = self.get_path(Bucket, Key)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self.__get_part_directory(upload_id))
+        with self.__lock:
+            self.__multipart[upload_id] = path
+        return {'UploadId': upload_id}
+
+    def upload_part(self, *, Body, Bucket, Key, PartNumber, UploadId):
+        if UploadId not in self.__multipart:
+            raise ValueError("No multipart upload {}".format(UploadId))
+        part_path = os.path.join(self.__get_part_directory(UploadId),
+                                 str(PartNumber))
+        with open(part_path, 'wb') as part_file:
+            _copy_body(Body, part_file)
+        if isinstance(Body, (bytes, bytearray)):
+            etag = hashlib.md5(Body).hexdigest()
+        else:
+            etag = _md5(part_path)
+        return {'ETag': '"{}"'.format(etag)}
+
+    def complete_multipart_upload(self, *, Bucket, Key, MultipartUpload,
+                                  UploadId):
+        with self.__lock:
+            path = self.__multipart.pop(UploadId)
+        part_directory = self.__get_part_directory(UploadId)
+
+        def write_parts(output):
+            for part in MultipartUpload['Parts']:
+                part_path = os.path.join(part_directory,
+                                         str(part['PartNumber']))
+                with open(part_path, 'rb') as part_file:
+                    _copy_body(part_file, output)
+
+        self._write_file(path, write_parts)
+        shutil.rmtree(part_directory)
+        return {'Key': Key}
+
+    def abort_multipart_upload(self, *, Bucket, Key, UploadId):
+        with self.__lock:
+            self.__multipart.pop(UploadId, None)
+        shutil.rmtree(self.__get_part_directory(UploadId),
+                      ignore_errors=True)
+
+    def _write_file(self, path, write):
+        """
+        Writes the file at the path by calling write with a binary file
+        object for a temporary file, which is renamed to the path once
+        written.
+        """
+        directory, name = os.path.split(path)
+        self.__make_directory(directory)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory,
+                                             prefix=".{}.".format(name))
+        except FileNotFoundError:
+            # the directory was removed since it was made
+            with self.__lock:
+                self.__directories.discard(directory)
+            self.__make_directory(directory)
+            fd, temp_path = tempfile.mkstemp(dir=directory,
+                                             prefix=".{}.".format(name))
+        try:
+            with open(fd, 'wb') as output:
+                write(output)
+                output.flush()
+                if self.fsync:
+                    os.fsync(output.fileno())
+                os.fchmod(output.fileno(), self.__mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        logging.debug("Wrote %s", path)
+
+    def __make_directory(self, directory):
+        if directory in self.__directories:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self.__lock:
+            self.__directories.add(directory)
+
+    def __get_part_directory(self, upload_id):
+        return os.path.join(self.root_dir, MULTIPART_DIRECTORY, upload_id)
+
+
+def _copy_body(body, output):
+    """
+    Writes the body, which is bytes, a string, or a binary file object read
+    from its current position, to the output file object.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        output.write(body)
+        return
+
+    source_fd = _get_fileno(body)
+    if source_fd is not None and hasattr(os, 'sendfile'):
+        output.flush()
+        offset = body.tell()
+        end = os.fstat(source_fd).st_size
+        while offset < end:
+            sent = os.sendfile(output.fileno(), source_fd, offset,
+                               end - offset)
+            if sent == 0:
+                break
+            offset += sent
+        body.seek(offset)
+        # sendfile writes at the descriptor offset, past the buffer
+        output.seek(0, io.SEEK_END)
+        return
+
+    shutil.copyfileobj(body, output, COPY_SIZE)
+
+
+def _get_fileno(body):
+    """
+    Returns the file descriptor of the body if it is a regular file opened
+    for reading, or None otherwise.
+    """
+    if not isinstance(body, (io.BufferedReader, io.FileIO)):
+        return None
+    try:
+        fd = body.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+    except (OSError, ValueError):
+        return None
+    return fd
+
+
+def _md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as part_file:
+        for block in iter(lambda: part_file.read(COPY_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
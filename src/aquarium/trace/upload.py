@@ -1,12 +1,143 @@
+import gzip
 import hashlib
+import itertools
 import json
 import logging
+import lzma
 import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 
 from aquarium.provenance import (FileEntity, FileTypes,
                                  JobActivity, OperationActivity,
                                  ProvenanceTrace)
-from typing import List, Union
+from aquarium.trace import blobs, dump, jsonl, normalize, shard
+from aquarium.trace.cache import UploadCache
+from aquarium.trace.journal import UploadJournal
+from aquarium.trace.store import LocalObjectStore
+from typing import List, Optional, Union
+
+# dumps larger than this are spooled to a temporary file
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# subdirectory of the basepath for the shards of a sharded provenance dump
+SHARD_DIRECTORY = 'provenance'
+
+# number of shards written at once
+SHARD_WORKERS = 4
+
+# default numbers of files downloaded from Aquarium and put to the object
+# store at once
+DOWNLOAD_WORKERS = 4
+UPLOAD_WORKERS = 4
+
+# files are read, hashed and put in chunks of this size, so that this bounds
+# the memory used for each file
+# larger files are put with multipart uploads, where S3 requires parts other
+# than the last to be at least MIN_PART_SIZE
+CHUNK_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# default number of threads that hash files, and the size of the smallest
+# file hashed by them rather than by the thread reading the file
+HASH_WORKERS = 2
+HASH_THRESHOLD = 4 * CHUNK_SIZE
+
+# layouts of the provenance dump, where the legacy layout is that of
+# ProvenanceTrace.as_dict
+LAYOUTS = ['legacy', normalize.LAYOUT, 'jsonl']
+
+# content encoding and filename suffix for each compression of JSON objects
+COMPRESSION = {
+    'gzip': ('gzip', '.gz'),
+    'lzma': ('xz', '.xz')
+}
+
+
+@dataclass
+class ActivityReport:
+    """
+    The outcome of uploading the files of an activity to its directory.
+
+    The bytes are those of the files put to the object store, so files that
+    were not put, because their blobs exist or the journal records them,
+    count as zero.
+    The time is from scheduling the first file of the activity until its
+    manifest is written or the upload fails.
+    """
+    path: str
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[Exception] = field(default=None, repr=False)
+
+
+@dataclass
+class UploadReport:
+    """
+    The outcome of UploadManager.upload_all.
+    """
+    activities: List[ActivityReport]
+    provenance_seconds: float = 0.0
+    seconds: float = 0.0
+
+    @property
+    def bytes(self):
+        return sum(activity.bytes for activity in self.activities)
+
+    @property
+    def failed(self) -> List[ActivityReport]:
+        return [activity for activity in self.activities
+                if activity.error is not None]
+
+
+class ChunkHasher:
+    """
+    Computes the SHA-256 hash of chunks on an executor, so that hashing a
+    chunk overlaps with reading and putting the next.
+
+    Chunks are hashed in order, since each update waits for the previous
+    one, which also keeps at most one chunk waiting to be hashed.
+    hashlib releases the GIL while hashing large buffers, so hashing on
+    threads runs in parallel with other threads, without copying chunks to
+    other processes.
+    """
+
+    def __init__(self, executor):
+        self.__executor = executor
+        self.__hash = hashlib.sha256()
+        self.__future = None
+
+    def update(self, data):
+        if self.__future is not None:
+            self.__future.result()
+        self.__future = self.__executor.submit(self.__hash.update, data)
+
+    def hexdigest(self) -> str:
+        if self.__future is not None:
+            self.__future.result()
+        return self.__hash.hexdigest()
+
+
+class InlineExecutor(Executor):
+    """
+    An executor that calls each function as it is submitted, on the thread
+    that submits it, and returns a future that is already done.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return future
 
 
 class UploadManager:
@@ -17,14 +148,133 @@ class UploadManager:
         self.basepath = None
         self.bucket = None
         self.s3 = None
+        self.compression = None
+        self.layout = 'legacy'
+        self.download_workers = DOWNLOAD_WORKERS
+        self.upload_workers = UPLOAD_WORKERS
+        self.chunk_size = CHUNK_SIZE
+        self.hash_workers = HASH_WORKERS
+        self.hash_threshold = HASH_THRESHOLD
+        self.content_addressed = False
+        self.blob_path = blobs.BLOB_PATH
+        self.blob_index = blobs.BlobIndex()
+        self.journal = None
+        self.cache = None
+        self.__executors = dict()  # name -> (executor, number of workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down the threads the manager keeps for uploads, waiting for
+        them to finish.
+        The manager makes new threads if it uploads again.
+        """
+        # shut down in this order, so that downloads finish before the
+        # executors they submit to
+        for name in ['downloads', 'hashes', 'uploads', 'shards']:
+            executor, _ = self.__executors.pop(name, (None, None))
+            if executor is not None:
+                executor.shutdown()
+
+    def configure(self, *, s3=None, bucket=None, basepath=None,
+                  compression=None, layout=None,
+                  download_workers=None, upload_workers=None,
+                  chunk_size=None, hash_workers=None, hash_threshold=None,
+                  content_addressed=None, blob_path=None,
+                  blob_index: blobs.BlobIndex = None,
+                  journal: UploadJournal = None,
+                  cache: UploadCache = None):
+        """
+        Sets the object store, bucket and base path for uploads.
+        The object store is called from several threads, so an S3 client
+        should be wrapped in a RetryingClient (see aquarium.trace.client),
+        which also retries requests that fail with transient errors.
+
+        The compression is one of the keys of COMPRESSION, and if set, the
+        provenance dump and manifests are compressed as they are written.
+        A compressed object has the suffix of the compression added to its
+        name, and its ContentEncoding set.
+
+        The layout is one of LAYOUTS.
+        The normalized layout (see aquarium.trace.normalize) is written
+        without indentation, and the jsonl layout (see aquarium.trace.jsonl)
+        is written to files with the .jsonl extension.
+
+        The numbers of workers limit the files downloaded from Aquarium and
+        put to the object store at once (see upload_activities), and the
+        chunk size is the size in bytes of the chunks files are transferred
+        in, which must be at least MIN_PART_SIZE since the chunks are the
+        parts of multipart uploads.
+        Setting download_workers to 0 transfers the files one at a time on
+        the calling thread, which also puts them, so upload_workers has no
+        effect.
+        Files of at least hash_threshold bytes are hashed by hash_workers
+        threads while they are transferred, and setting hash_workers to 0
+        hashes all files on the threads that read them.
+
+        If content_addressed is set, each file is put once as a blob under
+        blob_path, named by its checksum (see aquarium.trace.blobs), and the
+        upload manifests refer to the blobs.
+        A file is not put if the blob index has its checksum, or the object
+        store has its blob.
+        Giving a BlobIndex with a path keeps the index across runs.
 
-    def configure(self, *, s3=None, bucket=None, basepath=None):
+        With an UploadJournal (see aquarium.trace.journal), the files and
+        manifests put are recorded in the journal, and those already
+        recorded are skipped, so that an interrupted run can be resumed.
+
+        With an UploadCache (see aquarium.trace.cache), the contents of files
+        are read through the cache, so that files already read by an earlier
+        export are not downloaded from Aquarium again.
+        """
         if s3:
             self.s3 = s3
         if bucket:
             self.bucket = bucket
         if basepath:
             self.basepath = basepath
+        if compression:
+            if compression not in COMPRESSION:
+                raise ValueError(
+                    "Unknown compression {}".format(compression))
+            self.compression = compression
+        if layout:
+            if layout not in LAYOUTS:
+                raise ValueError("Unknown layout {}".format(layout))
+            self.layout = layout
+        for name, value, minimum in [
+                ('download_workers', download_workers, 0),
+                ('upload_workers', upload_workers, 1),
+                ('chunk_size', chunk_size, MIN_PART_SIZE)]:
+            if value is None:
+                continue
+            if value < minimum:
+                raise ValueError("{} must be at least {}, not {}".format(
+                    name, minimum, value))
+            setattr(self, name, value)
+        for name, value in [('hash_workers', hash_workers),
+                            ('hash_threshold', hash_threshold)]:
+            if value is None:
+                continue
+            if value < 0:
+                raise ValueError(
+                    "{} must not be negative, not {}".format(name, value))
+            setattr(self, name, value)
+        if content_addressed is not None:
+            self.content_addressed = content_addressed
+        if blob_path:
+            self.blob_path = blob_path
+        if blob_index is not None:
+            self.blob_index = blob_index
+        if journal is not None:
+            self.journal = journal
+        if cache is not None:
+            self.cache = cache
 
     def upload(self, *, activity: Union[OperationActivity, JobActivity]):
         """
@@ -32,65 +282,550 @@ class UploadManager:
         subdirectory named after the activity_id.
         Adds a manifest file to the subdirectory that includes the file name,
         size and sha256 checksum.
+        In the content-addressed mode, the files are instead put as blobs,
+        and the manifest also includes the key of the blob of each file.
 
         Does not upload the provenance.
         """
-        activity_id = activity.get_activity_id()
-        file_list = self.trace.get_files(generator=activity)
-        if not file_list:
-            logging.debug("No files for generator %s", activity_id)
-            return
+        self.upload_activities(activities=[activity])
+
+    def upload_all(self, *, sharded=False,
+                   workers=SHARD_WORKERS) -> UploadReport:
+        """
+        Uploads the files of all activities of the trace, followed by the
+        provenance, and returns the report of the upload.
+
+        The files are grouped by generator in one pass over the files of the
+        trace, and uploaded as by upload_activities, so the report has an
+        entry for each activity with files stored in Aquarium.
+        The provenance is uploaded as by upload_provenance once all files
+        have been uploaded, so that it includes their checksums.
+        If any activity fails, the provenance is not uploaded, and the first
+        error is raised.
+        The provenance is also not uploaded if a file has no checksum, such
+        as one skipped on resume without a journal record, and RuntimeError
+        is raised.
+        """
+        start = time.perf_counter()
+        directories = OrderedDict()  # activity ID -> (path, files)
+        for file_entity in self.trace.files.values():
+            if file_entity.generator is None or file_entity.is_external():
+                continue
+            activity_id = file_entity.generator.get_activity_id()
+            if activity_id not in directories:
+                directories[activity_id] = (
+                    os.path.join(self.basepath, activity_id), list())
+            directories[activity_id][1].append(file_entity)
+        report = UploadReport(
+            activities=self._upload_directories(list(directories.values())))
+        self._raise_failure(report.activities)
+        missing = [file_entity.name
+                   for _, file_list in directories.values()
+                   for file_entity in file_list
+                   if file_entity.check_sum is None]
+        if missing:
+            raise RuntimeError(
+                "Not uploading provenance, no checksum for {}".format(
+                    ', '.join(missing)))
+
+        provenance_start = time.perf_counter()
+        self.upload_provenance(sharded=sharded, workers=workers)
+        end = time.perf_counter()
+        report.provenance_seconds = end - provenance_start
+        report.seconds = end - start
+        logging.info("Uploaded %s bytes for %s activities in %.1fs",
+                     report.bytes, len(report.activities), report.seconds)
+        return report
 
-        dest_path = os.path.join(self.basepath, activity_id)
-        self._upload_directory(path=dest_path, file_list=file_list)
+    def upload_activities(self, *,
+                          activities: List[Union[OperationActivity,
+                                                 JobActivity]]):
+        """
+        Uploads the files generated by each of the activities as by upload,
+        overlapping the transfers of files across activities.
 
-    def upload_provenance(self):
+        Files are downloaded from Aquarium and hashed by download_workers
+        threads, and put to the object store by upload_workers threads.
+        The threads are kept for later uploads until the manager is closed.
+        Each file is read in chunks of chunk_size bytes, and a file larger
+        than one chunk is put with a multipart upload as it is read, so at
+        most download_workers + upload_workers chunks are held in memory at
+        once.
+        The manifest for an activity is written only once all of its files
+        have been put.
+        If any file fails, the manifests of the other activities are still
+        written, and the first error is raised once all transfers finish.
+
+        Returns the report for each activity with files.
+        Does not upload the provenance.
+        """
+        directories = list()
+        for activity in activities:
+            activity_id = activity.get_activity_id()
+            file_list = self.trace.get_files(generator=activity)
+            if not file_list:
+                logging.debug("No files for generator %s", activity_id)
+                continue
+            directories.append(
+                (os.path.join(self.basepath, activity_id), file_list))
+        reports = self._upload_directories(directories)
+        self._raise_failure(reports)
+        return reports
+
+    def upload_provenance(self, *, sharded=False, workers=SHARD_WORKERS):
         """
         Uploads the provenance stored in this manager.
+
+        By default, the provenance is written as provenance_dump.json.
+        If sharded is set, the provenance is instead written as one shard per
+        plan in the provenance subdirectory, and a provenance_manifest.json
+        listing the shards (see aquarium.trace.shard).
+        The shards are written concurrently by the given number of workers,
+        and the manifest is written after all shards have been written.
         """
-        self._put_provenance(path=self.basepath, trace=self.trace)
+        if not sharded:
+            self._put_provenance(path=self.basepath, trace=self.trace)
+            return
+
+        # the manifest lists the shards with the suffix of the compression,
+        # which _put_json adds to the filenames
+        manifest, shards = shard.shard_trace(
+            self.trace,
+            extension=self._get_dump_extension() + self._get_suffix())
+        shard_path = os.path.join(self.basepath, SHARD_DIRECTORY)
+        executor = self._get_executor('shards', workers)
+        futures = [
+            executor.submit(self._put_dump,
+                            path=shard_path,
+                            filename=shard.get_shard_filename(
+                                entry['name'],
+                                extension=self._get_dump_extension()),
+                            fields=shards[entry['name']])
+            for entry in manifest['shards']
+        ]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+        self._put_json(path=self.basepath,
+                       filename='provenance_manifest.json',
+                       chunks=[json.dumps(manifest, indent=2)])
 
     def _upload_directory(self, *, path, file_list: List[FileEntity]):
         """
         Uploads the files in the file list along with a manifest to the given
         path.
         """
-        files = list()
+        self._raise_failure(self._upload_directories([(path, file_list)]))
+
+    def _get_executor(self, name, workers) -> ThreadPoolExecutor:
+        """
+        Returns the executor with the name, which is made with the number of
+        workers the first time, or when the number has changed.
+
+        Executors are kept until the manager is closed, so that later
+        uploads, such as those retrying a failed upload, reuse their threads
+        and the object store clients a RetryingClient made for the threads.
+        """
+        executor, executor_workers = self.__executors.get(name, (None, None))
+        if executor is None or executor_workers != workers:
+            if executor is not None:
+                executor.shutdown()
+            executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="UploadManager-{}".format(name))
+            self.__executors[name] = (executor, workers)
+        return executor
+
+    @staticmethod
+    def _raise_failure(reports: List[ActivityReport]):
+        for report in reports:
+            if report.error is not None:
+                raise report.error
+
+    def _upload_directories(self, directories) -> List[ActivityReport]:
+        """
+        Uploads the files of each path and file list pair, followed by a
+        manifest for the path once all of its files are uploaded.
+        Returns the report for each path, which holds the error if the
+        upload failed.
+        """
+        pending = threading.BoundedSemaphore(
+            self.download_workers + self.upload_workers)
+        putting = threading.BoundedSemaphore(self.upload_workers)
+        reports = list()
+        if self.download_workers:
+            downloads = self._get_executor('downloads',
+                                           self.download_workers)
+            uploads = self._get_executor('uploads', self.upload_workers)
+        else:
+            downloads = uploads = InlineExecutor()
+        hashes = None
+        if self.hash_workers:
+            hashes = self._get_executor('hashes', self.hash_workers)
+        submitted = list()  # (report, start, [(file, future)])
+        try:
+            for path, file_list in directories:
+                report = ActivityReport(path=path)
+                reports.append(report)
+                if self.journal is not None and \
+                        self.journal.has_manifest(activity=path):
+                    logging.info("Skipping %s, recorded in the journal",
+                                 path)
+                    self._restore_check_sums(path=path, file_list=file_list)
+                    continue
+                start = time.perf_counter()
+                futures = list()
+                submitted.append((report, start, futures))
+                for file_entity in file_list:
+                    if file_entity.is_external():
+                        continue
+                    if self._is_journaled(path=path,
+                                          file_entity=file_entity):
+                        futures.append((file_entity, None))
+                        continue
+                    pending.acquire()  # released once the put finishes
+                    futures.append((file_entity, downloads.submit(
+                        self._transfer_file, path=path,
+                        file_entity=file_entity,
+                        uploads=uploads, hashes=hashes,
+                        pending=pending, putting=putting)))
+
+            for report, start, futures in submitted:
+                report.files = len(futures)
+                try:
+                    report.bytes = self._put_manifest(path=report.path,
+                                                      futures=futures)
+                except Exception as error:
+                    logging.error("Not writing manifest for %s: %s",
+                                  report.path, error)
+                    report.error = error
+                report.seconds = time.perf_counter() - start
+        finally:
+            self._wait_transfers(submitted)
+        return reports
+
+    @staticmethod
+    def _wait_transfers(submitted):
+        """
+        Waits for all submitted transfers, including those of activities
+        that failed, so that none is running once the upload returns.
+        """
+        futures = [future
+                   for _, _, file_futures in submitted
+                   for _, future in file_futures
+                   if future is not None]
+        wait(futures)
+        wait([future.result() for future in futures
+              if future.exception() is None])
+
+    def _put_manifest(self, *, path, futures):
+        """
+        Waits for the transfers of the files with the futures, and writes the
+        manifest for the files if there are any.
+        A file with no future was put by an earlier run.
+        Returns the number of bytes put for the files, and raises the error
+        of the first transfer that failed.
+
+        With a journal, the manifest lists the files recorded in the journal
+        in the order of their names, and is recorded in the journal once
+        written.
+        """
+        put_bytes = 0
+        for _, future in futures:
+            if future is not None:
+                put_bytes += future.result().result()
+        if not futures:
+            return put_bytes
+
+        if self.journal is None:
+            records = [{'name': file_entity.name,
+                        'size': file_entity.size,
+                        'sha256': file_entity.check_sum}
+                       for file_entity, _ in futures]
+        else:
+            records = self.journal.get_files(activity=path)
+        files = [self._get_manifest_entry(name=record['name'],
+                                          size=record['size'],
+                                          sha256=record['sha256'])
+                 for record in records]
+        key = self._put_json(path=path,
+                             filename='upload_manifest.json',
+                             chunks=[json.dumps(files, indent=2)])
+        if self.journal is not None:
+            self.journal.record_manifest(activity=path, key=key)
+        return put_bytes
+
+    def _get_manifest_entry(self, *, name, size, sha256):
+        entry = {
+            'name': name,
+            'size': size,
+            'sha256': sha256
+        }
+        if self.content_addressed:
+            entry['blob'] = blobs.get_blob_key(sha256,
+                                               blob_path=self.blob_path)
+        return entry
+
+    def _is_journaled(self, *, path, file_entity: FileEntity) -> bool:
+        """
+        Indicates whether the journal records the file as put for the path,
+        and if so, sets the checksum of the file from the journal.
+        """
+        if self.journal is None:
+            return False
+        record = self.journal.get_file(activity=path,
+                                       upload_id=file_entity.upload_id)
+        if record is None:
+            return False
+        logging.debug("Skipping %s, recorded in the journal",
+                      file_entity.name)
+        file_entity.check_sum = record['sha256']
+        return True
+
+    def _restore_check_sums(self, *, path, file_list: List[FileEntity]):
+        """
+        Sets the checksums of the files from the journal, for an activity
+        path with a manifest recorded by an earlier run, so that the
+        provenance includes them.
+        """
+        records = {record['upload_id']: record
+                   for record in self.journal.get_files(activity=path)}
         for file_entity in file_list:
             if file_entity.is_external():
                 continue
+            record = records.get(str(file_entity.upload_id))
+            if record is None:
+                logging.warning("No journal record for %s in %s",
+                                file_entity.name, path)
+                continue
+            file_entity.check_sum = record['sha256']
 
+    def _record_transfer(self, *, path, file_entity: FileEntity):
+        if self.content_addressed:
+            key = blobs.get_blob_key(file_entity.check_sum,
+                                     blob_path=self.blob_path)
+        else:
+            key = os.path.join(path, file_entity.name)
+        self.journal.record_file(activity=path,
+                                 upload_id=file_entity.upload_id,
+                                 name=file_entity.name,
+                                 size=file_entity.size,
+                                 sha256=file_entity.check_sum,
+                                 key=key)
+
+    def _transfer_file(self, *, path, file_entity: FileEntity,
+                       uploads, hashes, pending, putting):
+        """
+        Reads and hashes the file in chunks, and puts it to the object store,
+        or as a blob in the content-addressed mode.
+
+        Returns a future for the transfer, which is done once the put has
+        finished and, with a journal, the file has been recorded in it, so
+        that the manifest of the activity includes the file.
+        The pending semaphore is released when the put finishes, and each
+        put to the object store holds the putting semaphore.
+        Files of at least hash_threshold bytes are hashed by the hashes
+        executor if there is one (see ChunkHasher).
+        """
+        try:
             logging.debug("Uploading %s", file_entity.name)
             content_type = self._get_content_type(file_entity)
+            if hashes is not None and \
+                    (file_entity.size or 0) >= self.hash_threshold:
+                hash_sha = ChunkHasher(hashes)
+            else:
+                hash_sha = hashlib.sha256()
+            chunks = self._read_chunks(file_entity, hash_sha)
+            if self.content_addressed:
+                future = self._transfer_blob(
+                    file_entity=file_entity, chunks=chunks,
+                    hash_sha=hash_sha, content_type=content_type,
+                    uploads=uploads, putting=putting)
+            else:
+                future = self._put_chunks(
+                    path=path, filename=file_entity.name, chunks=chunks,
+                    content_type=content_type,
+                    uploads=uploads, putting=putting)
+                file_entity.check_sum = str(hash_sha.hexdigest())
+        except BaseException:
+            pending.release()
+            raise
+        transfer = Future()
+
+        def finish(put):
+            pending.release()
             try:
-                file_object = file_entity.upload.data
-            except ConnectionError:
-                logging.error(
-                    "Upload of file %s (%s) failed due to closed connection",
-                    file_entity.id, file_entity.name
-                )
-                raise
-            hash_sha = hashlib.sha256()
-            hash_sha.update(file_object)
-            file_entity.check_sum = str(hash_sha.hexdigest())
-            self._put_object(path=path,
-                             filename=file_entity.name,
-                             file_object=file_object,
-                             content_type=content_type)
-            files.append({
-                'name': file_entity.name,
-                'size': file_entity.size,
-                'sha256': file_entity.check_sum
-            })
-
-        if not files:
-            return
+                put_bytes = put.result()
+                if self.journal is not None:
+                    self._record_transfer(path=path, file_entity=file_entity)
+            except BaseException as error:
+                transfer.set_exception(error)
+            else:
+                transfer.set_result(put_bytes)
+
+        future.add_done_callback(finish)
+        return transfer
+
+    def _transfer_blob(self, *, file_entity: FileEntity, chunks, hash_sha,
+                       content_type, uploads, putting):
+        """
+        Reads the file to a spooled temporary file while hashing it, and puts
+        it as the blob for its checksum unless the blob already exists.
+        """
+        with tempfile.SpooledTemporaryFile(
+                max_size=self.chunk_size) as blob_file:
+            for chunk in chunks:
+                blob_file.write(chunk)
+            check_sum = str(hash_sha.hexdigest())
+            file_entity.check_sum = check_sum
+            if self._has_blob(check_sum):
+                logging.debug("Blob for %s exists", file_entity.name)
+                future = Future()
+                future.set_result(0)
+                return future
+
+            blob_file.seek(0)
+            future = self._put_chunks(
+                path=blobs.get_blob_path(check_sum, blob_path=self.blob_path),
+                filename=check_sum,
+                chunks=iter(lambda: blob_file.read(self.chunk_size), b''),
+                content_type=content_type,
+                uploads=uploads, putting=putting)
+
+        def add_to_index(done):
+            if done.exception() is None:
+                self.blob_index.add(check_sum)
+
+        future.add_done_callback(add_to_index)
+        return future
+
+    def _has_blob(self, check_sum) -> bool:
+        """
+        Indicates whether the blob for the checksum is in the object store,
+        checking the blob index before the object store.
+        """
+        if check_sum in self.blob_index:
+            return True
+        try:
+            self.s3.head_object(
+                Bucket=self.bucket,
+                Key=blobs.get_blob_key(check_sum, blob_path=self.blob_path))
+        except Exception as error:
+            if blobs.is_not_found(error):
+                return False
+            raise
+        self.blob_index.add(check_sum)
+        return True
+
+    def _put_chunks(self, *, path, filename, chunks, content_type,
+                    uploads, putting) -> Future:
+        """
+        Puts the chunks as one object.
+
+        If there is at most one chunk, the object is put by the uploads
+        executor, and the returned future is that of the put.
+        Otherwise, the object is put with a multipart upload from this thread
+        as the chunks are read, and the returned future is already done.
+        The result of the future is the number of bytes put.
+        """
+        first_chunk = next(chunks, b'')
+        second_chunk = next(chunks, None)
+        if second_chunk is None:
+            return uploads.submit(
+                self._put_limited, putting,
+                path=path,
+                filename=filename,
+                file_object=first_chunk,
+                content_type=content_type)
+
+        put_bytes = self._put_multipart(
+            path=path,
+            filename=filename,
+            chunks=itertools.chain([first_chunk, second_chunk], chunks),
+            content_type=content_type,
+            putting=putting)
+        future = Future()
+        future.set_result(put_bytes)
+        return future
+
+    def _read_chunks(self, file_entity: FileEntity, hash_sha):
+        """
+        Returns an iterator over the contents of the file in chunks of
+        chunk_size bytes, where only the last may be shorter, and updates the
+        hash with each chunk as it is read.
+        The contents are read through the cache if there is one.
+        """
+        if self.cache is not None:
+            data_chunks = self.cache.iter_data(
+                file_entity.upload, chunk_size=self.chunk_size,
+                sha256=file_entity.check_sum)
+        else:
+            data_chunks = file_entity.upload.iter_data(
+                chunk_size=self.chunk_size)
+        buffer = bytearray()
+        try:
+            for data in data_chunks:
+                hash_sha.update(data)
+                buffer += data
+                while len(buffer) >= self.chunk_size:
+                    chunk = bytes(buffer[:self.chunk_size])
+                    del buffer[:self.chunk_size]
+                    yield chunk
+        except OSError as error:
+            # includes ConnectionError, and the errors of requests for a
+            # stalled or closed download
+            logging.error(
+                "Upload of file %s (%s) failed due to closed connection: %s",
+                file_entity.id, file_entity.name, error
+            )
+            raise
+        if buffer:
+            yield bytes(buffer)
 
-        self._put_object(path=path,
-                         filename='upload_manifest.json',
-                         file_object=json.dumps(files, indent=2),
-                         content_type="application/json"
-                         )
+    def _put_limited(self, putting, **args):
+        with putting:
+            self._put_object(**args)
+        return len(args['file_object'])
+
+    def _put_multipart(self, *, path, filename, chunks, content_type,
+                       putting):
+        """
+        Puts the chunks as the parts of a multipart upload, and aborts the
+        upload if any part fails.
+        Returns the number of bytes put.
+        """
+        key_path = os.path.join(path, filename)
+        logging.info("multipart upload %s to %s", key_path, self.bucket)
+        response = self.s3.create_multipart_upload(
+            Bucket=self.bucket, ContentType=content_type, Key=key_path)
+        upload_id = response['UploadId']
+        parts = list()
+        put_bytes = 0
+        try:
+            for number, chunk in enumerate(chunks, start=1):
+                with putting:
+                    response = self.s3.upload_part(
+                        Body=chunk,
+                        Bucket=self.bucket,
+                        Key=key_path,
+                        PartNumber=number,
+                        UploadId=upload_id
+                    )
+                parts.append({'ETag': response['ETag'], 'PartNumber': number})
+                put_bytes += len(chunk)
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key_path,
+                MultipartUpload={'Parts': parts},
+                UploadId=upload_id
+            )
+        except BaseException:
+            logging.error("Aborting multipart upload of %s", key_path)
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=key_path, UploadId=upload_id)
+            raise
+        return put_bytes
 
     def _get_content_type(self, file_entity: FileEntity) -> str:
         content_type = file_entity.upload.upload_content_type
@@ -101,40 +836,147 @@ class UploadManager:
         return content_type
 
     def _put_object(self, *, path, filename: str,
-                    file_object, content_type: str):
+                    file_object, content_type: str, content_encoding=None):
         key_path = os.path.join(path, filename)
         logging.info("upload %s to %s", key_path, self.bucket)
+        args = dict()
+        if content_encoding:
+            args['ContentEncoding'] = content_encoding
         self.s3.put_object(
             Body=file_object,
             Bucket=self.bucket,
             ContentType=content_type,
-            Key=key_path
+            Key=key_path,
+            **args
         )
 
     def _put_provenance(self, *, path, trace: ProvenanceTrace):
-        self._put_object(
-            path=path,
-            filename='provenance_dump.json',
-            file_object=str(json.dumps(trace.as_dict(), indent=2)),
-            content_type='application/json'
-        )
+        """
+        Uploads the provenance dump of the trace as provenance_dump.json.
+        """
+        self._put_dump(path=path,
+                       filename='provenance_dump' + self._get_dump_extension(),
+                       fields=trace.dump_fields())
 
+    def _get_dump_extension(self):
+        if self.layout == 'jsonl':
+            return '.jsonl'
+        return '.json'
 
-class S3DumpProxy:
+    def _get_suffix(self):
+        """
+        Returns the suffix added to the names of compressed objects, or the
+        empty string if compression is not configured.
+        """
+        if not self.compression:
+            return ''
+        return COMPRESSION[self.compression][1]
 
-    def __init__(self, root_dir):
-        self.root_dir = root_dir
-
-    def put_object(self, *, Body, Bucket, ContentType, Key):
-        # make directory root_dir/Bucket/Key minus file name
-        # write Body to
-        path = os.path.join(*[self.root_dir, Bucket, Key])
-        directory_path = os.path.join(*(str.split(path, os.sep)[:-1]))
-        if ContentType == 'application/json':
-            output = Body
+    def _put_dump(self, *, path, filename, fields):
+        """
+        Uploads the dump of the fields in the configured layout, encoding it
+        incrementally.
+        """
+        content_type = 'application/json'
+        if self.layout == normalize.LAYOUT:
+            chunks = dump.iterencode_fields(
+                normalize.normalize_fields(fields), compact=True)
+        elif self.layout == 'jsonl':
+            chunks = jsonl.iterencode_fields(fields)
+            content_type = jsonl.CONTENT_TYPE
         else:
-            output = "would write file to {}".format(path)
-        if not os.path.exists(directory_path):
-            os.makedirs(directory_path)
-        with open(path, 'w') as file:
-            file.write(output)
+            chunks = dump.iterencode_fields(fields)
+        self._put_json(path=path, filename=filename, chunks=chunks,
+                       content_type=content_type)
+
+    def _put_json(self, *, path, filename, chunks,
+                  content_type='application/json'):
+        """
+        Writes the chunks of a JSON document to a spooled temporary file,
+        compressing them as they are written if compression is configured,
+        and passes the file to the object store.
+        Returns the key of the object.
+        """
+        content_encoding = None
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as json_file:
+            if self.compression:
+                content_encoding, suffix = COMPRESSION[self.compression]
+                filename += suffix
+                output = self._open_compressed(json_file)
+            else:
+                output = json_file
+            for chunk in chunks:
+                output.write(chunk.encode('utf-8'))
+            if output is not json_file:
+                output.close()  # flushes without closing json_file
+
+            json_file.seek(0)
+            self._put_object(
+                path=path,
+                filename=filename,
+                file_object=json_file,
+                content_type=content_type,
+                content_encoding=content_encoding
+            )
+        return os.path.join(path, filename)
+
+    def _open_compressed(self, file_object):
+        """
+        Returns a binary file object that writes to the file object with the
+        configured compression.
+        """
+        if self.compression == 'gzip':
+            # mtime is fixed so that equal dumps compress to equal objects
+            return gzip.GzipFile(fileobj=file_object, mode='wb',
+                                 compresslevel=6, mtime=0)
+        return lzma.LZMAFile(file_object, mode='wb')
+
+
+class S3DumpProxy(LocalObjectStore):
+    """
+    A local stand-in for the S3 client that writes objects under root_dir
+    (see LocalObjectStore).
+
+    JSON objects are written as is, and other objects are replaced by a line
+    naming the path they would be written to, so that a dry run does not
+    copy data files.
+    Use LocalObjectStore to write data files too.
+    """
+
+    def __init__(self, root_dir):
+        super().__init__(root_dir)
+        self.__content_types = dict()  # upload ID -> content type
+
+    def put_object(self, *, Body, Bucket, ContentType, Key,
+                   ContentEncoding=None):
+        if not self.__is_written(ContentType):
+            Body = self.__placeholder(self.get_path(Bucket, Key))
+        return super().put_object(Body=Body, Bucket=Bucket, Key=Key,
+                                  ContentType=ContentType,
+                                  ContentEncoding=ContentEncoding)
+
+    def create_multipart_upload(self, *, Bucket, ContentType, Key,
+                                ContentEncoding=None):
+        response = super().create_multipart_upload(Bucket=Bucket, Key=Key)
+        self.__content_types[response['UploadId']] = ContentType
+        return response
+
+    def complete_multipart_upload(self, *, Bucket, Key, MultipartUpload,
+                                  UploadId):
+        content_type = self.__content_types.pop(UploadId, None)
+        if self.__is_written(content_type):
+            return super().complete_multipart_upload(
+                Bucket=Bucket, Key=Key, MultipartUpload=MultipartUpload,
+                UploadId=UploadId)
+        self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=UploadId)
+        self.put_object(Body=b'', Bucket=Bucket, ContentType=content_type,
+                        Key=Key)
+        return {'Key': Key}
+
+    @staticmethod
+    def __is_written(content_type):
+        return content_type in ['application/json', jsonl.CONTENT_TYPE]
+
+    @staticmethod
+    def __placeholder(path):
+        return "would write file to {}".format(path).encode('utf-8')
@@ -0,0 +1,102 @@
+import pytest
+from aquarium.provenance import (
+    CollectionEntity, ExternalFileEntity, FileEntity, ItemEntity,
+    JobActivity, OperationActivity, OperationItemPin, OperationParameter,
+    PartEntity, PlanActivity, ProvenanceTrace
+)
+from aquarium.records import (
+    ObjectTypeRecord, OperationTypeRecord, SampleRecord, UploadRecord
+)
+
+
+def build_trace(*, experiment_id='experiment1', wells=4):
+    """
+    Builds a small trace with a plan of two operations run in one job.
+    The first operation takes an item and produces a plate, the second
+    measures the plate and generates a file for each part.
+    """
+    trace = ProvenanceTrace(experiment_id=experiment_id)
+    trace.add_attribute({'lab': 'test lab'})
+
+    tube = ObjectTypeRecord(id=1, name='Yeast Glycerol Stock')
+    plate_type = ObjectTypeRecord(id=2, name='96 U-bottom Well Plate')
+    sample = SampleRecord(id=11, name='strain 11')
+    media = SampleRecord(id=12, name='media')
+    inoculate = OperationTypeRecord(id=21, name='Inoculate', category='Yeast')
+    measure = OperationTypeRecord(id=22, name='Measure', category='Cytometry')
+
+    op1 = OperationActivity(id=101, operation_type=inoculate)
+    op2 = OperationActivity(id=102, operation_type=measure)
+    trace.add_operation(op1)
+    trace.add_operation(op2)
+    op1.add_attribute({'temperature': '30:C'})
+
+    stock = ItemEntity(item_id=201, sample=sample, object_type=tube)
+    stock.add_attribute({'concentration': '1:uM'})
+    trace.add_item(stock)
+    plate = CollectionEntity(item_id=202, object_type=plate_type)
+    trace.add_item(plate)
+
+    op1.add_input(OperationItemPin(name='Stock', field_value_id=301,
+                                   item_entity=stock, routing_id='S'))
+    op1.add_input(OperationParameter(name='Volume', field_value_id=302,
+                                     value='100'))
+    op1.add_output(OperationItemPin(name='Plate', field_value_id=303,
+                                    item_entity=plate))
+    trace.add_input(stock.item_id, op1)
+    plate.add_generator(op1)
+    plate.add_source(stock)
+
+    op2.add_input(OperationItemPin(name='Plate', field_value_id=304,
+                                   item_entity=plate))
+    trace.add_input(plate.item_id, op2)
+
+    parts = list()
+    for index in range(wells):
+        well = "A{}".format(index + 1)
+        part = PartEntity(part_id=str(400 + index),
+                          part_ref="{}/{}".format(plate.item_id, well),
+                          sample=sample if index % 2 == 0 else media,
+                          collection=plate)
+        part.add_generator(op1)
+        part.add_source(stock)
+        part.add_attribute({'volume': '100:microliter', 'media': 'YPAD'})
+        trace.add_item(part)
+        parts.append(part)
+
+    plan = PlanActivity(id=501, name='test plan', operations=[op1, op2],
+                        status='done')
+    trace.add_plan(plan)
+    job = JobActivity(job=JobStub(601), operations=[op1, op2],
+                      start_time='2019-01-01T10:00:00',
+                      end_time='2019-01-01T11:00:00', status='done')
+    op1.start_time = op2.start_time = job.start_time
+    op1.end_time = op2.end_time = job.end_time
+    trace.add_job(job)
+
+    for index, part in enumerate(parts):
+        upload = UploadRecord(id=700 + index,
+                              name="{}.fcs".format(part.well),
+                              size=1000 + index,
+                              upload_content_type='application/octet-stream')
+        file_entity = FileEntity(upload=upload, job=job)
+        file_entity.add_generator(op2)
+        file_entity.add_source(part)
+        trace.add_file(file_entity)
+
+    summary = ExternalFileEntity(name='summary.csv')
+    summary.add_generator(job)
+    summary.add_source(plate)
+    trace.add_file(summary)
+
+    return trace
+
+
+class JobStub:
+    def __init__(self, id):
+        self.id = id
+
+
+@pytest.fixture
+def make_trace():
+    return build_trace
@@ -0,0 +1,64 @@
+import pytest
+from aquarium.trace.archive import TraceArchive, write_archive
+
+
+@pytest.fixture
+def archive(make_trace, tmp_path):
+    trace = make_trace()
+    path = str(tmp_path / 'trace.aqpa')
+    with open(path, 'wb') as archive_file:
+        write_archive(trace, archive_file)
+    with TraceArchive(path) as trace_archive:
+        yield trace, trace_archive
+
+
+class TestArchive:
+
+    def test_get_records(self, archive):
+        trace, trace_archive = archive
+        trace_dict = trace.as_dict()
+        for kind, id_key in [('operations', 'operation_id'),
+                             ('plans', 'plan_id'),
+                             ('jobs', 'job_id'),
+                             ('items', 'item_id'),
+                             ('files', 'id')]:
+            for record in trace_dict[kind]:
+                assert trace_archive.get(kind, record[id_key]) == record
+
+    def test_header(self, archive):
+        trace, trace_archive = archive
+        header = trace_archive.get_header()
+        assert header['experiment_id'] == 'experiment1'
+        assert header['attributes'] == {'lab': 'test lab'}
+
+    def test_missing(self, archive):
+        _, trace_archive = archive
+        assert trace_archive.get_item('999') is None
+        assert trace_archive.get_operation('400') is None
+
+    def test_get_upload(self, archive):
+        _, trace_archive = archive
+        record = trace_archive.get_upload('700')
+        assert record['sources'] == ['400']
+        assert trace_archive.get_file(record['id']) == record
+
+    def test_walk_lineage(self, archive):
+        _, trace_archive = archive
+        file_record = trace_archive.get_upload('700')
+        kind, generator = trace_archive.get_generator(file_record)
+        assert (kind, generator['operation_id']) == ('operations', '102')
+
+        lineage = [(kind, record.get('item_id', record.get('operation_id')))
+                   for kind, record
+                   in trace_archive.walk_lineage('uploads', '700')]
+        assert lineage[1:] == [('operations', '102'),
+                               ('items', '400'),
+                               ('items', '202'),
+                               ('operations', '101'),
+                               ('items', '201')]
+
+    def test_not_archive(self, tmp_path):
+        path = tmp_path / 'trace.json'
+        path.write_text('{"experiment_id": "experiment1", "items": []}')
+        with pytest.raises(ValueError):
+            TraceArchive(str(path))
@@ -0,0 +1,45 @@
+import io
+import json
+import pytest
+from aquarium.provenance import ProvenanceTrace
+from aquarium.trace import binary
+
+
+class TestBinary:
+
+    def test_round_trip(self, make_trace):
+        trace = make_trace()
+        loaded = binary.loads(binary.dumps(trace))
+        assert loaded == trace
+        assert loaded.as_dict() == trace.as_dict()
+
+    def test_file_round_trip(self, make_trace):
+        trace = make_trace()
+        output = io.BytesIO()
+        binary.dump(trace, output)
+        output.seek(0)
+        assert binary.load(output).fingerprint() == trace.fingerprint()
+
+    def test_read_dump(self, make_trace):
+        trace = make_trace()
+        expected = trace.as_dict()
+        del expected['inputs']
+        assert binary.read_dump(binary.dumps(trace)) == expected
+
+    def test_values(self):
+        trace = ProvenanceTrace(experiment_id='values')
+        attributes = {'negative': -300, 'ratio': 0.25, 'padded': '007',
+                      'name': 'café',
+                      'nested': {'values': [1, '2', None, False, True]}}
+        trace.add_attribute(attributes)
+        loaded = binary.read_dump(binary.dumps(trace))
+        assert loaded['attributes'] == attributes
+
+    def test_smaller_than_json(self, make_trace):
+        trace = make_trace(wells=96)
+        encoding = json.dumps(trace.as_dict(), indent=2).encode('utf-8')
+        assert len(binary.dumps(trace)) < len(encoding) / 2
+
+    def test_not_binary(self):
+        with pytest.raises(binary.BinaryFormatError):
+            binary.loads(b'{"experiment_id": null}')
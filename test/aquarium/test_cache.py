@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+
+import pytest
+from aquarium.records import ModelHandle, UploadRecord
+from aquarium.trace.cache import CacheError, UploadCache
+
+
+class UploadStub:
+    def __init__(self, data):
+        self.data = data
+
+
+class CountingInterface:
+    """
+    Stands in for session.Upload, and counts the uploads fetched.
+    """
+
+    def __init__(self):
+        self.fetched = list()
+
+    def find(self, id):
+        self.fetched.append(id)
+        return UploadStub(get_contents(id))
+
+
+def get_contents(id):
+    return bytes([id % 256]) * (id * 10)
+
+
+def make_upload(interface, id):
+    return UploadRecord(id=id, name="{}.fcs".format(id), size=id * 10,
+                        upload_content_type='application/octet-stream',
+                        handle=ModelHandle(interface=interface, id=id))
+
+
+class TestUploadCache:
+
+    def test_hit_after_miss(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path))
+        upload = make_upload(interface, 5)
+        assert cache.get_data(upload) == get_contents(5)
+        assert b''.join(cache.iter_data(upload, chunk_size=7)) == \
+            get_contents(5)
+        assert interface.fetched == [5]
+        stats = cache.stats
+        assert (stats.hits, stats.misses) == (1, 1)
+        assert stats.bytes_read == stats.bytes_fetched == 50
+        assert stats.hit_rate == 0.5
+
+    def test_lru_eviction(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path), max_bytes=80)
+        for id in [3, 4, 3, 2]:
+            cache.get_data(make_upload(interface, id))
+        assert 4 not in cache
+        assert 3 in cache and 2 in cache
+        assert cache.size == 50
+        assert cache.stats.evictions == 1
+
+    def test_persists_order(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path), max_bytes=80)
+        for id in [3, 4]:
+            cache.get_data(make_upload(interface, id))
+        os.utime(tmp_path / '3.data', (1, 1))
+        reopened = UploadCache(str(tmp_path), max_bytes=80)
+        assert len(reopened) == 2
+        reopened.get_data(make_upload(interface, 2))
+        assert 3 not in reopened and 4 in reopened
+
+    def test_large_upload_not_cached(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path), max_bytes=20)
+        cache.get_data(make_upload(interface, 5))
+        assert len(cache) == 0
+        assert not [name for name in os.listdir(tmp_path)]
+
+    def test_expected_checksum(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path))
+        upload = make_upload(interface, 5)
+        sha256 = hashlib.sha256(get_contents(5)).hexdigest()
+        cache.get_data(upload)
+        cache.get_data(upload, sha256=sha256)
+        assert interface.fetched == [5]
+        cache.get_data(upload, sha256='0' * 64)
+        assert interface.fetched == [5, 5]
+
+    def test_corrupt_entry(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path))
+        upload = make_upload(interface, 5)
+        cache.get_data(upload)
+        (tmp_path / '5.data').write_bytes(b'x' * 50)
+        with pytest.raises(CacheError):
+            cache.get_data(upload)
+        assert 5 not in cache
+        assert cache.get_data(upload) == get_contents(5)
+
+    def test_abandoned_read_not_cached(self, tmp_path):
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path))
+        chunks = cache.iter_data(make_upload(interface, 5), chunk_size=10)
+        next(chunks)
+        chunks.close()
+        assert len(cache) == 0
+        assert not os.listdir(tmp_path)
+
+    def test_interrupted_meta(self, tmp_path, monkeypatch):
+        def fail(meta, meta_file):
+            meta_file.write('{"size"')
+            raise KeyboardInterrupt
+
+        interface = CountingInterface()
+        cache = UploadCache(str(tmp_path))
+        monkeypatch.setattr(json, 'dump', fail)
+        with pytest.raises(KeyboardInterrupt):
+            cache.get_data(make_upload(interface, 5))
+        assert sorted(os.listdir(tmp_path)) == ['5.data']
+        monkeypatch.undo()
+        reopened = UploadCache(str(tmp_path))
+        assert len(reopened) == 0
+        assert reopened.get_data(make_upload(interface, 5)) == \
+            get_contents(5)
+        assert 5 in reopened
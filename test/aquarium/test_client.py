@@ -0,0 +1,189 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aquarium.trace.client import RetryingClient, is_retryable
+from aquarium.trace.store import LocalObjectStore, ObjectNotFound
+
+
+class ClientError(Exception):
+    """
+    Stands in for the botocore ClientError, with the same response.
+    """
+
+    def __init__(self, code, status):
+        self.response = {'Error': {'Code': code},
+                         'ResponseMetadata': {'HTTPStatusCode': status}}
+        super().__init__(code)
+
+
+class FaultyStore(LocalObjectStore):
+    """
+    A local object store where the first puts raise the errors in faults.
+    """
+
+    def __init__(self, root_dir, *, faults=()):
+        super().__init__(root_dir)
+        self.faults = list(faults)
+        self.calls = list()
+
+    def put_object(self, *, Body, **args):
+        self.calls.append('put_object')
+        if self.faults:
+            if hasattr(Body, 'read'):
+                Body.read(2)  # a failed request may read part of the body
+            raise self.faults.pop(0)
+        return super().put_object(Body=Body, **args)
+
+
+class LostResponseStore(LocalObjectStore):
+    """
+    A local object store that loses the response to the first completion of
+    a multipart upload, and raises NoSuchUpload for completions of uploads
+    that were already completed.
+    """
+
+    def __init__(self, root_dir):
+        super().__init__(root_dir)
+        self.completed = set()
+
+    def complete_multipart_upload(self, *, UploadId, **args):
+        if UploadId in self.completed:
+            raise ClientError('NoSuchUpload', 404)
+        super().complete_multipart_upload(UploadId=UploadId, **args)
+        self.completed.add(UploadId)
+        raise ConnectionError('reset')
+
+
+class UnseekableBody(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+def read_object(store, key):
+    with store.get_object(Bucket='bucket', Key=key)['Body'] as body:
+        return body.read()
+
+
+@pytest.fixture
+def delays():
+    return list()
+
+
+def make_client(store, delays, **args):
+    return RetryingClient(client=store, sleep=delays.append, **args)
+
+
+class TestRetryingClient:
+
+    def test_retries_transient_errors(self, tmp_path, delays):
+        store = FaultyStore(str(tmp_path), faults=[
+            ConnectionError('reset'), ClientError('SlowDown', 503)])
+        client = make_client(store, delays, base_delay=1.0)
+        body = io.BytesIO(b'xxcontents')
+        body.seek(2)
+        client.put_object(Body=body, Bucket='bucket', Key='a')
+        assert read_object(store, 'a') == b'contents'
+        assert len(delays) == 2
+        assert 0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0
+        stats = client.stats
+        assert (stats.requests, stats.retries, stats.failures) == (3, 2, 0)
+        assert stats.latencies['put_object'].count == 3
+
+    def test_gives_up_after_retries(self, tmp_path, delays):
+        store = FaultyStore(str(tmp_path),
+                            faults=[TimeoutError()] * 3)
+        client = make_client(store, delays, retries=2, max_delay=0.01)
+        with pytest.raises(TimeoutError):
+            client.put_object(Body=b'contents', Bucket='bucket', Key='a')
+        assert len(store.calls) == 3
+        assert all(delay <= 0.01 for delay in delays)
+        assert client.stats.failures == 1
+
+    @pytest.mark.parametrize('error', [
+        ClientError('AccessDenied', 403), ValueError('bad key')
+    ])
+    def test_other_errors_not_retried(self, tmp_path, delays, error):
+        store = FaultyStore(str(tmp_path), faults=[error])
+        client = make_client(store, delays)
+        with pytest.raises(type(error)):
+            client.put_object(Body=b'contents', Bucket='bucket', Key='a')
+        assert store.calls == ['put_object']
+
+    def test_missing_object_not_retried(self, tmp_path, delays):
+        client = make_client(LocalObjectStore(str(tmp_path)), delays)
+        with pytest.raises(ObjectNotFound):
+            client.head_object(Bucket='bucket', Key='a')
+        assert delays == []
+
+    def test_unseekable_body_not_retried(self, tmp_path, delays):
+        store = FaultyStore(str(tmp_path), faults=[ConnectionError()])
+        client = make_client(store, delays)
+        body = UnseekableBody(b'contents')
+        with pytest.raises(ConnectionError):
+            client.put_object(Body=body, Bucket='bucket', Key='a')
+        assert delays == []
+
+    def test_completed_upload(self, tmp_path, delays):
+        store = LostResponseStore(str(tmp_path))
+        client = make_client(store, delays)
+        upload_id = client.create_multipart_upload(
+            Bucket='bucket', Key='a')['UploadId']
+        response = client.upload_part(Body=b'contents', Bucket='bucket',
+                                      Key='a', PartNumber=1,
+                                      UploadId=upload_id)
+        parts = [{'ETag': response['ETag'], 'PartNumber': 1}]
+        response = client.complete_multipart_upload(
+            Bucket='bucket', Key='a', MultipartUpload={'Parts': parts},
+            UploadId=upload_id)
+        assert response['Key'] == 'a'
+        assert read_object(store, 'a') == b'contents'
+        stats = client.stats
+        assert (stats.retries, stats.failures) == (1, 0)
+
+    def test_missing_upload_not_completed(self, tmp_path, delays):
+        store = LostResponseStore(str(tmp_path))
+        store.completed.add('upload')
+        client = make_client(store, delays)
+        with pytest.raises(ClientError):
+            client.complete_multipart_upload(
+                Bucket='bucket', Key='a', MultipartUpload={'Parts': []},
+                UploadId='upload')
+        assert delays == []
+
+    def test_client_per_thread(self, tmp_path):
+        made = list()
+
+        def factory():
+            made.append(threading.current_thread().name)
+            return LocalObjectStore(str(tmp_path))
+
+        client = RetryingClient(factory)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(executor.map(
+                lambda index: client.put_object(
+                    Body=b'x', Bucket='bucket', Key=str(index)),
+                range(30)))
+        assert client.clients == len(made) == len(set(made))
+        assert len(made) <= 3
+        assert client.stats.latencies['put_object'].count == 30
+
+    def test_requires_one_client(self, tmp_path):
+        with pytest.raises(ValueError):
+            RetryingClient()
+        with pytest.raises(ValueError):
+            RetryingClient(lambda: None,
+                           client=LocalObjectStore(str(tmp_path)))
+
+
+@pytest.mark.parametrize('error,expected', [
+    (ConnectionError(), True),
+    (ClientError('InternalError', 500), True),
+    (ClientError('TooManyRequests', 429), True),
+    (ClientError('NoSuchKey', 404), False),
+    (ObjectNotFound('a'), False),
+    (KeyError('a'), False),
+])
+def test_is_retryable(error, expected):
+    assert is_retryable(error) == expected
@@ -0,0 +1,49 @@
+import json
+from aquarium.provenance import ItemEntity
+from aquarium.trace.diff import Edge, diff
+
+
+class TestDiff:
+
+    def test_no_change(self, make_trace):
+        assert diff(make_trace(), make_trace()).is_empty()
+
+    def test_against_dump(self, make_trace):
+        old_dump = json.loads(json.dumps(make_trace().as_dict()))
+        assert diff(old_dump, make_trace()).is_empty()
+        assert diff(make_trace(), old_dump).is_empty()
+
+    def test_added_item(self, make_trace):
+        old = make_trace()
+        new = make_trace()
+        stock = new.get_item('201')
+        item = ItemEntity(item_id=299, sample=stock.sample,
+                          object_type=stock.object_type)
+        item.add_source(stock)
+        new.add_item(item)
+        changes = diff(old, new)
+        assert changes.added['items'] == ['299']
+        assert changes.added_edges == [
+            Edge('derived_from', 'items', '299', '201')]
+        assert not changes.removed['items']
+        assert not changes.changed['items']
+
+    def test_changed_and_removed(self, make_trace):
+        old = make_trace()
+        new = make_trace()
+        new.get_item('400').add_attribute({'od600': 0.3})
+        file_entity = next(file for file in new.get_files()
+                           if not file.is_external())
+        file_entity.sources = set()
+        changes = diff(old, new)
+        assert changes.changed['items'] == ['400']
+        assert changes.changed['files'] == [file_entity.upload_id]
+        assert changes.removed_edges == [
+            Edge('derived_from', 'files', file_entity.upload_id, '400')]
+
+    def test_as_dict(self, make_trace):
+        changes = diff(make_trace(wells=2), make_trace(wells=3))
+        changes_dict = changes.as_dict()
+        assert changes_dict['added']['items'] == ['402']
+        assert changes_dict['added']['files'] == ['702']
+        json.dumps(changes_dict)
@@ -0,0 +1,135 @@
+import gzip
+import io
+import json
+import lzma
+import os
+import pytest
+from aquarium.provenance import ProvenanceTrace
+from aquarium.trace import dump
+from aquarium.trace.upload import S3DumpProxy, UploadManager
+
+
+class TestDump:
+
+    def test_same_as_json(self, make_trace):
+        trace = make_trace()
+        expected = json.dumps(trace.as_dict(), indent=2)
+        assert ''.join(dump.iterencode(trace)) == expected
+
+    def test_empty_trace(self):
+        trace = ProvenanceTrace(experiment_id='empty')
+        expected = json.dumps(trace.as_dict(), indent=2)
+        assert ''.join(dump.iterencode(trace)) == expected
+
+    def test_dump_to_file(self, make_trace):
+        trace = make_trace()
+        output = io.StringIO()
+        dump.dump(trace, output)
+        assert json.loads(output.getvalue()) == trace.as_dict()
+
+    def test_upload_provenance(self, make_trace, tmp_path):
+        trace = make_trace()
+        manager = UploadManager(trace=trace)
+        manager.configure(s3=S3DumpProxy(str(tmp_path)),
+                          bucket='bucket', basepath='experiment')
+        manager.upload_provenance()
+        path = os.path.join(str(tmp_path), 'bucket', 'experiment',
+                            'provenance_dump.json')
+        with open(path) as dump_file:
+            assert dump_file.read() == json.dumps(trace.as_dict(), indent=2)
+
+    @pytest.mark.parametrize('compression,suffix,module', [
+        ('gzip', '.gz', gzip),
+        ('lzma', '.xz', lzma)
+    ])
+    def test_compressed_provenance(self, make_trace, tmp_path,
+                                   compression, suffix, module):
+        trace = make_trace()
+        manager = UploadManager(trace=trace)
+        manager.configure(s3=S3DumpProxy(str(tmp_path)),
+                          bucket='bucket', basepath='experiment',
+                          compression=compression)
+        manager.upload_provenance()
+        path = os.path.join(str(tmp_path), 'bucket', 'experiment',
+                            'provenance_dump.json' + suffix)
+        with module.open(path, 'rt') as dump_file:
+            assert dump_file.read() == json.dumps(trace.as_dict(), indent=2)
+
+    def test_content_encoding(self, make_trace):
+        trace = make_trace()
+        store = RecordingStore()
+        manager = UploadManager(trace=trace)
+        manager.configure(s3=store, bucket='bucket', basepath='experiment',
+                          compression='gzip')
+        manager.upload_provenance(sharded=True)
+        assert sorted(store.objects) == [
+            'experiment/provenance/plan_501.json.gz',
+            'experiment/provenance/shared.json.gz',
+            'experiment/provenance_manifest.json.gz'
+        ]
+        for args in store.objects.values():
+            assert args['ContentEncoding'] == 'gzip'
+            assert args['ContentType'] == 'application/json'
+            json.loads(gzip.decompress(args['Body']))
+        manifest = json.loads(gzip.decompress(
+            store.objects['experiment/provenance_manifest.json.gz']['Body']))
+        assert all(
+            "experiment/provenance/{}".format(entry['filename'])
+            in store.objects for entry in manifest['shards'])
+
+    def test_unknown_compression(self, make_trace):
+        manager = UploadManager(trace=make_trace())
+        with pytest.raises(ValueError):
+            manager.configure(compression='zip')
+
+
+class RecordingStore:
+    def __init__(self):
+        self.objects = dict()
+
+    def put_object(self, *, Body, Key, **args):
+        args['Body'] = Body.read()
+        self.objects[Key] = args
+
+
+class TestRecordCache:
+
+    def test_record_reused(self, make_trace):
+        trace = make_trace()
+        item = trace.get_item('400')
+        assert item.get_record() is item.get_record()
+        assert item.get_record() == item.as_dict()
+
+    def test_trace_dict_is_copy(self, make_trace):
+        trace = make_trace()
+        fingerprint = trace.fingerprint()
+        trace_dict = trace.as_dict()
+        trace_dict['items'][0]['item_id'] = 'changed'
+        trace_dict['items'][0].setdefault('attributes', dict())['x'] = 1
+        assert type(trace_dict['items'][0]) is dict
+        assert trace.get_item('201').get_record()['item_id'] == '201'
+        assert trace.as_dict()['items'][0]['item_id'] == '201'
+        assert 'changed' not in ''.join(dump.iterencode(trace))
+        assert trace.fingerprint() == fingerprint
+
+    def test_changes_discard_record(self, make_trace):
+        trace = make_trace()
+        item = trace.get_item('400')
+        record = item.get_record()
+        item.add_attribute({'od': '0.5'})
+        assert item.get_record() is not record
+        assert item.get_record()['attributes']['od'] == '0.5'
+
+        item.add_source(trace.get_item('202'))
+        assert item.get_record()['sources'] == ['201', '202']
+
+    def test_dump_after_rename(self, make_trace):
+        trace = make_trace()
+        ''.join(dump.iterencode(trace))
+        file_entity = next(file_entity
+                           for file_entity in trace.files.values()
+                           if file_entity.name == 'A1.fcs')
+        file_entity.name = 'renamed.fcs'
+        expected = json.dumps(trace.as_dict(), indent=2)
+        assert ''.join(dump.iterencode(trace)) == expected
+        assert 'op_102/renamed.fcs' in expected
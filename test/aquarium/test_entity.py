@@ -45,6 +45,72 @@ class TestAttributes:
         assert item1 == item2  # relies on ids being the same
 
 
+class TestSharedAttributes:
+
+    def test_parts_share_attributes(self):
+        collection = create_collection("coll1")
+        part1 = PartEntity(part_id='p1', part_ref='coll1/A1',
+                           collection=collection)
+        part2 = PartEntity(part_id='p2', part_ref='coll1/A2',
+                           collection=collection)
+        part1.add_attribute({'volume': '100:microliter', 'media': 'YPAD'})
+        part2.add_attribute({'volume': '100:microliter'})
+        part2.add_attribute({'media': 'YPAD'})
+        assert part1.attributes is part2.attributes
+        assert part1.as_dict()['attributes'] == {
+            'volume': '100:microliter', 'media': 'YPAD'}
+
+    def test_copy_on_write(self):
+        collection = create_collection("coll1")
+        part1 = PartEntity(part_id='p1', part_ref='coll1/A1',
+                           collection=collection)
+        part2 = PartEntity(part_id='p2', part_ref='coll1/A2',
+                           collection=collection)
+        part1.add_attribute({'volume': '100:microliter'})
+        part2.add_attribute({'volume': '100:microliter'})
+        part2.add_attribute({'od600': 0.5})
+        assert not part1.has_attribute('od600')
+        assert part2.get_attribute('od600') == 0.5
+        assert part1.get_attribute('volume') is part2.get_attribute('volume')
+
+    def test_distinct_types(self):
+        collection = create_collection("coll1")
+        part1 = PartEntity(part_id='p1', part_ref='coll1/A1',
+                           collection=collection)
+        part2 = PartEntity(part_id='p2', part_ref='coll1/A2',
+                           collection=collection)
+        part1.add_attribute({'flag': 1})
+        part2.add_attribute({'flag': True})
+        assert type(part1.get_attribute('flag')) is int
+        assert part2.get_attribute('flag') is True
+
+    def test_replaced_dicts_discarded(self):
+        collection = create_collection("coll1")
+        parts = [PartEntity(part_id="p{}".format(index),
+                            part_ref="coll1/A{}".format(index + 1),
+                            collection=collection)
+                 for index in range(96)]
+        for part in parts:
+            part.add_attribute({'media': 'YPAD'})
+            for key in ['od', 'volume', 'strain']:
+                part.add_attribute(
+                    {key: "{} {}".format(key, part.item_id)})
+        store = collection.part_attributes
+        assert len(store) == len(parts)
+        assert store.value_count() <= 1 + 3 * len(parts) * 2
+        assert parts[0].get_attribute('od') == 'od p0'
+        assert parts[0].get_attribute('media') is \
+            parts[1].get_attribute('media')
+
+        for part in parts:
+            part.add_attribute({'od': 'same'})
+            part.add_attribute({'volume': 'same'})
+            part.add_attribute({'strain': 'same'})
+        assert len(store) == 1
+        assert store.value_count() <= 4 + 3 * len(parts)
+        assert parts[0].attributes is parts[1].attributes
+
+
 class TestHashableEntity:
 
     def test_hashable(self):
@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+
+import pytest
+from aquarium.trace.factory import TraceFactory
+from aquarium.trace.visitor import ProvenanceVisitor
+
+
+class ModelInterface:
+    """
+    Stands in for an interface of the session, such as session.Sample, and
+    counts the models fetched.
+    """
+
+    def __init__(self, make=None):
+        self.fetched = list()
+        self.make = make or (
+            lambda id: SimpleNamespace(id=id, name="model {}".format(id)))
+
+    def find(self, id):
+        self.fetched.append(id)
+        return self.make(id)
+
+
+class RecordingVisitor(ProvenanceVisitor):
+    """
+    Records the factory it was given when applied.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.factories = list()
+
+    def add_factory(self, factory):
+        if factory is not None:
+            self.factories.append(factory)
+        super().add_factory(factory)
+
+
+def make_upload(id):
+    return SimpleNamespace(id=id, name="{}.fcs".format(id), size=10,
+                           upload_content_type='application/octet-stream',
+                           job=SimpleNamespace(id=601))
+
+
+def make_job(id):
+    return SimpleNamespace(id=id, start_time=None, end_time=None,
+                           status='done', operations=[SimpleNamespace(id=101)])
+
+
+def make_session():
+    return SimpleNamespace(Sample=ModelInterface(),
+                           OperationType=ModelInterface(),
+                           Upload=ModelInterface(make_upload),
+                           Job=ModelInterface(make_job))
+
+
+def make_plan():
+    operation = SimpleNamespace(
+        id=101,
+        operation_type=SimpleNamespace(id=1, name='Measure',
+                                       category='Flow'),
+        data_associations=list(),
+        job_associations=list(),
+        field_values=list())
+    return SimpleNamespace(id=501, name='plan', status='done',
+                           operations=[operation],
+                           data_associations=list())
+
+
+def make_factory(session):
+    factory = TraceFactory(session=session, experiment_id='experiment')
+    factory.get_plan(make_plan())
+    factory.get_sample(7)
+    factory.get_file(upload_id=701)
+    return factory
+
+
+class TestDetach:
+
+    def test_clears_maps(self):
+        factory = make_factory(make_session())
+        assert factory.plan_map and factory.op_map
+        assert not factory.is_detached()
+        factory.detach()
+        assert factory.is_detached()
+        assert not factory.plan_map and not factory.op_map
+        assert not factory.item_map and not factory.job_map
+        assert not factory.uploads
+        assert factory.trace.has_plan(501)
+        assert factory.trace.has_operation(101)
+
+    @pytest.mark.parametrize('keep_uploads', [True, False])
+    def test_releases_handles(self, keep_uploads):
+        factory = make_factory(make_session())
+        operation_type = factory.trace.get_operation(101).operation_type
+        upload = factory.get_file(upload_id=701).upload
+        assert not operation_type.handle.is_released()
+        factory.detach(keep_uploads=keep_uploads)
+        assert operation_type.handle.is_released()
+        assert operation_type.fetch() is None
+        assert upload.handle.is_released() != keep_uploads
+        if keep_uploads:
+            assert upload.fetch().name == '701.fcs'
+
+    def test_detached_factory_raises(self):
+        session = make_session()
+        factory = make_factory(session)
+        factory.detach()
+        with pytest.raises(RuntimeError):
+            factory.get_sample(8)
+        with pytest.raises(RuntimeError):
+            factory.get_sample(7)
+        assert session.Sample.fetched == [7]
+
+    @pytest.mark.parametrize('detach', [True, False])
+    def test_create_from(self, detach):
+        visitor = RecordingVisitor()
+        trace = TraceFactory.create_from(
+            session=make_session(), plans=[make_plan()],
+            experiment_id='experiment', visitor=visitor, detach=detach)
+        assert trace.has_plan(501)
+        assert len(visitor.factories) == 1
+        factory = visitor.factories[0]
+        assert factory.trace is trace
+        assert factory.is_detached() == detach
+        if detach:
+            assert visitor.factory is None
+            assert not factory.plan_map
+        else:
+            assert visitor.factory is factory
+            assert factory.plan_map
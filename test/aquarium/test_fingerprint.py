@@ -0,0 +1,79 @@
+from aquarium import provenance
+from aquarium.provenance import ItemEntity
+from aquarium.records import SampleRecord
+
+
+class TestFingerprint:
+
+    def test_rebuilt_trace_is_equal(self, make_trace):
+        trace1 = make_trace()
+        trace2 = make_trace()
+        assert trace1.fingerprint() == trace2.fingerprint()
+        assert trace1 == trace2
+
+    def test_attribute_change(self, make_trace):
+        trace1 = make_trace()
+        trace2 = make_trace()
+        before = trace2.fingerprint()
+        item = trace2.get_item('201')
+        item_before = item.fingerprint()
+        item.add_attribute({'note': 'changed'})
+        assert item.fingerprint() != item_before
+        assert trace2.fingerprint() != before
+        assert trace1 != trace2
+
+    def test_rename_file(self, make_trace):
+        trace = make_trace()
+        file_entity = next(iter(trace.get_files()))
+        before = file_entity.fingerprint()
+        file_entity.name = "prefix-{}".format(file_entity.name)
+        assert file_entity.fingerprint() != before
+
+    def test_source_change(self, make_trace):
+        trace = make_trace()
+        before = trace.fingerprint()
+        part = trace.get_item('400')
+        part.add_source(trace.get_item('202'))
+        assert trace.fingerprint() != before
+
+    def test_entity_equality(self):
+        sample = SampleRecord(id=1, name='sample')
+        item1 = ItemEntity(item_id=1, sample=sample, object_type=None)
+        item2 = ItemEntity(item_id=1, sample=sample, object_type=None)
+        assert item1 == item2
+        item2.add_attribute({'key': 'value'})
+        assert item1 != item2
+
+    def test_fingerprints_by_kind(self, make_trace):
+        trace = make_trace()
+        fingerprints = trace.fingerprints()
+        assert set(fingerprints['items']) == set(trace.items)
+        assert len(fingerprints['files']) == len(trace.files)
+
+    def test_contained_change(self, make_trace):
+        trace = make_trace()
+        plan = trace.get_plan(501)
+        job = trace.get_job(601)
+        plate = trace.get_item('202')
+        before = [plan.fingerprint(), job.fingerprint(), plate.fingerprint()]
+        content = [plan.content_fingerprint(), plate.content_fingerprint()]
+        trace.get_operation('102').add_attribute({'note': 'changed'})
+        trace.get_item('400').add_attribute({'note': 'changed'})
+        after = [plan.fingerprint(), job.fingerprint(), plate.fingerprint()]
+        assert all(old != new for old, new in zip(before, after))
+        assert content == [plan.content_fingerprint(),
+                           plate.content_fingerprint()]
+
+    def test_other_trace_cached(self, make_trace, monkeypatch):
+        trace1 = make_trace()
+        trace2 = make_trace()
+        before = trace1.fingerprint()
+        trace2.fingerprint()
+        trace2.get_item('201').add_attribute({'note': 'changed'})
+        records = list()
+        monkeypatch.setattr(provenance, 'fingerprint_record',
+                            lambda record: records.append(record) or '0')
+        assert trace1.fingerprint() == before
+        assert records == []
+        trace2.fingerprint()
+        assert len(records) == 2  # the item and the trace header
@@ -0,0 +1,58 @@
+import io
+import json
+import os
+from aquarium.trace import jsonl
+from aquarium.trace.loader import load_trace
+from aquarium.trace.upload import S3DumpProxy, UploadManager
+
+
+def export(trace):
+    return [json.loads(line) for line in jsonl.iterencode(trace)]
+
+
+class TestJsonLines:
+
+    def test_kinds(self, make_trace):
+        lines = export(make_trace())
+        assert lines[0]['kind'] == 'trace'
+        assert lines[0]['experiment_id'] == 'experiment1'
+        assert lines[0]['attributes'] == {'lab': 'test lab'}
+        kinds = {line['kind'] for line in lines[1:]}
+        assert kinds == {'operation', 'plan', 'job', 'item', 'collection',
+                         'part', 'file', 'edge'}
+
+    def test_edges(self, make_trace):
+        lines = export(make_trace())
+        edges = [(line['relation'], line['from_id'], line['to_id'])
+                 for line in lines
+                 if line['kind'] == 'edge' and line['from_id'] == '400']
+        assert edges == [('generated_by', '400', '101'),
+                         ('derived_from', '400', '201'),
+                         ('part_of', '400', '202')]
+        part = next(line for line in lines
+                    if line['kind'] == 'part' and line['item_id'] == '400')
+        assert 'generated_by' not in part
+        assert 'sources' not in part
+
+    def test_one_object_per_line(self, make_trace):
+        output = io.StringIO()
+        jsonl.dump(make_trace(), output)
+        for line in output.getvalue().splitlines():
+            assert isinstance(json.loads(line), dict)
+
+    def test_round_trip(self, make_trace):
+        trace = make_trace()
+        dump = jsonl.read_dump(jsonl.iterencode(trace))
+        assert load_trace(dump).fingerprint() == trace.fingerprint()
+
+    def test_upload(self, make_trace, tmp_path):
+        trace = make_trace()
+        manager = UploadManager(trace=trace)
+        manager.configure(s3=S3DumpProxy(str(tmp_path)),
+                          bucket='bucket', basepath='experiment',
+                          layout='jsonl')
+        manager.upload_provenance()
+        path = os.path.join(str(tmp_path), 'bucket', 'experiment',
+                            'provenance_dump.jsonl')
+        with open(path) as export_file:
+            assert export_file.read() == ''.join(jsonl.iterencode(trace))
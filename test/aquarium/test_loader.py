@@ -0,0 +1,48 @@
+import io
+import json
+from aquarium.trace import loader
+from aquarium.trace.loader import load_trace
+
+
+class TestLoader:
+
+    def test_load_json_dump(self, make_trace):
+        trace = make_trace()
+        loaded = load_trace(json.loads(json.dumps(trace.as_dict())))
+        assert loaded == trace
+        assert loaded.as_dict() == trace.as_dict()
+
+    def test_load_file(self, make_trace):
+        trace = make_trace()
+        dump_file = io.StringIO(json.dumps(trace.as_dict(), indent=2))
+        assert loader.load(dump_file).fingerprint() == trace.fingerprint()
+
+    def test_lazy_attributes(self, make_trace):
+        trace = make_trace()
+        loaded = loader.loads(json.dumps(trace.as_dict()),
+                              lazy_attributes=True)
+        plate = loaded.get_item('202')
+        part = loaded.get_item('400')
+        assert 'attributes' not in vars(part)
+        assert len(plate.part_attributes) == 0
+        assert part.get_attribute('media') == 'YPAD'
+        assert len(plate.part_attributes) == 1
+        assert loaded == trace
+
+        part.add_attribute({'od': '0.5'})
+        other = loaded.get_item('401')
+        other.add_attribute({'od': '0.5'})
+        assert part.attributes is other.attributes
+
+    def test_deferred_attributes_added(self, make_trace):
+        trace = make_trace()
+        loaded = loader.loads(json.dumps(trace.as_dict()),
+                              lazy_attributes=True)
+        stock = loaded.get_item('201')
+        stock.add_attribute({'note': 'added'})
+        assert stock.attributes == {'concentration': '1:uM',
+                                    'note': 'added'}
+        operation = loaded.get_operation('101')
+        operation.defer_attributes({'volume': '5:uL'})
+        assert operation.attributes == {'temperature': '30:C',
+                                        'volume': '5:uL'}
@@ -0,0 +1,58 @@
+import json
+import os
+from aquarium.trace import normalize
+from aquarium.trace.diff import diff
+from aquarium.trace.loader import load_trace
+from aquarium.trace.upload import S3DumpProxy, UploadManager
+
+
+class TestNormalize:
+
+    def test_tables(self, make_trace):
+        normalized = normalize.normalize(make_trace().as_dict())
+        assert normalized['layout'] == 'normalized'
+        assert normalized['samples'] == [
+            {'sample_id': '11', 'sample_name': 'strain 11'},
+            {'sample_id': '12', 'sample_name': 'media'}
+        ]
+        assert [entry['object_type_id']
+                for entry in normalized['object_types']] == ['1', '2']
+        assert [entry['operation_type_id']
+                for entry in normalized['operation_types']] == ['21', '22']
+
+    def test_references(self, make_trace):
+        normalized = normalize.normalize(make_trace().as_dict())
+        part = next(record for record in normalized['items']
+                    if record['item_id'] == '401')
+        assert part['sample_id'] == '12'
+        assert 'sample' not in part
+        operation = normalized['operations'][0]
+        assert operation['operation_type_id'] == '21'
+
+    def test_expand(self, make_trace):
+        trace = make_trace()
+        normalized = normalize.normalize(trace.as_dict())
+        assert normalize.expand(normalized) == trace.as_dict()
+
+    def test_expand_legacy(self, make_trace):
+        legacy = make_trace().as_dict()
+        assert normalize.expand(legacy) is legacy
+
+    def test_upload_and_load(self, make_trace, tmp_path):
+        trace = make_trace()
+        manager = UploadManager(trace=trace)
+        manager.configure(s3=S3DumpProxy(str(tmp_path)),
+                          bucket='bucket', basepath='experiment',
+                          layout='normalized')
+        manager.upload_provenance()
+        manager.upload_provenance()  # encodings are cached by the first
+        path = os.path.join(str(tmp_path), 'bucket', 'experiment',
+                            'provenance_dump.json')
+        with open(path) as dump_file:
+            text = dump_file.read()
+        expected = normalize.normalize(trace.as_dict())
+        assert text == json.dumps(expected, separators=(',', ':'))
+
+        loaded = load_trace(json.loads(text))
+        assert loaded.fingerprint() == trace.fingerprint()
+        assert diff(trace, json.loads(text)).is_empty()
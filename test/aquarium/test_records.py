@@ -0,0 +1,70 @@
+import pytest
+from aquarium.provenance import FileEntity
+from aquarium.records import (
+    ModelHandle, SampleRecord, UploadRecord, sample_record
+)
+
+
+class DummyUpload:
+    def __init__(self, id):
+        self.id = id
+        self.name = "upload_{}.fcs".format(id)
+        self.size = 3
+        self.upload_content_type = 'application/octet-stream'
+        self.data = b'abc'
+
+
+class DummyInterface:
+    def __init__(self):
+        self.find_count = 0
+
+    def find(self, id):
+        self.find_count += 1
+        return DummyUpload(id)
+
+
+class TestRecords:
+
+    def test_equality_ignores_handle(self):
+        interface = DummyInterface()
+        record1 = SampleRecord(id=1, name='sample')
+        record2 = SampleRecord(
+            id=1, name='sample',
+            handle=ModelHandle(interface=interface, id=1))
+        assert record1 == record2
+        assert hash(record1) == hash(record2)
+
+    def test_immutable(self):
+        record = SampleRecord(id=1, name='sample')
+        with pytest.raises(AttributeError):
+            record.name = 'other'
+
+    def test_record_of_record(self):
+        record = SampleRecord(id=1, name='sample')
+        assert sample_record(record) is record
+        assert sample_record(None) is None
+
+    def test_lazy_upload_data(self):
+        interface = DummyInterface()
+        record = UploadRecord(
+            id=5, name='upload_5.fcs', size=3,
+            upload_content_type='application/octet-stream',
+            handle=ModelHandle(interface=interface, id=5))
+        file_entity = FileEntity(upload=record, job=None)
+        assert interface.find_count == 0
+        assert file_entity.upload.data == b'abc'
+        assert interface.find_count == 1
+
+    def test_missing_handle(self):
+        record = UploadRecord(id=5, name='upload_5.fcs', size=3,
+                              upload_content_type='text/csv')
+        with pytest.raises(LookupError):
+            record.data
+
+    def test_iter_data_without_url(self, caplog):
+        record = UploadRecord(
+            id=5, name='upload_5.fcs', size=3,
+            upload_content_type='application/octet-stream',
+            handle=ModelHandle(interface=DummyInterface(), id=5))
+        assert list(record.iter_data(chunk_size=2)) == [b'ab', b'c']
+        assert 'reading it whole' in caplog.text
@@ -0,0 +1,119 @@
+import importlib
+import sys
+import types
+
+import pytest
+from aquarium.provenance import ItemEntity
+
+
+class SBOLObject:
+    """
+    Stands in for the SBOL objects created in a document.
+    """
+
+    def __init__(self, name):
+        self.identity = "http://example.org/{}".format(name)
+        self.usages = SBOLList()
+        self.wasGeneratedBy = None
+        self.wasDerivedFrom = list()
+        self.source = None
+        self.hash = None
+
+
+class SBOLList:
+    """
+    Stands in for a list of objects of a document, which refuses to create
+    an object with the name of another.
+    """
+
+    def __init__(self):
+        self.objects = dict()
+        self.created = list()
+
+    def create(self, name):
+        if name in self.objects:
+            raise ValueError("Duplicate object {}".format(name))
+        self.created.append(name)
+        self.objects[name] = SBOLObject(name)
+        return self.objects[name]
+
+
+class Document:
+    def __init__(self):
+        self.activities = SBOLList()
+        self.componentDefinitions = SBOLList()
+        self.attachments = SBOLList()
+
+
+@pytest.fixture
+def sbol(monkeypatch):
+    """
+    Returns the aquarium.trace.sbol module imported with a stub of the sbol
+    module of pySBOL.
+    """
+    stub = types.ModuleType('sbol')
+    stub.Activity = stub.Attachment = stub.ComponentDefinition = SBOLObject
+    stub.Document = Document
+    stub.setHomespace = lambda namespace: None
+    monkeypatch.setitem(sys.modules, 'sbol', stub)
+    monkeypatch.delitem(sys.modules, 'aquarium.trace.sbol', raising=False)
+    module = importlib.import_module('aquarium.trace.sbol')
+    monkeypatch.delitem(sys.modules, 'aquarium.trace.sbol')
+    return module
+
+
+def make_visitor(sbol):
+    return sbol.SBOLVisitor(namespace='http://example.org')
+
+
+class TestSBOLVisitor:
+
+    def test_objects_created_once(self, sbol, make_trace):
+        trace = make_trace()
+        visitor = make_visitor(sbol)
+        trace.apply_all(visitor)
+        doc = visitor.doc
+        assert len(doc.componentDefinitions.created) == len(trace.items)
+        assert len(doc.activities.created) == \
+            len(trace.operations) + len(trace.jobs)
+        assert len(doc.attachments.created) == len(trace.files)
+
+        components = doc.componentDefinitions.objects
+        activities = doc.activities.objects
+        assert components['item_202'].wasGeneratedBy is \
+            activities['operation_101']
+        usages = activities['operation_102'].usages.objects
+        assert usages['usage_202'].entity == components['item_202'].identity
+        file_entity = next(file_entity for file_entity in trace.files.values()
+                           if file_entity.name == 'A1.fcs')
+        attachment = doc.attachments.objects[
+            "file_{}".format(file_entity.id)]
+        assert attachment.source == 'A1.fcs'
+        assert attachment.wasGeneratedBy is activities['operation_102']
+        assert attachment.wasDerivedFrom == [components['item_400'].identity]
+
+    def test_lookup(self, sbol, make_trace):
+        trace = make_trace()
+        visitor = make_visitor(sbol)
+        trace.apply_all(visitor)
+        doc = visitor.doc
+        created = [list(objects.created) for objects in [
+            doc.componentDefinitions, doc.activities, doc.attachments,
+            doc.activities.objects['operation_101'].usages]]
+        trace.apply_all(visitor)
+        assert created == [objects.created for objects in [
+            doc.componentDefinitions, doc.activities, doc.attachments,
+            doc.activities.objects['operation_101'].usages]]
+        assert visitor._get_component(trace.get_item(201)) is \
+            visitor.doc.componentDefinitions.objects['item_201']
+        assert visitor._get_activity(trace.get_job(601)) is \
+            visitor.doc.activities.objects['job_601']
+
+    def test_miss(self, sbol, make_trace):
+        trace = make_trace(wells=1)
+        visitor = make_visitor(sbol)
+        trace.apply_all(visitor)
+        item = ItemEntity(item_id=203, sample=None, object_type=None)
+        component = visitor._get_component(item)
+        assert visitor.doc.componentDefinitions.created[-1] == 'item_203'
+        assert visitor._get_component(item) is component
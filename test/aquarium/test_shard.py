@@ -0,0 +1,55 @@
+import json
+import os
+from aquarium.trace import shard
+from aquarium.trace.upload import S3DumpProxy, UploadManager
+
+
+def read_shards(trace, tmp_path):
+    manager = UploadManager(trace=trace)
+    manager.configure(s3=S3DumpProxy(str(tmp_path)),
+                      bucket='bucket', basepath='experiment')
+    manager.upload_provenance(sharded=True)
+
+    path = os.path.join(str(tmp_path), 'bucket', 'experiment')
+    with open(os.path.join(path, 'provenance_manifest.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+    shards = dict()
+    for shard_entry in manifest['shards']:
+        shard_path = os.path.join(path, 'provenance', shard_entry['filename'])
+        with open(shard_path) as shard_file:
+            shards[shard_entry['name']] = json.load(shard_file)
+    return manifest, shards
+
+
+class TestShard:
+
+    def test_manifest(self, make_trace, tmp_path):
+        manifest, shards = read_shards(make_trace(), tmp_path)
+        assert manifest['experiment_id'] == 'experiment1'
+        assert [entry['name'] for entry in manifest['shards']] == \
+            ['shared', 'plan_501']
+        assert manifest['shards'][0]['counts']['items'] == 1
+        assert manifest['shards'][1]['counts']['items'] == 5
+        assert manifest['shards'][1]['counts']['files'] == 5
+
+    def test_assignment(self, make_trace, tmp_path):
+        _, shards = read_shards(make_trace(), tmp_path)
+        assert [record['item_id'] for record in shards['shared']['items']] \
+            == ['201']
+        plan_shard = shards['plan_501']
+        assert [record['job_id'] for record in plan_shard['jobs']] == ['601']
+        assert len(plan_shard['operations']) == 2
+
+    def test_load_all(self, make_trace, tmp_path):
+        trace = make_trace()
+        manifest, shards = read_shards(trace, tmp_path)
+        loaded = shard.load_shards(manifest, list(shards.values()))
+        assert loaded.fingerprint() == trace.fingerprint()
+
+    def test_load_subset(self, make_trace, tmp_path):
+        manifest, shards = read_shards(make_trace(), tmp_path)
+        loaded = shard.load_shards(manifest, [shards['plan_501']])
+        assert '201' not in loaded.items
+        plate = loaded.get_item('202')
+        assert plate.generator.operation_id == '101'
+        assert not plate.sources
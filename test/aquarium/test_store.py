@@ -0,0 +1,114 @@
+import io
+import os
+import shutil
+import threading
+
+import pytest
+from aquarium.trace.blobs import is_not_found
+from aquarium.trace.store import UMASK, LocalObjectStore, ObjectNotFound
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalObjectStore(str(tmp_path))
+
+
+def read_object(store, key):
+    response = store.get_object(Bucket='bucket', Key=key)
+    with response['Body'] as body:
+        return body.read()
+
+
+def list_files(root):
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), root)
+        for directory, _, names in os.walk(root) for name in names)
+
+
+class TestLocalObjectStore:
+
+    @pytest.mark.parametrize('body', [
+        b'bytes', 'text', io.BytesIO(b'stream')
+    ])
+    def test_put_and_get(self, store, body):
+        store.put_object(Body=body, Bucket='bucket', Key='a/b/object')
+        expected = body
+        if isinstance(body, str):
+            expected = body.encode('utf-8')
+        elif isinstance(body, io.BytesIO):
+            expected = body.getvalue()
+        assert read_object(store, 'a/b/object') == expected
+        assert store.head_object(Bucket='bucket',
+                                 Key='a/b/object')['ContentLength'] == \
+            len(expected)
+
+    def test_put_from_file(self, store, tmp_path):
+        source = tmp_path / 'source.fcs'
+        source.write_bytes(b'header' + bytes(range(256)) * 100)
+        with open(str(source), 'rb') as source_file:
+            source_file.read(6)
+            store.put_object(Body=source_file, Bucket='bucket',
+                             Key='data/A1.fcs')
+            assert source_file.read() == b''
+        assert read_object(store, 'data/A1.fcs') == bytes(range(256)) * 100
+
+    def test_file_mode(self, store, tmp_path, monkeypatch):
+        monkeypatch.setattr(os, 'umask', None)  # not toggled by the store
+        store.put_object(Body=b'contents', Bucket='bucket', Key='a')
+        mode = os.stat(str(tmp_path / 'bucket' / 'a')).st_mode & 0o777
+        assert mode == 0o666 & ~UMASK
+
+    def test_missing_object(self, store):
+        with pytest.raises(ObjectNotFound) as error:
+            store.head_object(Bucket='bucket', Key='missing')
+        assert is_not_found(error.value)
+        with pytest.raises(ObjectNotFound):
+            store.get_object(Bucket='bucket', Key='missing')
+
+    def test_directory_not_object(self, store):
+        store.put_object(Body=b'contents', Bucket='bucket', Key='dir/object')
+        with pytest.raises(ObjectNotFound):
+            store.head_object(Bucket='bucket', Key='dir')
+        with pytest.raises(ObjectNotFound):
+            store.get_object(Bucket='bucket', Key='dir')
+
+    def test_invalid_key(self, store):
+        with pytest.raises(ValueError):
+            store.put_object(Body=b'', Bucket='bucket', Key='../outside')
+
+    def test_concurrent_writers(self, store, tmp_path):
+        payloads = [bytes([index]) * 100000 for index in range(8)]
+        threads = [
+            threading.Thread(target=store.put_object,
+                             kwargs={'Body': payload, 'Bucket': 'bucket',
+                                     'Key': 'shared/object'})
+            for payload in payloads
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert read_object(store, 'shared/object') in payloads
+        assert list_files(str(tmp_path)) == [
+            os.path.join('bucket', 'shared', 'object')]
+
+    def test_removed_directory(self, store, tmp_path):
+        store.put_object(Body=b'first', Bucket='bucket', Key='dir/object')
+        shutil.rmtree(str(tmp_path / 'bucket' / 'dir'))
+        store.put_object(Body=b'second', Bucket='bucket', Key='dir/object')
+        assert read_object(store, 'dir/object') == b'second'
+
+    def test_multipart(self, store, tmp_path):
+        upload_id = store.create_multipart_upload(
+            Bucket='bucket', Key='large', ContentType='text/csv')['UploadId']
+        parts = list()
+        for number, body in enumerate([b'one,', b'two,', b'three'], start=1):
+            response = store.upload_part(Body=body, Bucket='bucket',
+                                         Key='large', PartNumber=number,
+                                         UploadId=upload_id)
+            parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        store.complete_multipart_upload(Bucket='bucket', Key='large',
+                                        MultipartUpload={'Parts': parts},
+                                        UploadId=upload_id)
+        assert read_object(store, 'large') == b'one,two,three'
+        assert list_files(str(tmp_path)) == [os.path.join('bucket', 'large')]
@@ -0,0 +1,594 @@
+import dataclasses
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aquarium.provenance import FileEntity
+from aquarium.records import ModelHandle, UploadRecord
+from aquarium.trace.blobs import BlobIndex, get_blob_key
+from aquarium.trace.cache import UploadCache
+from aquarium.trace.client import RetryingClient
+from aquarium.trace.journal import UploadJournal
+from aquarium.trace.store import LocalObjectStore, ObjectNotFound
+from aquarium.trace import upload
+from aquarium.trace.upload import ChunkHasher, S3DumpProxy, UploadManager
+
+
+class UploadStub:
+    def __init__(self, data):
+        self.data = data
+
+
+class UploadInterface:
+    """
+    Stands in for session.Upload, with the contents of each upload derived
+    from its ID.
+    Fetching an upload with an ID in failing raises ConnectionError.
+    """
+
+    def __init__(self, *, failing=(), contents=None):
+        self.failing = set(failing)
+        self.contents = contents or get_contents
+
+    def find(self, id):
+        if id in self.failing:
+            raise ConnectionError("connection closed")
+        return UploadStub(self.contents(id))
+
+
+def get_contents(id):
+    return "contents of upload {}".format(id).encode('utf-8') * id
+
+
+class ConcurrentStore:
+    """
+    Records the objects put, the threads that put them, and the largest
+    number of puts at once.
+    """
+
+    def __init__(self, *, delay=0.0):
+        self.objects = dict()
+        self.heads = list()
+        self.threads = set()
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, *, Body, Key, **args):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.threads.add(threading.current_thread())
+        time.sleep(self.delay)
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        with self.lock:
+            args['Body'] = Body
+            self.objects[Key] = args
+            self.active -= 1
+
+    def head_object(self, *, Bucket, Key):
+        self.heads.append(Key)
+        if Key not in self.objects:
+            raise ObjectNotFound(Key)
+        return {'ContentLength': len(self.objects[Key]['Body'])}
+
+
+class MultipartStore(ConcurrentStore):
+    """
+    Records the parts of multipart uploads, and fails the upload of the part
+    with the given number.
+    """
+
+    def __init__(self, *, failing_part=None):
+        self.parts = dict()  # key -> list of parts
+        self.aborted = list()
+        self.failing_part = failing_part
+        super().__init__()
+
+    def create_multipart_upload(self, *, Bucket, ContentType, Key):
+        self.parts[Key] = list()
+        return {'UploadId': Key}
+
+    def upload_part(self, *, Body, Bucket, Key, PartNumber, UploadId):
+        if PartNumber == self.failing_part:
+            raise ConnectionError("connection closed")
+        self.parts[Key].append(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, *, Bucket, Key, MultipartUpload,
+                                  UploadId):
+        assert [part['PartNumber'] for part in MultipartUpload['Parts']] == \
+            list(range(1, len(self.parts[Key]) + 1))
+        self.objects[Key] = {'Body': b''.join(self.parts[Key])}
+
+    def abort_multipart_upload(self, *, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+
+def attach_uploads(trace, interface):
+    for file_entity in trace.files.values():
+        if file_entity.is_external():
+            continue
+        file_entity.upload = dataclasses.replace(
+            file_entity.upload,
+            handle=ModelHandle(interface=interface, id=file_entity.upload.id))
+
+
+def add_file(trace, *, generator, upload_id, content_type='text/csv'):
+    upload = UploadRecord(id=upload_id, name="{}.dat".format(upload_id),
+                          size=10, upload_content_type=content_type)
+    file_entity = FileEntity(upload=upload, job=None)
+    file_entity.add_generator(generator)
+    trace.add_file(file_entity)
+    return file_entity
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    """
+    Allows chunks smaller than S3 accepts, so that multipart uploads can be
+    tested with small files.
+    """
+    monkeypatch.setattr(upload, 'MIN_PART_SIZE', 1)
+
+
+def make_manager(trace, store, **args):
+    manager = UploadManager(trace=trace)
+    manager.configure(s3=store, bucket='bucket', basepath='experiment',
+                      **args)
+    return manager
+
+
+class TestUploadActivities:
+
+    def test_files_and_manifest(self, make_trace):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        manager = make_manager(trace, store)
+        manager.upload(activity=trace.get_operation('102'))
+
+        assert sorted(store.objects) == [
+            'experiment/op_102/A1.fcs', 'experiment/op_102/A2.fcs',
+            'experiment/op_102/A3.fcs', 'experiment/op_102/A4.fcs',
+            'experiment/op_102/upload_manifest.json'
+        ]
+        manifest = json.loads(
+            store.objects['experiment/op_102/upload_manifest.json']['Body'])
+        assert [entry['name'] for entry in manifest] == [
+            'A1.fcs', 'A2.fcs', 'A3.fcs', 'A4.fcs']
+        for entry in manifest:
+            body = store.objects['experiment/op_102/' + entry['name']]['Body']
+            assert entry['sha256'] == hashlib.sha256(body).hexdigest()
+
+    def test_upload_limit(self, make_trace):
+        trace = make_trace(wells=12)
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore(delay=0.01)
+        manager = make_manager(trace, store, download_workers=4,
+                               upload_workers=2)
+        manager.upload(activity=trace.get_operation('102'))
+        assert len(store.objects) == 13
+        assert store.max_active <= 2
+
+    def test_serial(self, make_trace):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        manager = make_manager(trace, store, download_workers=0,
+                               hash_workers=0)
+        manager.upload(activity=trace.get_operation('102'))
+        assert len(store.objects) == 5
+        assert store.threads == {threading.current_thread()}
+
+    def test_failed_activity_has_no_manifest(self, make_trace):
+        trace = make_trace()
+        op1 = trace.get_operation('101')
+        add_file(trace, generator=op1, upload_id=800)
+        attach_uploads(trace, UploadInterface(failing=[702]))
+        store = ConcurrentStore()
+        manager = make_manager(trace, store)
+        with pytest.raises(ConnectionError):
+            manager.upload_activities(
+                activities=[trace.get_operation('102'), op1])
+
+        assert 'experiment/op_101/upload_manifest.json' in store.objects
+        assert 'experiment/op_102/upload_manifest.json' not in store.objects
+        assert 'experiment/op_102/A3.fcs' not in store.objects
+
+    def test_download_error_logged(self, make_trace, caplog):
+        class ChunkedEncodingError(OSError):
+            """
+            Stands in for the error of requests for a broken download.
+            """
+
+        class BrokenInterface(UploadInterface):
+            def find(self, id):
+                raise ChunkedEncodingError("connection broken")
+
+        trace = make_trace(wells=1)
+        attach_uploads(trace, BrokenInterface())
+        manager = make_manager(trace, ConcurrentStore())
+        with pytest.raises(ChunkedEncodingError):
+            manager.upload(activity=trace.get_operation('102'))
+        assert 'closed connection: connection broken' in caplog.text
+
+    def test_invalid_workers(self, make_trace):
+        manager = UploadManager(trace=make_trace())
+        with pytest.raises(ValueError):
+            manager.configure(upload_workers=0)
+
+    def test_chunks_smaller_than_parts(self, make_trace):
+        manager = UploadManager(trace=make_trace())
+        with pytest.raises(ValueError):
+            manager.configure(chunk_size=upload.MIN_PART_SIZE - 1)
+
+
+class TestChunkedUpload:
+
+    def test_multipart_parts(self, make_trace, small_parts):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = MultipartStore()
+        manager = make_manager(trace, store, chunk_size=1000)
+        manager.upload(activity=trace.get_operation('102'))
+
+        manifest = json.loads(
+            store.objects['experiment/op_102/upload_manifest.json']['Body'])
+        for entry, upload_id in zip(manifest, range(700, 704)):
+            key = 'experiment/op_102/' + entry['name']
+            contents = get_contents(upload_id)
+            assert [len(part) for part in store.parts[key][:-1]] == \
+                [1000] * (len(contents) // 1000)
+            assert store.objects[key]['Body'] == contents
+            assert entry['sha256'] == hashlib.sha256(contents).hexdigest()
+
+    @pytest.mark.parametrize('hash_workers', [0, 2])
+    def test_hash_workers(self, make_trace, small_parts, hash_workers):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = MultipartStore()
+        manager = make_manager(trace, store, chunk_size=1000,
+                               hash_workers=hash_workers, hash_threshold=0)
+        manager.upload(activity=trace.get_operation('102'))
+        for file_entity in trace.get_files(
+                generator=trace.get_operation('102')):
+            assert file_entity.check_sum == hashlib.sha256(
+                get_contents(file_entity.upload.id)).hexdigest()
+
+    def test_chunk_hasher(self):
+        chunks = [bytes([index]) * (1000 + index) for index in range(20)]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            hasher = ChunkHasher(executor)
+            for chunk in chunks:
+                hasher.update(chunk)
+            assert hasher.hexdigest() == \
+                hashlib.sha256(b''.join(chunks)).hexdigest()
+
+    def test_small_file_single_put(self, make_trace):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = MultipartStore()
+        manager = make_manager(trace, store)
+        manager.upload(activity=trace.get_operation('102'))
+        assert store.parts == dict()
+        assert len(store.objects) == 5
+
+    def test_failed_part_aborts(self, make_trace, small_parts):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = MultipartStore(failing_part=2)
+        manager = make_manager(trace, store, chunk_size=1000)
+        with pytest.raises(ConnectionError):
+            manager.upload(activity=trace.get_operation('102'))
+        assert len(store.aborted) == 4
+        assert 'experiment/op_102/upload_manifest.json' not in store.objects
+
+    def test_proxy_multipart(self, make_trace, small_parts, tmp_path):
+        trace = make_trace()
+        file_entity = add_file(trace, generator=trace.get_operation('101'),
+                               upload_id=800,
+                               content_type='application/json')
+        attach_uploads(trace, UploadInterface())
+        manager = make_manager(trace, S3DumpProxy(str(tmp_path)),
+                               chunk_size=1000)
+        manager.upload(activity=trace.get_operation('101'))
+
+        path = tmp_path / 'bucket' / 'experiment' / 'op_101' / '800.dat'
+        assert path.read_bytes() == get_contents(800)
+        assert file_entity.check_sum == \
+            hashlib.sha256(get_contents(800)).hexdigest()
+        assert list((tmp_path / '.multipart').iterdir()) == []
+
+
+class TestContentAddressed:
+
+    def test_shared_contents_put_once(self, make_trace):
+        trace = make_trace()
+        op1 = trace.get_operation('101')
+        add_file(trace, generator=op1, upload_id=800)
+        attach_uploads(trace, UploadInterface(contents=lambda id: b'beads'))
+        store = ConcurrentStore()
+        manager = make_manager(trace, store, content_addressed=True)
+        manager.upload_activities(
+            activities=[trace.get_operation('102'), op1])
+
+        check_sum = hashlib.sha256(b'beads').hexdigest()
+        blob_key = get_blob_key(check_sum)
+        assert sorted(store.objects) == [
+            blob_key,
+            'experiment/op_101/upload_manifest.json',
+            'experiment/op_102/upload_manifest.json'
+        ]
+        assert store.objects[blob_key]['Body'] == b'beads'
+        manifest = json.loads(
+            store.objects['experiment/op_102/upload_manifest.json']['Body'])
+        assert {entry['blob'] for entry in manifest} == {blob_key}
+        assert check_sum in manager.blob_index
+
+    def test_existing_blob_not_put(self, make_trace, tmp_path):
+        trace = make_trace(wells=1)
+        attach_uploads(trace, UploadInterface())
+        check_sum = hashlib.sha256(get_contents(700)).hexdigest()
+        proxy = S3DumpProxy(str(tmp_path))
+        blob_key = get_blob_key(check_sum, blob_path='shared/blobs')
+        proxy.put_object(Body=b'existing', Bucket='bucket',
+                         ContentType='application/json', Key=blob_key)
+
+        manager = make_manager(trace, proxy, content_addressed=True,
+                               blob_path='shared/blobs')
+        manager.upload(activity=trace.get_operation('102'))
+        assert (tmp_path / 'bucket' / blob_key).read_bytes() == b'existing'
+        assert check_sum in manager.blob_index
+        manifest = json.loads(
+            (tmp_path / 'bucket' / 'experiment' / 'op_102' /
+             'upload_manifest.json').read_text())
+        assert manifest[0]['blob'] == blob_key
+
+    def test_index_skips_head(self, make_trace, tmp_path):
+        index_path = str(tmp_path / 'blobs.txt')
+        check_sum = hashlib.sha256(get_contents(700)).hexdigest()
+        BlobIndex(index_path).add(check_sum)
+
+        trace = make_trace(wells=2)
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        manager = make_manager(trace, store, content_addressed=True,
+                               blob_index=BlobIndex(index_path))
+        manager.upload(activity=trace.get_operation('102'))
+        other = hashlib.sha256(get_contents(701)).hexdigest()
+        assert store.heads == [get_blob_key(other)]
+        assert get_blob_key(check_sum) not in store.objects
+        assert len(BlobIndex(index_path)) == 2
+
+
+class SlowJournal(UploadJournal):
+    def record_file(self, **args):
+        time.sleep(0.05)
+        super().record_file(**args)
+
+
+class TestJournal:
+
+    def test_resume_after_failure(self, make_trace, tmp_path):
+        journal_path = str(tmp_path / 'journal.sqlite')
+        trace = make_trace()
+        op1 = trace.get_operation('101')
+        add_file(trace, generator=op1, upload_id=800)
+        activities = [trace.get_operation('102'), op1]
+        attach_uploads(trace, UploadInterface(failing=[702]))
+        store = ConcurrentStore()
+        with UploadJournal(journal_path) as journal:
+            manager = make_manager(trace, store, journal=journal)
+            with pytest.raises(ConnectionError):
+                manager.upload_activities(activities=activities)
+        first_run = set(store.objects)
+
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        with UploadJournal(journal_path) as journal:
+            manager = make_manager(trace, store, journal=journal)
+            manager.upload_activities(activities=activities)
+            assert journal.has_manifest(activity='experiment/op_102')
+        assert sorted(store.objects) == [
+            'experiment/op_102/A3.fcs',
+            'experiment/op_102/upload_manifest.json'
+        ]
+        assert not first_run & set(store.objects)
+
+        fresh_trace = make_trace()
+        attach_uploads(fresh_trace, UploadInterface())
+        fresh_store = ConcurrentStore()
+        make_manager(fresh_trace, fresh_store).upload(
+            activity=fresh_trace.get_operation('102'))
+        manifest_key = 'experiment/op_102/upload_manifest.json'
+        assert json.loads(store.objects[manifest_key]['Body']) == \
+            json.loads(fresh_store.objects[manifest_key]['Body'])
+        assert trace.get_files(generator=op1)[0].check_sum is not None
+
+    def test_resume_with_new_trace(self, make_trace, tmp_path):
+        journal_path = str(tmp_path / 'journal.sqlite')
+        trace = make_trace()
+        add_file(trace, generator=trace.get_operation('101'), upload_id=800)
+        attach_uploads(trace, UploadInterface(failing=[800]))
+        with UploadJournal(journal_path) as journal:
+            with pytest.raises(ConnectionError):
+                make_manager(trace, ConcurrentStore(),
+                             journal=journal).upload_all()
+            assert journal.has_manifest(activity='experiment/op_102')
+
+        trace = make_trace()
+        add_file(trace, generator=trace.get_operation('101'), upload_id=800)
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        with UploadJournal(journal_path) as journal:
+            make_manager(trace, store, journal=journal).upload_all()
+        assert 'experiment/op_102/A1.fcs' not in store.objects
+        dump = json.loads(
+            store.objects['experiment/provenance_dump.json']['Body'])
+        check_sums = {file_record['upload_id']: file_record['sha256']
+                      for file_record in dump['files']
+                      if 'upload_id' in file_record}
+        assert check_sums == {
+            str(upload_id): hashlib.sha256(
+                get_contents(upload_id)).hexdigest()
+            for upload_id in [700, 701, 702, 703, 800]}
+
+    def test_slow_journal(self, make_trace, tmp_path):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        with SlowJournal(str(tmp_path / 'journal.sqlite')) as journal:
+            manager = make_manager(trace, ConcurrentStore(), journal=journal)
+            manager.upload(activity=trace.get_operation('102'))
+            assert len(journal.get_files(activity='experiment/op_102')) == 4
+        manifest = json.loads(manager.s3.objects[
+            'experiment/op_102/upload_manifest.json']['Body'])
+        assert [entry['name'] for entry in manifest] == [
+            'A1.fcs', 'A2.fcs', 'A3.fcs', 'A4.fcs']
+
+    def test_records(self, tmp_path):
+        with UploadJournal(str(tmp_path / 'journal.sqlite')) as journal:
+            for upload_id, name in [(2, 'b.fcs'), (1, 'a.fcs')]:
+                journal.record_file(activity='op_1', upload_id=upload_id,
+                                    name=name, size=10, sha256='0' * 64,
+                                    key="op_1/{}".format(name))
+            assert [record['name']
+                    for record in journal.get_files(activity='op_1')] == \
+                ['a.fcs', 'b.fcs']
+            assert journal.get_file(activity='op_1', upload_id=3) is None
+            assert journal.get_file(activity='op_1',
+                                    upload_id=2)['key'] == 'op_1/b.fcs'
+            assert not journal.has_manifest(activity='op_1')
+
+
+class TestUploadAll:
+
+    def test_report(self, make_trace):
+        trace = make_trace()
+        op1 = trace.get_operation('101')
+        add_file(trace, generator=op1, upload_id=800)
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        report = make_manager(trace, store).upload_all()
+
+        assert [activity.path for activity in report.activities] == [
+            'experiment/op_102', 'experiment/op_101']
+        assert [activity.files for activity in report.activities] == [4, 1]
+        assert report.activities[1].bytes == len(get_contents(800))
+        assert report.bytes == sum(
+            len(get_contents(upload_id))
+            for upload_id in [700, 701, 702, 703, 800])
+        assert report.failed == []
+        assert 'experiment/provenance_dump.json' in store.objects
+        dump = json.loads(
+            store.objects['experiment/provenance_dump.json']['Body'])
+        assert all('sha256' in file_record for file_record in dump['files']
+                   if 'upload_id' in file_record)
+
+    def test_failure_skips_provenance(self, make_trace):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface(failing=[701]))
+        store = ConcurrentStore()
+        with pytest.raises(ConnectionError):
+            make_manager(trace, store).upload_all()
+        assert 'experiment/provenance_dump.json' not in store.objects
+
+    def test_resume(self, make_trace, tmp_path):
+        journal_path = str(tmp_path / 'journal.sqlite')
+        dumps = list()
+        for _ in range(2):
+            trace = make_trace()
+            attach_uploads(trace, UploadInterface())
+            store = ConcurrentStore()
+            with UploadJournal(journal_path) as journal:
+                make_manager(trace, store, journal=journal).upload_all()
+            dumps.append(json.loads(
+                store.objects['experiment/provenance_dump.json']['Body']))
+        assert 'experiment/op_102/A1.fcs' not in store.objects
+        check_sums = [{file_record['upload_id']: file_record['sha256']
+                       for file_record in dump['files']
+                       if 'upload_id' in file_record} for dump in dumps]
+        assert check_sums[0] == check_sums[1]
+        assert len(check_sums[0]) == 4 and None not in check_sums[0].values()
+
+    def test_missing_check_sum(self, make_trace, tmp_path):
+        trace = make_trace()
+        attach_uploads(trace, UploadInterface())
+        store = ConcurrentStore()
+        with UploadJournal(str(tmp_path / 'journal.sqlite')) as journal:
+            journal.record_manifest(activity='experiment/op_102',
+                                    key='experiment/op_102/manifest')
+            with pytest.raises(RuntimeError):
+                make_manager(trace, store, journal=journal).upload_all()
+        assert 'experiment/provenance_dump.json' not in store.objects
+
+
+def test_cache(make_trace, tmp_path):
+    trace = make_trace(wells=2)
+    attach_uploads(trace, UploadInterface())
+    cache = UploadCache(str(tmp_path))
+    make_manager(trace, ConcurrentStore(), cache=cache).upload_all()
+
+    attach_uploads(trace, UploadInterface(failing=[700, 701]))
+    store = ConcurrentStore()
+    make_manager(trace, store, cache=cache).upload_all()
+    assert store.objects['experiment/op_102/A2.fcs']['Body'] == \
+        get_contents(701)
+    assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+
+
+class FlakyStore(ConcurrentStore):
+    """
+    Fails the first put of each key with ConnectionError.
+    """
+
+    def __init__(self):
+        self.failed = set()
+        super().__init__()
+
+    def put_object(self, *, Body, Key, **args):
+        with self.lock:
+            first = Key not in self.failed
+            self.failed.add(Key)
+        if first:
+            raise ConnectionError("connection reset")
+        super().put_object(Body=Body, Key=Key, **args)
+
+
+def test_retrying_client(make_trace):
+    trace = make_trace(wells=2)
+    attach_uploads(trace, UploadInterface())
+    store = FlakyStore()
+    client = RetryingClient(client=store, sleep=lambda delay: None)
+    make_manager(trace, client).upload_all()
+    assert store.objects['experiment/op_102/A2.fcs']['Body'] == \
+        get_contents(701)
+    assert client.stats.retries == len(store.objects)
+
+
+def test_clients_reused(make_trace):
+    trace = make_trace(wells=12)
+    attach_uploads(trace, UploadInterface())
+    client = RetryingClient(ConcurrentStore)
+    with make_manager(trace, client, download_workers=1,
+                      upload_workers=1) as manager:
+        manager.upload_all(sharded=True, workers=1)
+        clients = client.clients
+        manager.upload_all(sharded=True, workers=1)
+    assert client.clients == clients
+
+
+def test_local_store(make_trace, tmp_path, small_parts):
+    trace = make_trace(wells=2)
+    attach_uploads(trace, UploadInterface())
+    store = LocalObjectStore(str(tmp_path))
+    make_manager(trace, store, chunk_size=1000).upload_all()
+    path = tmp_path / 'bucket' / 'experiment' / 'op_102' / 'A2.fcs'
+    assert path.read_bytes() == get_contents(701)
+    assert (tmp_path / 'bucket' / 'experiment' /
+            'provenance_dump.json').exists()